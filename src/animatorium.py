@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, generators, print_function, with_statement
 
+import itertools
 import util
 
 __all__ = ['BaseAnimationState',
@@ -21,8 +22,27 @@ class BaseAnimationState(util.basestate.BaseState):
     and return an iterator over their frames.
 
     The default iterator uses the supplied list/tuple.
+
+    Frames the state loads (see util.load_frame) should be kept with hold,
+    so that they're released with the state machine (see animatorium.release).
     '''
 
+    # the frames kept with hold
+    held_frames = ()
+
+    def hold(self, frame):
+        '''Keeps a loaded frame until release is called, returns it.'''
+        self.held_frames += (frame,)
+        return frame
+
+
+    def release(self):
+        '''Releases the frames kept with hold.'''
+        for frame in self.held_frames:
+            util.release_frame(frame)
+        self.held_frames = ()
+
+
     def __iter__(self):
         '''
         Returns an iterator over this state's frames.
@@ -32,50 +52,85 @@ class BaseAnimationState(util.basestate.BaseState):
         except AttributeError:
             return iter(())
 
-def animatorium(initial_state):
+class animatorium(object):
     """
-    An animatorium is a state machine working as a coroutine abusing generators.
+    An animatorium is a state machine giving the frames of animation states.
+    send(event) returns the next frame, switching states on events and
+    when the current state's frames run out (next() is send(None)).
     initial_state: a BaseAnimationState instance or subclass.
+
+    Where it is is just the current state and the number of its frames shown,
+    so it can be saved and put back with seek (e.g. by snapshot).
     """
 
-    if isinstance(initial_state, type):
-        if issubclass(initial_state, BaseAnimationState):
-            initial_state = initial_state()
-        else:
-            raise TypeError(format('Expected BaseAnimationState, got {0}', initial_state))
-    elif not isinstance(initial_state, BaseAnimationState):
-        raise TypeError(format('Expected BaseAnimationState, got {0}',
-                               initial_state.__class__))
-
-    def main_loop():
-        # init - get first event
-        state = initial_state
-        frames = iter(state)
-        event = yield None
-        switch = False
+    def __init__(self, initial_state):
+        if isinstance(initial_state, type):
+            if issubclass(initial_state, BaseAnimationState):
+                initial_state = initial_state()
+            else:
+                raise TypeError(format('Expected BaseAnimationState, got {0}', initial_state))
+        elif not isinstance(initial_state, BaseAnimationState):
+            raise TypeError(format('Expected BaseAnimationState, got {0}',
+                                   initial_state.__class__))
+        self.state = initial_state
+        # how many of the state's frames have been shown
+        self.index = 0
+        # the last frame returned, None before the first one
+        self.frame = None
+        # the state's frames from index on, made when the first one is needed
+        self._frames = None
+
+
+    def __iter__(self):
+        return self
 
-        while frames is not None and state is not None:
+
+    def next(self):
+        return self.send(None)
+
+
+    def send(self, event):
+        '''Returns the next frame, after switching to the state for event if there is one.'''
+        while True:
             if event is None:
+                if self._frames is None:
+                    self._frames = iter(self.state)
                 try:
-                    event = (yield next(frames))
+                    self.frame = next(self._frames)
+                    self.index += 1
+                    return self.frame
                 except StopIteration:
-                    switch = True
-            else:
-                switch = True
-
-            if switch:
-                newstate = state.next(event)
-                if newstate is not None:
-                    frames = iter(newstate)
-                    state = newstate
-                elif event is None:
-                    # reiterate current state
-                    frames = iter(state)
-                event = None
-                switch = False
-
-    # Initialise generator so it will react to send() events
-    loop = main_loop()
-    loop.next()
-    return loop
+                    pass
+
+            newstate = self.state.next(event)
+            if newstate is not None:
+                self.state = newstate
+                self.index = 0
+                self._frames = None
+            elif event is None:
+                # reiterate current state
+                self.index = 0
+                self._frames = None
+            event = None
+
 
+    def held_frames(self):
+        '''Returns the frames held by all states of the state machine.'''
+        return [frame for state in self.state.states().values() for frame in state.held_frames]
+
+
+    def release(self):
+        '''Releases the frames held by all states of the state machine, once it won't be used.'''
+        for state in self.state.states().values():
+            state.release()
+
+
+    def seek(self, state, index):
+        '''Makes state the current one, as if index of its frames had been shown.'''
+        frames = iter(state)
+        self.frame = None
+        for self.frame in itertools.islice(frames, index):
+            pass
+        self.state = state
+        self.index = index
+        self._frames = frames
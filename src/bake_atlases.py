@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+'''
+Bakes the frames in the data directory into atlases, see util.bakedatlas.
+The game loads them from there instead of from each image and the frame metadata.
+Run it again after changing any of them, until then the game goes back to the files.
+
+Usage: bake_atlases.py [atlas size]
+'''
+
+import os
+import sys
+import components
+import util
+from util import bakedatlas
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    datadir = util.find_datadir()
+    path = os.path.join(datadir, bakedatlas.BAKED_NAME)
+    natlases, nframes = bakedatlas.bake(datadir, path, size)
+    print('{0}: {1} frames in {2} atlases, {3:.1f} MB'.format(
+        path, nframes, natlases, os.path.getsize(path) / 2**20))
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+'''
+Steps many independent headless worlds in lockstep over several processes,
+e.g. for bot matches. Each worker process keeps some of the worlds;
+after each step the workers write what the worlds look like into
+shared memory, so nothing but the inputs is pickled.
+'''
+
+import ctypes
+import multiprocessing
+import traceback
+import numpy
+import pygame.event
+from multiprocessing.sharedctypes import RawArray
+import components
+
+
+__all__ = ['BatchRunner',
+           'FIELDS',
+           'observe']
+
+
+# What is written about each entity after each step, in this order
+FIELDS = ('x', 'y', 'vx', 'vy', 'hitpoints', 'awake')
+
+
+def observe(world, out):
+    '''
+    Writes FIELDS for each of the world's entities, in the order of
+    world.entities, into out - an array of shape (capacity, len(FIELDS)).
+    Entities past the capacity are left out.
+    Returns the number of entities written.
+    '''
+    world.activate()
+    entity = components.entity
+    ids = numpy.array([thing.arrayid for thing in world.entities[:len(out)]], dtype=int)
+    n = len(ids)
+    out[:n, 0:2] = entity.location[ids]
+    out[:n, 2:4] = entity.motion_v[ids]
+    out[:n, 4] = entity.hitpoints[ids]
+    out[:n, 5] = ids < entity._nawake
+    return n
+
+
+def _worker(conn, make_world, indices, observations, counts, shape):
+    observations = numpy.frombuffer(observations).reshape(shape)
+    counts = numpy.frombuffer(counts, dtype=numpy.int32)
+    try:
+        worlds = [(n, make_world(n)) for n in indices]
+        for n, world in worlds:
+            counts[n] = observe(world, observations[n])
+        conn.send(None)
+        while True:
+            inputs = conn.recv()
+            if inputs is None:
+                break
+            deaths = {}
+            for n, world in worlds:
+                events = [pygame.event.Event(type, key=key) for type, key in inputs.get(n, ())]
+                dead = world.step(events)
+                if dead:
+                    deaths[n] = [thing.name for thing in dead]
+                counts[n] = observe(world, observations[n])
+            conn.send(deaths)
+        for n, world in worlds:
+            world.close()
+    except Exception:
+        conn.send(RuntimeError(traceback.format_exc()))
+
+
+class BatchRunner(object):
+    '''
+    Runs nworlds worlds made by make_world(index) in a number of processes.
+    All of them are stepped together with step().
+    observations[world, entity, field] is what the worlds look like after the last step
+    (see FIELDS and observe) and counts[world] how many entities each has.
+    '''
+
+    def __init__(self, make_world, nworlds, processes=None, capacity=64):
+        '''
+        make_world - function making a world.World given its index.
+        On Windows it must be picklable, i.e. a module level function.
+        nworlds - how many worlds to run
+        processes - how many processes to use, the number of CPUs by default
+        capacity - most entities observed per world
+        '''
+        processes = min(processes or multiprocessing.cpu_count(), nworlds)
+        shape = (nworlds, capacity, len(FIELDS))
+        self._observations = RawArray(ctypes.c_double, nworlds * capacity * len(FIELDS))
+        self._counts = RawArray(ctypes.c_int32, nworlds)
+        self.observations = numpy.frombuffer(self._observations).reshape(shape)
+        self.counts = numpy.frombuffer(self._counts, dtype=numpy.int32)
+        self.nworlds = nworlds
+        self.ticks = 0
+
+        self._connections = []
+        self._processes = []
+        for worker in xrange(processes):
+            parent_end, child_end = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_worker, args=(child_end, make_world, range(worker, nworlds, processes),
+                                      self._observations, self._counts, shape))
+            process.daemon = True
+            process.start()
+            self._connections.append(parent_end)
+            self._processes.append(process)
+        self._gather()
+
+
+    def _gather(self):
+        results = [conn.recv() for conn in self._connections]
+        for result in results:
+            if isinstance(result, Exception):
+                self.close()
+                raise result
+        return results
+
+
+    def step(self, inputs=None):
+        '''
+        Steps all worlds once.
+        inputs - dict of world index -> list of (event type, key) for that world's keyboard
+        Returns a dict of world index -> names of the entities which died on this step.
+        '''
+        inputs = inputs or {}
+        nprocesses = len(self._connections)
+        for worker, conn in enumerate(self._connections):
+            conn.send(dict((n, keys) for n, keys in inputs.iteritems() if n % nprocesses == worker))
+        deaths = {}
+        for result in self._gather():
+            deaths.update(result)
+        self.ticks += 1
+        return deaths
+
+
+    def close(self):
+        '''Stops the worker processes.'''
+        for conn in self._connections:
+            try:
+                conn.send(None)
+            except IOError:
+                pass
+        for process in self._processes:
+            process.join()
+        self._connections = []
+        self._processes = []
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+'''
+Times packing images into atlases with util.Atlas against the column scan it
+replaced, for the images in the data directory and for a synthetic set of sprites.
+Images go into the first atlas they fit in and a new one is started when none
+has room, as util.load_sprite does. Occupancy is the area taken by images over
+the area of all the atlases used.
+
+The column scan takes minutes for thousands of images, so it's only timed
+for up to OLD_LIMIT of them.
+
+Usage: bench_atlas.py [sprites [atlas size]]
+'''
+
+import glob
+import os
+import sys
+import time
+import numpy
+import pygame.image
+import components
+import util
+from util import Atlas
+
+
+OLD_LIMIT = 2000
+
+
+class OldAtlas(object):
+    '''Atlas as it was, fitting images by scanning the height of each column.'''
+
+    def __init__(self, w, h):
+        self.allocated = numpy.zeros((w,), dtype=numpy.int16)
+        self.w = w
+        self.h = h
+        self.used = 0
+
+
+    def add(self, w, h):
+        cond = self.allocated <= self.h - h
+        for x in xrange(self.w - w + 1):
+            if numpy.all(cond[x:x + w]):
+                y = numpy.max(self.allocated[x:x + w])
+                self.allocated[x:x + w] = y + h
+                self.used += w * h
+                return (x, y)
+        return None
+
+
+def pack(cls, sizes, size, offline=False):
+    '''Packs the images, returns the time it took and the occupancy.'''
+    start = time.time()
+    atlases = []
+    if offline:
+        left = list(sizes)
+        while left:
+            atlas = cls(size, size)
+            atlases.append(atlas)
+            left = [wh for wh, place in zip(left, atlas.add_all(left)) if place is None]
+    else:
+        for w, h in sizes:
+            for atlas in atlases:
+                if atlas.add(w, h) is not None:
+                    break
+            else:
+                atlas = cls(size, size)
+                atlases.append(atlas)
+                atlas.add(w, h)
+    elapsed = time.time() - start
+    return elapsed, sum(atlas.used for atlas in atlases) / (len(atlases) * size * size), len(atlases)
+
+
+def data_sizes():
+    datadir = util.find_datadir()
+    return [pygame.image.load(filename).get_size()
+            for filename in sorted(glob.glob(os.path.join(datadir, '*.png')))]
+
+
+def synthetic_sizes(n, size):
+    random = numpy.random.RandomState(0)
+    return [tuple(wh) for wh in random.randint(4, min(size // 8, 96), (n, 2))]
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    nsprites, size = (args + [10000, 1024][len(args):])[:2]
+    for name, sizes, atlas_size in (('data', data_sizes(), 1024), ('synthetic', synthetic_sizes(nsprites, size), size)):
+        # the data images aren't all small, so they go into atlases as big as the largest of them
+        atlas_size = max([atlas_size] + [max(wh) for wh in sizes])
+        print('{0}: {1} images in {2}x{2} atlases'.format(name, len(sizes), atlas_size))
+        for packer, cls, offline in (('column scan', OldAtlas, False),
+                                     ('skyline', Atlas, False),
+                                     ('skyline, tallest first', Atlas, True)):
+            if cls is OldAtlas and len(sizes) > OLD_LIMIT:
+                print('  {0}: skipped for more than {1} images'.format(packer, OLD_LIMIT))
+                continue
+            elapsed, occupancy, natlases = pack(cls, sizes, atlas_size, offline)
+            print('  {0}: {1:.1f} ms, {2} atlases, {3:.1%} occupied'.format(packer, elapsed * 1000, natlases, occupancy))
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+'''
+Times stepping a batch of headless worlds with different numbers of worker processes.
+
+Then times many tiny worlds packed in one, see world.World.packed.
+
+Usage: bench_batch.py [worlds [ticks [boxes]]]
+'''
+
+import sys
+import time
+import multiprocessing
+import numpy
+import components
+import physics
+from batch import BatchRunner
+from world import World
+
+
+def level():
+    '''A floor between two walls.'''
+    return [components.hitbox((-50, 500), (2100, 100)),
+            components.hitbox((-100, -1000), (50, 1600)),
+            components.hitbox((2000, -1000), (50, 1600))]
+
+
+def add_boxes(world, rnd, nboxes, world_id=0):
+    '''Drops nboxes boxes at random in the level.'''
+    for n in xrange(nboxes):
+        thing = components.entity('Box', world.clock,
+                                  location=rnd.uniform((0, -1000), (1900, 400)),
+                                  motion=components.motion(rnd.uniform(-10, 10, 2)),
+                                  hitbox_passive=components.hitbox((0, 0), (40, 30)))
+        physics.add_friction(thing, 0.5, 0.1)
+        world.add(thing, world_id)
+
+
+def make_world(index, nboxes=50):
+    '''A level with nboxes boxes dropped in it, different for each index.'''
+    world = World(level())
+    add_boxes(world, numpy.random.RandomState(index), nboxes)
+    return world
+
+
+def make_packed(nworlds, nboxes=50):
+    '''nworlds worlds as make_world would make them, packed in one world.'''
+    world = World.packed([level() for n in xrange(nworlds)])
+    for index in xrange(nworlds):
+        add_boxes(world, numpy.random.RandomState(index), nboxes, index)
+    return world
+
+
+def bench(nworlds, nticks, processes, nboxes):
+    runner = BatchRunner(lambda index: make_world(index, nboxes), nworlds, processes)
+    try:
+        start = time.time()
+        for tick in xrange(nticks):
+            runner.step()
+        elapsed = time.time() - start
+    finally:
+        runner.close()
+    return nworlds * nticks / elapsed
+
+
+def bench_packed(nworlds, nticks, nboxes):
+    '''Returns world ticks/s and entity ticks/s of packed worlds.
+    Only the first few ticks are timed, while most boxes are still awake.'''
+    world = make_packed(nworlds, nboxes)
+    try:
+        start = time.time()
+        for tick in xrange(nticks):
+            world.step()
+        elapsed = time.time() - start
+    finally:
+        world.close()
+    return nworlds * nticks / elapsed, nworlds * nboxes * nticks / elapsed
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    nworlds, nticks, nboxes = (args + [16, 200, 50][len(args):])[:3]
+    print('{0} worlds of {1} boxes, {2} ticks, {3} CPUs'.format(
+        nworlds, nboxes, nticks, multiprocessing.cpu_count()))
+    processes = 1
+    while processes <= max(multiprocessing.cpu_count(), 2) * 2 and processes <= nworlds:
+        rate = bench(nworlds, nticks, processes, nboxes)
+        print('  {0:3d} workers {1:10.0f} world ticks/s'.format(processes, rate))
+        processes *= 2
+
+    print('packed worlds of 6 boxes, 20 ticks')
+    for packed in (10, 100, 1000):
+        world_rate, entity_rate = bench_packed(packed, 20, 6)
+        print('  {0:5d} worlds {1:10.0f} world ticks/s {2:10.0f} entity ticks/s'.format(
+            packed, world_rate, entity_rate))
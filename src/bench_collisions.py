@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+'''
+Times the broadphases against the NxN matrix and collision resolution
+against the one-entity-at-a-time loops it replaced, for a few numbers of entities.
+Entities are spread so that their density is about the same as a crowded level.
+
+Usage: bench_collisions.py [N ...]
+'''
+
+import sys
+import timeit
+import numpy
+import broadphase
+import collisions
+from itertools import izip
+
+
+def old_resolve_wall_collisions(motion_v, passive_tl, passive_br, walls_tl, walls_br):
+    pwcollisions = collisions.passive_walls_collisions(passive_tl, passive_br, walls_tl, walls_br)
+    diffs = numpy.zeros((len(motion_v), 4))
+    sides = numpy.zeros((len(motion_v), 4), dtype=bool)
+    for n, collisions_one in enumerate(pwcollisions):
+        collideswith_indices = numpy.nonzero(collisions_one)[0]
+        if len(collideswith_indices) == 0:
+            continue
+        diff_one = diffs[n]
+        side_one = sides[n]
+        w_tl = numpy.take(walls_tl, collideswith_indices, axis=0)
+        w_br = numpy.take(walls_br, collideswith_indices, axis=0)
+        side, diff = collisions.complete_collision(passive_tl[n], passive_br[n], w_tl, w_br)
+        for s, d in izip(side, diff):
+            if not side_one[s] or abs(d) > abs(diff_one[s]):
+                side_one[s] = True
+                diff_one[s] = d
+    return numpy.sum(diffs.reshape(-1, 2, 2), axis=2), sides
+
+
+def old_resolve_passive_passive_collisions(motion_v, passive_tl, passive_br):
+    nthings = len(motion_v)
+    diffs = numpy.zeros((nthings, 4))
+    sides = numpy.zeros((nthings, 4), dtype=bool)
+    received_v = numpy.array(motion_v)
+    done_impulse = 0.0
+    ppcollisions = collisions.passive_passive_collisions(passive_tl, passive_br)
+    dv = numpy.empty((4,))
+    for n, collisions_one in enumerate(ppcollisions):
+        collideswith_indices = numpy.nonzero(collisions_one)[0]
+        if len(collideswith_indices) == 1:
+            continue
+        diff_one = diffs[n]
+        side_one = sides[n]
+        v_one = motion_v[n]
+        other_tl = numpy.take(passive_tl, collideswith_indices, axis=0)
+        other_br = numpy.take(passive_br, collideswith_indices, axis=0)
+        side, diff = collisions.complete_collision(passive_tl[n], passive_br[n], other_tl, other_br)
+        for s, d, m in izip(side, diff, collideswith_indices):
+            if n == m:
+                continue
+            numpy.subtract(v_one, motion_v[m], out=dv[::2])
+            numpy.negative(dv[::2], out=dv[1::2])
+            if dv[s] < 0:
+                ax = s // 2
+                received_v[m, ax] = v_one[ax]
+                done_impulse += abs(v_one[ax])
+                if not side_one[s] or abs(d) > abs(diff_one[s]):
+                    side_one[s] = True
+                    diff_one[s] = d
+    motion_v[:] = received_v
+    return numpy.sum(diffs.reshape(-1, 2, 2), axis=2), sides, done_impulse
+
+
+def scene(n, seed=0):
+    '''n sheep-sized boxes and n // 5 walls on a square, about 10 sheep per 100x100.'''
+    rnd = numpy.random.RandomState(seed)
+    side = 100 * numpy.sqrt(n / 10)
+    tl = numpy.round(rnd.uniform(0, side, (n, 2)))
+    br = tl + (40, 30)
+    walls_tl = numpy.round(rnd.uniform(0, side, (max(n // 5, 1), 2)))
+    walls_br = walls_tl + numpy.round(rnd.uniform(5, 100, walls_tl.shape))
+    v = rnd.uniform(-5, 5, (n, 2))
+    return v, tl, br, walls_tl, walls_br
+
+
+def best_of(func, repeat=3):
+    number = 1
+    while True:
+        t = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+        if t * number > 0.2 or number >= 1000:
+            return t
+        number *= 10
+
+
+def nxn_pairs(tl, br):
+    return numpy.transpose(numpy.nonzero(numpy.triu(collisions.passive_passive_collisions(tl, br), 1)))
+
+
+def bench_broadphase(n):
+    v, tl, br, walls_tl, walls_br = scene(n)
+    sweep = broadphase.SweepAndPrune()
+    # jiggle the boxes a bit between calls, like a tick would
+    jiggle = numpy.random.RandomState(1).uniform(-0.5, 0.5, (16,) + tl.shape)
+    tick = [0]
+    def sweep_tick():
+        delta = jiggle[tick[0] % len(jiggle)]
+        tick[0] += 1
+        tl[:] += delta
+        br[:] += delta
+        sweep.pairs(tl, br)
+
+    print('N = {0} broadphase'.format(n))
+    t_nxn = best_of(lambda: nxn_pairs(tl, br))
+    for name, func in (('grid', lambda: broadphase.grid_pairs(tl, br)),
+                       ('sweep and prune', sweep_tick)):
+        t = best_of(func)
+        print('  {0:16s} NxN {1:10.3f} ms  new {2:8.3f} ms  x{3:.1f}'.format(
+            name, t_nxn * 1000, t * 1000, t_nxn / t))
+
+
+def bench(n):
+    v, tl, br, walls_tl, walls_br = scene(n)
+    walltree = broadphase.AABBTree(walls_tl, walls_br)
+
+    print('N = {0}, {1} walls'.format(n, len(walls_tl)))
+    timings = [
+        ('walls', lambda: old_resolve_wall_collisions(v, tl, br, walls_tl, walls_br),
+                  lambda: collisions.resolve_wall_collisions(v, tl, br, walls_tl, walls_br, walltree)),
+        ('passive-passive', lambda: old_resolve_passive_passive_collisions(numpy.array(v), tl, br),
+                            lambda: collisions.resolve_passive_passive_collisions(numpy.array(v), tl, br)),
+        ]
+    for name, old, new in timings:
+        t_old = best_of(old)
+        t_new = best_of(new)
+        print('  {0:16s} old {1:10.3f} ms  new {2:8.3f} ms  x{3:.1f}'.format(
+            name, t_old * 1000, t_new * 1000, t_old / t_new))
+
+
+if __name__ == '__main__':
+    for n in [int(arg) for arg in sys.argv[1:]] or [10, 30, 100, 1000]:
+        bench_broadphase(n)
+    for n in [int(arg) for arg in sys.argv[1:]] or [50, 500, 5000]:
+        bench(n)
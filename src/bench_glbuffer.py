@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+'''
+Times uploading a frame's sprite quads into a util.GLBuffer against the
+implementation it replaced, which asked the driver for the buffer's size on
+every write and read the whole buffer back to grow it.
+
+Each frame writes 16 floats per sprite, either one sprite at a time,
+as the renderer used to, or all at once with GLBuffer.stream.
+Needs an OpenGL context, so it opens a hidden window.
+
+Usage: bench_glbuffer.py [sprites [frames]]
+'''
+
+import sys
+import time
+import numpy
+import pyglet
+from ctypes import c_int, byref
+from pyglet import gl
+from util import GLBuffer
+
+
+class OldGLBuffer(GLBuffer):
+    '''GLBuffer as it was, without the shadow copy.'''
+
+    def __len__(self):
+        with self.bound:
+            size = c_int(0)
+            gl.glGetBufferParameteriv(gl.GL_ARRAY_BUFFER, gl.GL_BUFFER_SIZE, byref(size))
+            return size.value // self.dtype.itemsize
+
+
+    def __setitem__(self, key, value):
+        with self.bound:
+            sz = len(self)
+            start = int(key.start) if key.start is not None else 0
+            stop = int(key.stop) if key.stop is not None else start + value.size
+            if stop > sz:
+                newsz = max(sz * 2, stop)
+                a = numpy.empty((newsz,), dtype=self.dtype)
+                if sz > 0:
+                    gl.glGetBufferSubData(gl.GL_ARRAY_BUFFER, 0, sz * self.dtype.itemsize, a.ctypes.data)
+                a[start:stop] = numpy.asarray(value).reshape(-1)
+                gl.glBufferData(gl.GL_ARRAY_BUFFER, newsz * self.dtype.itemsize, a.ctypes.data, self.usage)
+            else:
+                a = numpy.ascontiguousarray(value, self.dtype).reshape(-1)
+                gl.glBufferSubData(gl.GL_ARRAY_BUFFER, start * self.dtype.itemsize,
+                                   (stop - start) * self.dtype.itemsize, a.ctypes.data)
+
+
+def per_sprite(buf, quads):
+    for n in xrange(len(quads)):
+        buf[n * 16:] = quads[n]
+
+
+def streamed(buf, quads):
+    buf.stream(quads)
+
+
+def bench(upload, buf, quads, nframes):
+    '''Returns the mean time of a frame's upload, with a draw from the buffer after each
+    so that the driver has to keep the last frame's data until it's drawn.'''
+    times = []
+    for frame in xrange(nframes):
+        start = time.time()
+        upload(buf, quads)
+        with buf.bound:
+            gl.glVertexAttribPointer(0, 4, gl.GL_FLOAT, gl.GL_FALSE, 0, 0)
+            gl.glDrawArrays(gl.GL_POINTS, 0, len(quads) * 4)
+        gl.glFinish()
+        times.append(time.time() - start)
+    return numpy.mean(times)
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    nsprites, nframes = (args + [1000, 100][len(args):])[:2]
+    window = pyglet.window.Window(visible=False)
+    gl.glEnableVertexAttribArray(0)
+    quads = numpy.random.rand(nsprites, 4, 4).astype(numpy.float32)
+    for name, cls, upload in (('old, one sprite at a time', OldGLBuffer, per_sprite),
+                              ('new, one sprite at a time', GLBuffer, per_sprite),
+                              ('new, streamed', GLBuffer, streamed)):
+        buf = cls(dtype=numpy.float32, usage=gl.GL_STREAM_DRAW)
+        elapsed = bench(upload, buf, quads, nframes)
+        print('{0}: {1:.3f} ms a frame, {2:.1f} MB/s'.format(name, elapsed * 1000, quads.nbytes / elapsed / 1e6))
+    window.close()
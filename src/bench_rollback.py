@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+'''
+Times rolling back netplay sessions, see netplay.Session.
+
+The other peer's events arrive window ticks late and are never nothing,
+so each step goes back window ticks and simulates them again.
+The slowest of those steps has to take at most HEADROOM of a frame (constants.FRAME),
+leaving the rest of it for drawing.
+
+Usage: bench_rollback.py [boxes [window [ticks]]]
+'''
+
+import sys
+import time
+import numpy
+import pygame
+import constants
+import events
+from bench_batch import add_boxes, level
+from netplay import LoopbackTransport, Session
+from world import World
+
+# The part of a frame a rollback may take
+HEADROOM = 0.9
+
+
+def make_session(transport, player, nboxes, window):
+    world = World(level())
+    add_boxes(world, numpy.random.RandomState(0), nboxes)
+    keyboards = [events.dispatcher('Keyboard 1'), events.dispatcher('Keyboard 2')]
+    return Session(world, transport, player, keyboards, window)
+
+
+def bench(nboxes, window, nticks):
+    '''Returns the mean and worst time of a step which rolled back, and ticks simulated again per rollback.'''
+    local, remote = [make_session(transport, player, nboxes, window)
+                     for player, transport in enumerate(LoopbackTransport.pair(delay=window))]
+    press = [pygame.event.Event(pygame.KEYDOWN, key=pygame.K_d)]
+    times = []
+    try:
+        for tick in xrange(nticks):
+            remote.step(press)
+            rollbacks = local.rollbacks
+            start = time.time()
+            local.step()
+            elapsed = time.time() - start
+            if local.rollbacks > rollbacks:
+                times.append(elapsed)
+    finally:
+        local.world.close()
+        remote.world.close()
+    return numpy.mean(times), numpy.max(times), local.resimulated / max(local.rollbacks, 1)
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    nboxes, window, nticks = (args + [50, 8, 200][len(args):])[:3]
+    mean, worst, resimulated = bench(nboxes, window, nticks)
+    print('{0} boxes, rolling back {1:.1f} ticks: {2:.2f} ms mean, {3:.2f} ms worst, a frame is {4:.0f} ms'.format(
+        nboxes, resimulated, mean * 1000, worst * 1000, constants.FRAME * 1000))
+    if worst > HEADROOM * constants.FRAME:
+        print('Too slow!')
+        sys.exit(1)
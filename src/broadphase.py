@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+'''
+Broadphase collision detection.
+
+Everything in here takes boxes as arrays of global top-left and bottom-right
+corners of shape (N, 2) and produces candidate pairs as an (K, 2) array of
+indices into those arrays. A box touching another one counts as a collision,
+same as in collisions.passive_passive_collisions.
+'''
+
+import numpy
+
+
+__all__ = ['AABBTree',
+           'SweepAndPrune',
+           'connected_components',
+           'grid_pairs',
+           'median_cell_size',
+           'overlapping',
+           'separate_groups',
+           'GROUP_STRIDE']
+
+
+# Queries testing at most this many pairs test them all at once instead of walking
+# an AABBTree, which costs more numpy calls than that saves for a few boxes.
+BRUTE_FORCE_PAIRS = 2048
+
+# connected_components of graphs with at most this many edges uses a union-find
+# in Python, quicker than its numpy loop for them.
+SMALL_GRAPH_EDGES = 256
+
+# How far apart separate_groups puts the groups. Boxes of one group must
+# stay within less than that along x.
+GROUP_STRIDE = 2.0 ** 20
+
+
+def _no_pairs():
+    return numpy.empty((0, 2), dtype=numpy.intp)
+
+
+def overlapping(tl1, br1, tl2, br2):
+    '''Returns a boolean array saying if box1[k] overlaps (or touches) box2[k].
+    All arguments are arrays of shape (K, 2).'''
+    apart = tl2 > br1
+    apart |= tl1 > br2
+    apart = apart[:, 0] | apart[:, 1]
+    return numpy.logical_not(apart, out=apart)
+
+
+def separate_groups(toplefts, bottomrights, groups, stride=GROUP_STRIDE):
+    '''
+    Returns copies of the boxes, with each moved along x by stride times its group.
+    groups - (N,) array of non-negative ints, e.g. the world each box is in
+
+    Boxes in different groups then never overlap, so any broadphase run on the
+    copies only pairs boxes of the same group, and the pairs index the original boxes.
+    '''
+    shift = numpy.zeros((len(groups), 2))
+    shift[:, 0] = groups
+    shift *= stride
+    return toplefts + shift, bottomrights + shift
+
+
+def connected_components(n, pairs):
+    '''
+    Returns a tuple (count, labels) for the graph of n nodes with pairs as its edges.
+    labels is an (n,) array giving each node the number (0 to count - 1) of the
+    connected component it belongs to, numbered in order of their smallest node.
+
+    Works by hooking the label of each edge's end to the smaller of the two labels,
+    then following the labels to the smallest node of their tree, until all edges
+    have both ends labelled the same.
+    '''
+    if len(pairs) <= SMALL_GRAPH_EDGES:
+        return _small_connected_components(n, pairs)
+    labels = numpy.arange(n)
+    a = pairs[:, 0]
+    b = pairs[:, 1]
+    while True:
+        la = labels[a]
+        lb = labels[b]
+        differ = la != lb
+        if not numpy.any(differ):
+            break
+        la = la[differ]
+        lb = lb[differ]
+        low = numpy.minimum(la, lb)
+        numpy.minimum.at(labels, la, low)
+        numpy.minimum.at(labels, lb, low)
+        while True:
+            jumped = labels[labels]
+            if numpy.array_equal(jumped, labels):
+                break
+            labels = jumped
+    roots, labels = numpy.unique(labels, return_inverse=True)
+    return len(roots), labels
+
+
+def _small_connected_components(n, pairs):
+    '''connected_components with a union-find in plain Python, which is quicker for a few edges.'''
+    parent = range(n)
+    for a, b in pairs.tolist():
+        while parent[a] != a:
+            a = parent[a]
+        while parent[b] != b:
+            b = parent[b]
+        # the smaller node is the root, like the labels connected_components hooks
+        if a < b:
+            parent[b] = a
+        elif b < a:
+            parent[a] = b
+    # a node's parent is smaller, so going up the nodes its parent already points to the root
+    labels = [0] * n
+    count = 0
+    for node in xrange(n):
+        root = parent[node] = parent[parent[node]]
+        if root == node:
+            labels[node] = count
+            count += 1
+        else:
+            labels[node] = labels[root]
+    return count, numpy.array(labels, dtype=numpy.intp)
+
+
+def median_cell_size(toplefts, bottomrights):
+    '''Returns a grid cell size suitable for the given boxes -
+    the median of their larger dimension, but no less than 1.'''
+    if len(toplefts) == 0:
+        return 1.0
+    size = numpy.max(bottomrights - toplefts, axis=1)
+    return max(float(numpy.median(size)), 1.0)
+
+
+def grid_pairs(toplefts, bottomrights, cell_size=None):
+    '''
+    Returns an (K, 2) array of index pairs [i, j], i < j, of all
+    boxes which overlap. Each pair is reported once and the pairs are
+    sorted by i, then by j.
+
+    The boxes are hashed into a uniform grid with cells of cell_size
+    (by default see median_cell_size), each box goes into every cell it spans.
+    Only boxes sharing a cell are tested against each other, so the cost
+    depends on the number of actual neighbours instead of N**2.
+
+    Everything is done with whole-array operations:
+    the (box, cell) entries are sorted by cell, which leaves the boxes
+    in one cell next to each other in order of ascending index.
+    Each entry is then paired with all entries after it in its cell.
+    '''
+    n = len(toplefts)
+    if n < 2:
+        return _no_pairs()
+    if cell_size is None:
+        cell_size = median_cell_size(toplefts, bottomrights)
+
+    lo = numpy.floor(toplefts / cell_size).astype(numpy.int64)
+    hi = numpy.floor(bottomrights / cell_size).astype(numpy.int64)
+    numpy.maximum(hi, lo, out=hi)
+    span = hi - lo + 1
+    counts = span[:, 0] * span[:, 1]
+    total = int(numpy.sum(counts))
+
+    # one entry for each cell each box is in
+    owner = numpy.repeat(numpy.arange(n), counts)
+    local = numpy.arange(total) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    span_x = numpy.repeat(span[:, 0], counts)
+    cell_x = numpy.repeat(lo[:, 0], counts) + local % span_x
+    cell_y = numpy.repeat(lo[:, 1], counts) + local // span_x
+    del local, span_x
+
+    # lexsort is stable, so owners in a cell remain ascending
+    order = numpy.lexsort((cell_y, cell_x))
+    owner = owner[order]
+    cell_x = cell_x[order]
+    cell_y = cell_y[order]
+    del order
+
+    newcell = numpy.ones((total,), dtype=bool)
+    newcell[1:] = cell_x[1:] != cell_x[:-1]
+    newcell[1:] |= cell_y[1:] != cell_y[:-1]
+    cell_start = numpy.nonzero(newcell)[0]
+    cell_end = numpy.append(cell_start[1:], total)
+    end = cell_end[numpy.cumsum(newcell) - 1]
+    del newcell, cell_start, cell_end, cell_x, cell_y
+
+    # pair each entry with the ones after it in the same cell
+    npairs = end - numpy.arange(total) - 1
+    first = numpy.repeat(numpy.arange(total), npairs)
+    second = (numpy.arange(len(first)) -
+              numpy.repeat(numpy.cumsum(npairs) - npairs, npairs) +
+              first + 1)
+    a = owner[first]
+    b = owner[second]
+    del first, second
+
+    # boxes sharing several cells are reported several times
+    key = numpy.unique(a * n + b)
+    a = key // n
+    b = key % n
+
+    hit = overlapping(toplefts[a], bottomrights[a], toplefts[b], bottomrights[b])
+    pairs = numpy.empty((numpy.count_nonzero(hit), 2), dtype=numpy.intp)
+    pairs[:, 0] = a[hit]
+    pairs[:, 1] = b[hit]
+    return pairs
+
+
+def _morton_order(toplefts, bottomrights):
+    '''Returns the permutation sorting the boxes along a Z-order curve
+    through their centres.
+    Both axes are scaled alike, so that boxes far apart along one axis
+    (e.g. packed worlds, see separate_groups) don't end up next to each other.'''
+    centre = (toplefts + bottomrights) / 2
+    lo = numpy.min(centre, axis=0)
+    extent = numpy.max(numpy.max(centre, axis=0) - lo)
+    if extent == 0:
+        extent = 1
+    q = ((centre - lo) / extent * 0xFFFF).astype(numpy.uint64)
+    # spread the 16 bits of each coordinate apart, then interleave them
+    for shift, mask in ((8, 0x00FF00FF), (4, 0x0F0F0F0F), (2, 0x33333333), (1, 0x55555555)):
+        q = (q | (q << numpy.uint64(shift))) & numpy.uint64(mask)
+    code = q[:, 0] | (q[:, 1] << numpy.uint64(1))
+    return numpy.argsort(code, kind='mergesort')
+
+
+class AABBTree(object):
+    '''
+    A static bounding volume hierarchy over a set of boxes (e.g. the walls of a level).
+
+    The tree is a complete binary tree stored as a heap: node k has children
+    2k and 2k + 1, the root is node 1 and the leaves are the last P nodes,
+    P being the number of boxes rounded up to a power of two.
+    The boxes are put in the leaves along a Z-order curve, so neighbouring
+    leaves are close in space. Missing leaves are empty boxes which overlap nothing.
+
+    Querying walks the tree one level at a time for all query boxes together,
+    so it costs O(N log M) plus the number of found pairs, in log M numpy calls.
+    Small queries (see BRUTE_FORCE_PAIRS) test every pair instead.
+    '''
+
+    def __init__(self, toplefts, bottomrights):
+        '''toplefts, bottomrights - (M, 2) arrays of the boxes' corners in global coordinates'''
+        # copies, as the tree is only built once a query needs it
+        toplefts = numpy.array(toplefts, dtype=float).reshape(-1, 2)
+        bottomrights = numpy.array(bottomrights, dtype=float).reshape(-1, 2)
+        self.size = len(toplefts)
+        self.toplefts = toplefts
+        self.bottomrights = bottomrights
+        self.depth = 0
+        while (1 << self.depth) < self.size:
+            self.depth += 1
+        self.order = None
+
+
+    def _build(self):
+        leaves = 1 << self.depth
+        self.order = _morton_order(self.toplefts, self.bottomrights)
+        self.tl = numpy.empty((2 * leaves, 2))
+        self.br = numpy.empty((2 * leaves, 2))
+        self.tl.fill(numpy.inf)
+        self.br.fill(-numpy.inf)
+        self.tl[leaves:leaves + self.size] = self.toplefts[self.order]
+        self.br[leaves:leaves + self.size] = self.bottomrights[self.order]
+        level = leaves
+        while level > 1:
+            parent = level // 2
+            numpy.minimum(self.tl[level:2 * level:2], self.tl[level + 1:2 * level:2],
+                          out=self.tl[parent:level])
+            numpy.maximum(self.br[level:2 * level:2], self.br[level + 1:2 * level:2],
+                          out=self.br[parent:level])
+            level = parent
+
+
+    def __len__(self):
+        return self.size
+
+
+    def query(self, toplefts, bottomrights):
+        '''
+        Returns an (K, 2) array of pairs [i, j] for each box i
+        of the given ones, which overlaps (or touches) box j of the tree.
+        The pairs are sorted by i, then by j.
+        '''
+        if self.size == 0 or len(toplefts) == 0:
+            return _no_pairs()
+        if len(toplefts) * self.size <= BRUTE_FORCE_PAIRS:
+            return self._query_all(toplefts, bottomrights)
+        if self.order is None:
+            self._build()
+        box = numpy.arange(len(toplefts))
+        node = numpy.ones((len(toplefts),), dtype=numpy.intp)
+        for level in xrange(self.depth + 1):
+            hit = overlapping(toplefts[box], bottomrights[box], self.tl[node], self.br[node])
+            box = box[hit]
+            node = node[hit]
+            if level < self.depth:
+                box = numpy.repeat(box, 2)
+                node = numpy.repeat(node * 2, 2)
+                node[1::2] += 1
+        wall = self.order[node - (1 << self.depth)]
+        order = numpy.lexsort((wall, box))
+        pairs = numpy.empty((len(box), 2), dtype=numpy.intp)
+        pairs[:, 0] = box[order]
+        pairs[:, 1] = wall[order]
+        return pairs
+
+
+    def _query_all(self, toplefts, bottomrights):
+        apart = self.toplefts > bottomrights[:, numpy.newaxis, :]
+        apart |= toplefts[:, numpy.newaxis, :] > self.bottomrights
+        touching = ~(apart[:, :, 0] | apart[:, :, 1])
+        # nonzero goes row by row, so the pairs come sorted
+        return numpy.array(touching.nonzero()).T
+
+
+class SweepAndPrune(object):
+    '''
+    A broadphase keeping the boxes sorted by their left side between calls.
+
+    Things barely move between ticks, so the order from the last call is nearly right
+    and sorting it again is cheap (and skipped altogether if it is still sorted).
+    Boxes are then swept left to right: each one is paired with the boxes after it
+    starting before its right side and only those pairs get their vertical sides tested.
+
+    The boxes are identified by their index. When boxes are added, removed or
+    exchange places, the structure must be told through insert, remove, swap and permute
+    (components.entity does that for its observers).
+    Only the first N of the known boxes take part in a call with N boxes -
+    e.g. the awake entities. If fewer boxes are known, it starts over.
+    '''
+
+    def __init__(self):
+        self.order = numpy.empty((0,), dtype=numpy.intp)
+
+
+    def insert(self, index):
+        '''A box was inserted at index, the ones from index onwards moved one up.'''
+        self.order[self.order >= index] += 1
+        self.order = numpy.append(self.order, index)
+
+
+    def remove(self, index):
+        '''The box at index was removed, the ones after it moved one down.'''
+        self.order = self.order[self.order != index]
+        self.order[self.order > index] -= 1
+
+
+    def swap(self, index1, index2):
+        '''The boxes at the two indices exchanged places.'''
+        at1 = self.order == index1
+        at2 = self.order == index2
+        self.order[at1] = index2
+        self.order[at2] = index1
+
+
+    def permute(self, slots, sources):
+        '''The boxes at sources[k] moved to slots[k].'''
+        if len(self.order) == 0 or len(slots) == 0:
+            return
+        moved_to = numpy.arange(max(len(self.order), self.order.max() + 1, numpy.max(slots) + 1))
+        moved_to[sources] = slots
+        self.order = moved_to[self.order]
+
+
+    def reset(self):
+        '''Forgets the order, e.g. after all boxes were replaced. The next call sorts them all.'''
+        self.order = numpy.empty((0,), dtype=numpy.intp)
+
+
+    def pairs(self, toplefts, bottomrights):
+        '''Returns an (K, 2) array of index pairs [i, j], i < j, of all boxes
+        which overlap, sorted by i, then by j. Same as grid_pairs.'''
+        n = len(toplefts)
+        taking_part = self.order < n
+        if numpy.count_nonzero(taking_part) < n:
+            # e.g. after reset, or boxes it didn't know yet moved in by permute
+            self.order = numpy.argsort(toplefts[:, 0], kind='mergesort')
+            taking_part = numpy.ones((n,), dtype=bool)
+        if n < 2:
+            return _no_pairs()
+
+        order = self.order[taking_part]
+        left = toplefts[:, 0].take(order)
+        if numpy.count_nonzero(left[1:] < left[:-1]):
+            resort = numpy.argsort(left, kind='mergesort')
+            order = order.take(resort)
+            left = left.take(resort)
+            self.order[taking_part] = order
+
+        # boxes after p in order, which start before p ends
+        end = numpy.searchsorted(left, bottomrights[:, 0].take(order), side='right')
+        npairs = numpy.maximum(end - numpy.arange(n) - 1, 0)
+        first = numpy.repeat(numpy.arange(n), npairs)
+        second = (numpy.arange(len(first)) -
+                  numpy.repeat(npairs.cumsum() - npairs, npairs) +
+                  first + 1)
+        a = order.take(first)
+        b = order.take(second)
+        del first, second
+
+        top = toplefts[:, 1]
+        bottom = bottomrights[:, 1]
+        hit = top.take(b) <= bottom.take(a)
+        hit &= top.take(a) <= bottom.take(b)
+        a = a[hit]
+        b = b[hit]
+        key = numpy.minimum(a, b) * n + numpy.maximum(a, b)
+        key.sort()
+        pairs = numpy.empty((len(key), 2), dtype=numpy.intp)
+        pairs[:, 0] = key // n
+        pairs[:, 1] = key % n
+        return pairs
@@ -2,13 +2,27 @@
 from __future__ import absolute_import, division, generators, print_function, with_statement
 import numpy
 import itertools
+import collections
 import components
 import random
+import broadphase
 
 MAX_DIFF = 5.0
 
+# Resolution goes on while an island has moved more than that
+SIGNIFICANT_ADJUST = 0.125
+SIGNIFICANT_IMPULSE = 0.125
+SIGNIFICANT_WALL_ADJUST = 0.5
+MAX_ATTEMPTS = 20
 
-def passive_passive_collisions(toplefts, bottomrights):
+# The broadphase of a resolution runs on boxes grown by this much, so its pairs
+# hold until something moved half of it
+CANDIDATE_MARGIN = 8.0
+
+ResolveStats = collections.namedtuple('ResolveStats', 'islands iterations resolved')
+
+
+def passive_passive_collisions(toplefts, bottomrights, groups=None):
     '''
     Returns a NxN array where element at [i, j] says if
     thing i collides with thing j with respect to their passive hitboxes.
@@ -16,6 +30,9 @@ def passive_passive_collisions(toplefts, bottomrights):
     toplefts and bottomrights must be arrays of shape (N, 2), containing
     the global coordinates of the hitboxes' corners
 
+    groups - optional (N,) array, e.g. the world of each thing.
+    Things in different groups never collide.
+
     To see if two boxes do NOT collide, the check is if
     my left side is past the other's right side or
     my top side is past the other's bottom side
@@ -35,6 +52,8 @@ def passive_passive_collisions(toplefts, bottomrights):
     result = numpy.any(toplefts[numpy.newaxis, :, :] > bottomrights[:, numpy.newaxis, :], axis=2)
     numpy.logical_or(result, result.T, out=result)
     numpy.logical_not(result, out=result)
+    if groups is not None:
+        result &= groups[:, numpy.newaxis] == groups[numpy.newaxis, :]
     return result
 
 
@@ -69,10 +88,13 @@ def active_passive_collisions(active_tl, active_br, passive_tl, passive_br):
     return result
 
 
-def passive_walls_collisions(passive_tl, passive_br, walls_tl, walls_br):
+def passive_walls_collisions(passive_tl, passive_br, walls_tl, walls_br, groups=None, wall_groups=None):
     '''
     Returns a NxM array where element at [i, j] says if
     thing i collides with wall j with respect to its passive hitbox.
+
+    groups, wall_groups - optional (N,) and (M,) arrays, e.g. the world of each thing and wall.
+    Things only collide with walls of the same group.
     '''
     N = len(passive_tl)
     M = len(walls_tl)
@@ -88,6 +110,8 @@ def passive_walls_collisions(passive_tl, passive_br, walls_tl, walls_br):
     numpy.any(tmp, axis=2, out=tmp[...,0])
     numpy.logical_or(result, tmp[...,0], out=result)
     numpy.logical_not(result, out=result)
+    if groups is not None:
+        result &= groups.reshape(-1, 1) == wall_groups.reshape(1, -1)
     return result
 
 
@@ -134,108 +158,292 @@ def complete_collision(box1_tl, box1_br, box2_tl, box2_br):
     numpy.subtract(box2_tl, box1_br, diff[:,1::2])
 
     # And the movement is the shortest alternative
-    side = numpy.argmin(numpy.abs(diff), axis=1)
-    i = numpy.arange(len(diff))
-    # now we reuse arrays like a boss
-    diff[:,0] = diff[i, side]
-
-    return (side, diff[:,0])
+    side = numpy.abs(diff).argmin(axis=1)
+    return (side, diff.take(side + numpy.arange(0, diff.size, 4)))
 
 
-def resolve_wall_collisions(motion_v, passive_tl, passive_br, walls_tl, walls_br):
+def resolve_wall_collisions(motion_v, passive_tl, passive_br, walls_tl, walls_br, walltree=None,
+                            groups=None, wall_groups=None):
     '''Resolves all collisions between entities and walls.
-    TODO: Add inelasticity coefficients and make entities bounce around.'''
 
-    pwcollisions = passive_walls_collisions(passive_tl, passive_br, walls_tl, walls_br);
+    walltree - a broadphase.AABBTree built over the walls. If given, only the walls it
+    returns as candidates are checked, otherwise every entity is checked against every wall.
+    groups, wall_groups - optional arrays with the group (e.g. world) of each entity and wall.
+    Entities only collide with walls of their group. With groups, walltree must be
+    built over the walls moved by broadphase.separate_groups.
 
-    motion_v_to_zero = numpy.zeros(motion_v.shape, dtype=bool)
-    nthings = len(motion_v)
-    diffs = numpy.zeros((nthings, 4))
-    # True if entity has collision with wall on side X
-    sides = numpy.zeros((nthings, 4), dtype=bool)
+    TODO: Add inelasticity coefficients and make entities bounce around.'''
 
-    npabs = numpy.abs
-    nptake = numpy.take
-    from itertools import izip
-    for n, collisions_one in enumerate(pwcollisions):
-        collideswith_indices = numpy.nonzero(collisions_one)[0]
-        if len(collideswith_indices) == 0:
-            continue
-        tl = passive_tl[n]
-        br = passive_br[n]
-        v_one = motion_v[n]
-        diff_one = diffs[n]
-        side_one = sides[n]
-        w_tl = nptake(walls_tl, collideswith_indices, axis=0)
-        w_br = nptake(walls_br, collideswith_indices, axis=0)
-        side, diff = complete_collision(tl, br, w_tl, w_br)
-        for s, d in izip(side, diff):
-            if not side_one[s] or npabs(d) > npabs(diff_one[s]):
-                side_one[s] = True
-                diff_one[s] = d
-    adjust = numpy.sum(diffs.reshape(-1, 2, 2), axis=2)
+    if walltree is None:
+        pairs = numpy.transpose(numpy.nonzero(
+            passive_walls_collisions(passive_tl, passive_br, walls_tl, walls_br, groups, wall_groups)))
+    elif groups is None:
+        pairs = walltree.query(passive_tl, passive_br)
+    else:
+        pairs = walltree.query(*broadphase.separate_groups(passive_tl, passive_br, groups))
+    if len(pairs) == 0:
+        return numpy.zeros((len(motion_v), 2)), numpy.zeros((len(motion_v), 4), dtype=bool)
+
+    first = pairs[:, 0]
+    wall = pairs[:, 1]
+    side, diff = complete_collision(passive_tl.take(first, axis=0), passive_br.take(first, axis=0),
+                                    walls_tl.take(wall, axis=0), walls_br.take(wall, axis=0))
+    # sides[n, s] is True if entity n has collision with a wall on side s
+    diffs, sides = _reduce_sides(len(motion_v), first, side, diff)
+    # sides 0 and 1 are horizontal, 2 and 3 vertical
+    adjust = diffs[:, ::2] + diffs[:, 1::2]
     return adjust, sides
 
-def resolve_passive_passive_collisions(motion_v, passive_tl, passive_br):
+
+def _reduce_sides(nthings, first, side, diff):
+    '''Reduces the corrections of many collisions to one per entity and side.
+
+    first - (K,) array, the index of the moved entity for each collision
+    side, diff - as returned by complete_collision for the K collisions,
+    which must be ordered as the entity would have met them one by one.
+
+    Returns a tuple (diffs, sides) of (nthings, 4) arrays. For each entity and side
+    diffs has the largest in magnitude correction (the first one, if several are as large)
+    and sides says if there was any collision on that side at all.'''
+    diffs = numpy.zeros((nthings, 4))
+    sides = numpy.zeros((nthings, 4), dtype=bool)
+    if len(first) == 0:
+        return diffs, sides
+    slot = first * 4 + side
+    if not numpy.count_nonzero(slot[1:] <= slot[:-1]):
+        # e.g. each entity touching one wall, nothing to choose between
+        diffs.put(slot, diff)
+        sides.put(slot, True)
+        return diffs, sides
+    # stable sort by slot, then by descending magnitude
+    order = numpy.lexsort((-numpy.abs(diff), slot))
+    slot = slot.take(order)
+    leading = numpy.empty((len(slot),), dtype=bool)
+    leading[0] = True
+    numpy.not_equal(slot[1:], slot[:-1], out=leading[1:])
+    slot = slot[leading]
+    diffs.put(slot, diff.take(order[leading]))
+    sides.put(slot, True)
+    return diffs, sides
+
+
+def resolve_passive_passive_collisions(motion_v, passive_tl, passive_br, pairs=None, impulses=None):
     '''Makes colliding entities bounce off each other as though they were
     all the same mass.
 
-    Returns the number of resolutions performed
+    pairs - (K, 2) array of the colliding entities, as returned by broadphase.grid_pairs.
+    If not given it is computed.
+    impulses - if given, an (N,) array to which the impulse each entity gave away is added.
+
+    Returns a tuple (adjust, sides, done_impulse)
 
     TODO: Add elasticity parameters and not this sheepy shit.'''
 
     nthings = len(motion_v)
-    adjust = numpy.zeros((nthings, 2))
-    diffs = numpy.zeros((nthings, 4))
-    sides = numpy.zeros((nthings, 4), dtype=bool)
+    if pairs is None:
+        pairs = broadphase.grid_pairs(passive_tl, passive_br)
+
+    # every pair is handled from the side of both entities, ordered by
+    # the moved entity, then by the other one
+    first = numpy.concatenate((pairs[:, 0], pairs[:, 1]))
+    second = numpy.concatenate((pairs[:, 1], pairs[:, 0]))
+    order = numpy.lexsort((second, first))
+    first = first.take(order)
+    second = second.take(order)
+    del order
+
+    side, diff = complete_collision(passive_tl.take(first, axis=0), passive_br.take(first, axis=0),
+                                    passive_tl.take(second, axis=0), passive_br.take(second, axis=0))
+    axis = side // 2
+    # the velocity of the moved entity relative to the other, towards the other,
+    # with the velocities indexed as in motion_v.flat
+    given = first * 2 + axis
+    dv = motion_v.take(given) - motion_v.take(second * 2 + axis)
+    dv *= 1 - side % 2 * 2
+    hit = (dv < 0).nonzero()[0]
+    if len(hit) == 0:
+        # e.g. resting on each other
+        return numpy.zeros((nthings, 2)), numpy.zeros((nthings, 4), dtype=bool), 0.0
+    first = first.take(hit)
+    second = second.take(hit)
+    side = side.take(hit)
+    diff = diff.take(hit)
+    axis = axis.take(hit)
+    given = given.take(hit)
+
+    # the moved entity gives its velocity to the other one.
+    # If several give to the same one, the last of them wins - first is ascending,
+    # so that's the one an assignment with repeated indices leaves.
+    giver = numpy.empty((nthings * 2,), dtype=numpy.intp)
+    giver.fill(-1)
+    giver[second * 2 + axis] = given
+    received = (giver >= 0).nonzero()[0]
     received_v = numpy.array(motion_v)
-    done_impulse = 0.0
-    ppcollisions = passive_passive_collisions(passive_tl, passive_br)
-    dv = numpy.empty((4,))
-
-    nptake = numpy.take
-    npabs = numpy.abs
-    npsubtract = numpy.subtract
-    npnegative = numpy.negative
-    from itertools import izip
-    for n, collisions_one in enumerate(ppcollisions):
-        collideswith_indices = numpy.nonzero(collisions_one)[0]
-        if len(collideswith_indices) == 1:
-            continue
-        tl = passive_tl[n]
-        br = passive_br[n]
-        diff_one = diffs[n]
-        side_one = sides[n]
-        v_one = motion_v[n]
-        other_tl = numpy.take(passive_tl, collideswith_indices, axis=0)
-        other_br = numpy.take(passive_br, collideswith_indices, axis=0)
-        side, diff = complete_collision(tl, br, other_tl, other_br)
-        for s, d, m in izip(side, diff, collideswith_indices):
-            if n == m:
-                continue
-            v = motion_v[m]
-            npsubtract(v_one, v, out=dv[::2])
-            npnegative(dv[::2], out=dv[1::2])
-            if dv[s] < 0:
-                ax = s // 2
-                received_v[m, ax] = v_one[ax]
-                done_impulse += abs(v_one[ax])
-                if not side_one[s] or npabs(d) > npabs(diff_one[s]):
-                    side_one[s] = True
-                    diff_one[s] = d
-
-    numpy.sum(diffs.reshape(-1, 2, 2), out=adjust, axis=2)
+    received_v.put(received, motion_v.take(giver.take(received)))
+    # summed in order, so the result doesn't depend on the pairing
+    given = numpy.abs(motion_v.take(given))
+    done_impulse = float(given.cumsum()[-1]) if len(given) else 0.0
+    if impulses is not None:
+        impulses += numpy.bincount(first, given, minlength=nthings)
+
+    diffs, sides = _reduce_sides(nthings, first, side, diff)
+    adjust = diffs[:, ::2] + diffs[:, 1::2]
     motion_v[:] = received_v
     return adjust, sides, done_impulse
 
 
-def resolve_passive_active_collisions(instances, active_tl, active_br, passive_tl, passive_br):
-    '''Decreases the health of each entity whose passive hitbox
+def resolve_movement(motion_v, passive_tl, passive_br, walls_tl, walls_br, translate,
+                     walltree=None, sweep=None, groups=None, wall_groups=None, islands=None):
+    '''Moves all entities by their velocity and resolves the collisions that causes.
+
+    translate - a function taking an (N, 2) array, moving each entity by its row
+    (e.g. components.entity.translate_all)
+    walltree - optional broadphase.AABBTree of the walls
+    sweep - optional persistent broadphase with a pairs() method, e.g. broadphase.SweepAndPrune
+    groups, wall_groups - optional (N,) and (M,) int arrays, e.g. the world of each entity
+    and wall. Entities only collide with entities and walls of their own group,
+    see resolve_wall_collisions.
+    islands - optional (N,) int array, gets the island of each entity on the last iteration
+
+    Entities are first pushed out of walls, then entities pushing each other and walls
+    are resolved over several iterations.
+    Entities touching each other form islands (connected components of the collision graph).
+    Only islands which still moved significantly on the last iteration are resolved again.
+    The others sleep, until an awake island touches them and they become part of it.
+
+    Returns a tuple (grounded, stats):
+    grounded - (N,) bool array, True for entities standing on something
+    stats - ResolveStats with the number of islands on the first iteration, the number of
+    iterations and the total number of entity resolutions done.'''
+
+    nthings = len(motion_v)
+    rppc = resolve_passive_passive_collisions
+    rwc = resolve_wall_collisions
+    grounded = numpy.zeros((nthings,), dtype=bool)
+    delta = numpy.zeros((nthings, 2))
+
+    adjust, sides = rwc(motion_v, passive_tl, passive_br, walls_tl, walls_br, walltree, groups, wall_groups)
+    stop = sides[:, ::2] | sides[:, 1::2]
+    motion_v[stop] = 0
+    translate(motion_v[:])
+
+    awake = numpy.ones((nthings,), dtype=bool)
+    count_islands = 0
+    resolved = 0
+    attempts = 0
+    anchor = None
+    nawake = nthings
+    while attempts < MAX_ATTEMPTS and nawake:
+        if groups is None:
+            tl, br = passive_tl, passive_br
+        else:
+            tl, br = broadphase.separate_groups(passive_tl, passive_br, groups)
+        if anchor is None or numpy.count_nonzero(numpy.abs(passive_tl - anchor) > CANDIDATE_MARGIN / 2):
+            # Iterations move things only a little, so the pairs found for the grown boxes
+            # are all the pairs which can touch until something moved half the margin
+            anchor = numpy.array(passive_tl)
+            if sweep is None:
+                candidates = broadphase.grid_pairs(tl - CANDIDATE_MARGIN, br + CANDIDATE_MARGIN)
+            else:
+                candidates = sweep.pairs(tl - CANDIDATE_MARGIN, br + CANDIDATE_MARGIN)
+        first = candidates[:, 0]
+        second = candidates[:, 1]
+        pairs = candidates.compress(broadphase.overlapping(tl.take(first, axis=0), br.take(first, axis=0),
+                                                           tl.take(second, axis=0), br.take(second, axis=0)),
+                                    axis=0)
+        del tl, br, first, second
+        if attempts == 0:
+            count, labels = broadphase.connected_components(nthings, pairs)
+            count_islands = count
+        elif len(pairs) != len(last_pairs) or numpy.count_nonzero(pairs != last_pairs):
+            count, labels = broadphase.connected_components(nthings, pairs)
+            # wake up whole islands with anything awake in them
+            island_awake = numpy.zeros((count,), dtype=bool)
+            island_awake[labels[awake]] = True
+            awake = island_awake[labels]
+            nawake = numpy.count_nonzero(awake)
+        # else nothing touches anything new, the islands and the awake ones in them stay
+        last_pairs = pairs
+
+        if nawake == nthings:
+            # e.g. on the first iteration, views are cheaper than copies
+            index = slice(None)
+        else:
+            index = awake.nonzero()[0]
+            # pairs never cross islands, so checking one end is enough
+            pairs = pairs.compress(awake.take(pairs[:, 0]), axis=0)
+            remap = awake.cumsum() - 1
+            pairs = remap.take(pairs)
+        v = motion_v[index]
+        impulses = numpy.zeros((nawake,))
+        adjust, sides, done_impulse = rppc(v, passive_tl[index], passive_br[index], pairs, impulses)
+        standing = sides[:, 3]
+        adjust *= 0.5
+        if nawake == nthings:
+            translate(adjust)
+        else:
+            delta[index] = adjust
+            translate(delta)
+        significant = numpy.abs(adjust) > SIGNIFICANT_ADJUST
+        significant = significant[:, 0] | significant[:, 1]
+        del adjust, sides, pairs
+
+        adjust, sides = rwc(v, passive_tl[index], passive_br[index], walls_tl, walls_br, walltree,
+                            None if groups is None else groups[index], wall_groups)
+        if nawake == nthings:
+            translate(adjust)
+        else:
+            delta[index] = adjust
+            translate(delta)
+            delta[index] = 0
+        stop = sides[:, ::2] | sides[:, 1::2]
+        v[stop] = 0
+        motion_v[index] = v
+        standing |= sides[:, 3]
+        grounded[index] |= standing
+        moved = numpy.abs(adjust) > SIGNIFICANT_WALL_ADJUST
+        significant |= moved[:, 0]
+        significant |= moved[:, 1]
+
+        # islands go on if anything in them moved or the impulses in them were big enough
+        island_labels = labels[index]
+        island_impulse = numpy.bincount(island_labels, impulses, minlength=count)
+        island_awake = island_impulse > SIGNIFICANT_IMPULSE
+        island_awake[island_labels[significant]] = True
+        awake[index] = island_awake[island_labels]
+
+        resolved += nawake
+        nawake = numpy.count_nonzero(awake)
+        attempts += 1
+
+    if islands is not None and attempts:
+        islands[:] = labels
+    return grounded, ResolveStats(count_islands, attempts, resolved)
+
+
+def resolve_passive_active_collisions(hitpoints, active_tl, active_br, passive_tl, passive_br, groups=None):
+    '''Decreases hitpoints (e.g. entity.hitpoints) of each entity whose passive hitbox
     collides with another's active hitbox.
+    groups - optional array of the group (e.g. world) of each entity,
+    entities only hit others in their group.
+
+    Only entities with an active hitbox are checked against the others,
+    so it's cheap when most things aren't hitting anything.
 
     TODO: Add damage parameter.'''
 
-    apcollisions = active_passive_collisions(active_tl, active_br, passive_tl, passive_br)
+    legible = active_tl < active_br
+    attackers = (legible[:, 0] & legible[:, 1]).nonzero()[0]
+    if len(attackers) == 0:
+        return
+    attack_tl = active_tl[attackers].reshape(-1, 1, 2)
+    attack_br = active_br[attackers].reshape(-1, 1, 2)
+    apcollisions = numpy.logical_not(
+        numpy.logical_or(numpy.any(attack_tl > passive_br.reshape(1, -1, 2), axis=2),
+                         numpy.any(attack_br < passive_tl.reshape(1, -1, 2), axis=2)))
+    # Remove self collisions
+    apcollisions[numpy.arange(len(attackers)), attackers] = False
+    if groups is not None:
+        apcollisions &= groups[attackers].reshape(-1, 1) == groups.reshape(1, -1)
     damage = numpy.sum(apcollisions, axis=0)
-    for thing, damage_one in itertools.izip(instances, damage):
-        thing.hitpoints -= damage_one
+    hitpoints -= damage.astype(hitpoints.dtype)
@@ -8,12 +8,52 @@ from constants import *
 class graphics(object):
     def __init__(self, sprite, anchor=(0, 0)):
         '''
-        sprite is a pygame.surface or other blittable object.
+        sprite is a util.Sprite or None.
         anchor is a tuple, giving the location of the sprite's
         upper-left corner, relative to the object's location.
+        Once given to an entity, they are kept in its sprite_id and sprite_anchor columns.
         '''
-        self.sprite = sprite
-        self.anchor = util.arrayify(anchor)
+        self.entity = None
+        self._sprite = sprite
+        self._anchor = util.arrayify(anchor)
+
+
+    def attach(self, entity):
+        '''Moves the sprite and anchor into the entity's columns.'''
+        sprite, anchor = self.sprite, self.anchor
+        self.entity = entity
+        self.sprite, self.anchor = sprite, anchor
+
+
+    @property
+    def sprite(self):
+        if self.entity is None:
+            return self._sprite
+        sprite_id = self.entity.sprite_id
+        return None if sprite_id < 0 else util.sprite_table[sprite_id]
+
+
+    @sprite.setter
+    def sprite(self, value):
+        if self.entity is None:
+            self._sprite = value
+        else:
+            self.entity.sprite_id = -1 if value is None else value.id
+
+
+    @property
+    def anchor(self):
+        if self.entity is None:
+            return self._anchor
+        return self.entity.sprite_anchor
+
+
+    @anchor.setter
+    def anchor(self, value):
+        if self.entity is None:
+            self._anchor = util.arrayify(value)
+        else:
+            self.entity.sprite_anchor = value
 
 
 class motion(object):
@@ -79,6 +119,7 @@ class physics(object):
 
     def on_tick(self, event):
         if event.type != TICK: return self.on_tick
+        if self.entity.sleeping: return self.on_tick
         # Reset acceleration to 0 and velocity to the difference between the last two frames.
         self.last_position[:] = self.entity.location
         for priority in self.modifiers.iterkeys():
@@ -102,7 +143,6 @@ class entity(object):
 
         self.name = name or self.__class__.__name__
         self.allocate_array()
-        entity._all[self.arrayid] = self
         self.clock = clock
         self.keyboard = keyboard
         self.mouse = mouse
@@ -110,12 +150,15 @@ class entity(object):
         self.motion_v = motion.v
         self.motion_a = motion.a
         self.graphics = graphics
+        if graphics is not None:
+            graphics.attach(self)
         self.physics = physics
         self.hitbox_active = hitbox_active
         self.hitbox_passive = hitbox_passive
-        self.tags = set()
         self.hitpoints = hitpoints
         self.controller = None
+        # frames released when the entity is disposed of, see hold_frame
+        self.held_frames = []
 
 
     def set_frame(self, frame):
@@ -125,10 +168,72 @@ class entity(object):
         self.hitbox_active = frame['hba']
 
 
+    def hold_frame(self, frame):
+        '''Keeps a loaded frame (see util.load_frame) until the entity is disposed of.'''
+        self.held_frames.append(frame)
+
+
     def dispose(self):
+        '''Removes the entity from the arrays and releases its frames, including
+        those of its controller's animations. The dispose observers see the frames first.'''
+        frames = list(self.held_frames)
+        if self.controller is not None:
+            frames += self.controller.animation.held_frames()
+        for observer in entity._dispose_observers:
+            observer(self, frames)
+        if self.controller is not None:
+            self.controller.animation.release()
+        for frame in self.held_frames:
+            util.release_frame(frame)
+        self.held_frames = []
         self.release_array()
 
 
+    @property
+    def sleeping(self):
+        return self.arrayid >= entity._nawake
+
+
+    def sleep(self):
+        '''Moves this entity to the sleeping part of the arrays and stops it.
+        Sleeping entities are not moved by translate_all and not changed
+        by their physics modifiers until they are woken up.'''
+        if self.sleeping:
+            return
+        entity._swap(self.arrayid, entity._nawake - 1)
+        entity._nawake -= 1
+        # _swap doesn't count it if the entity was already in place
+        entity._sleep_epoch += 1
+        self.motion_v = 0
+
+
+    def wake(self, keep_idle=False):
+        '''Moves this entity to the awake part of the arrays.
+        keep_idle - keep counting the ticks it has been still for, so that a thing
+        which was only touched goes back to sleep as soon as it stays still.'''
+        if not keep_idle:
+            self.idle_ticks = 0
+        if not self.sleeping:
+            return
+        entity._swap(self.arrayid, entity._nawake)
+        entity._nawake += 1
+        entity._sleep_epoch += 1
+
+
+    @property
+    def tags(self):
+        '''A set-like view of this entity's tags, kept as bits in the tag_bits column.
+        To change a tag on many entities at once, use entity.set_tag.'''
+        return _tagset(self)
+
+
+    @tags.setter
+    def tags(self, value):
+        self.tag_bits = 0
+        for name in value:
+            self.tag_bits |= entity.tag_bit(name)
+
+
     @property
     def hitbox_active(self):
         point = self.active_tl - self.location
@@ -158,60 +263,371 @@ class entity(object):
 
 
     class _array_property(object):
-        def __init__(self, name):
-            self.name = name
+        '''A field of one of the entity store's blocks.
+        On the class, it gives the field of all entities, on an instance - that entity's.
+        The store is looked up on each access, so these keep working after it grows.'''
+        def __init__(self, block, index):
+            self.block = block
+            self.index = index
 
 
         def __get__(self, instance, owner):
             if instance is None:
-                return entity._data[self.name, :entity._nentities]
+                return entity._store.rows(self.block)[self.index]
             else:
-                return entity._data[self.name, instance.arrayid]
+                return entity._store[self.block][self.index, instance.arrayid]
 
 
         def __set__(self, instance, value):
-            entity._data[self.name][instance.arrayid] = value
+            entity._store[self.block][self.index, instance.arrayid] = value
+
+
+    # The fields of the blocks in the entity store.
+    # Blocks are kept together so they can be changed all at once (e.g. translate_all)
+    MOTION_FIELDS = ('motion_a', 'motion_v')
+    POSITION_FIELDS = ('location', 'active_tl', 'active_br', 'passive_tl', 'passive_br')
+
+    motion_a = _array_property('motion', 0)
+    motion_v = _array_property('motion', 1)
+    location = _array_property('position', 0)
+    active_tl = _array_property('position', 1)
+    active_br = _array_property('position', 2)
+    passive_tl = _array_property('position', 3)
+    passive_br = _array_property('position', 4)
 
+    # All entities' data, see create_store. Each entity has a row (its arrayid) in each column.
+    _store = None
+    # Extra columns, see add_column
+    _columns = {}
 
-    _space = 128
-    MOTION_A = 0
-    MOTION_V = 1
-    LOCATION = 2
-    ACTIVE_TL = 3
-    ACTIVE_BR = 4
-    PASSIVE_TL = 5
-    PASSIVE_BR = 6
+    # The arrays are split in two - awake entities come first, then sleeping ones.
+    # _nawake is where the sleeping ones start.
+    _nawake = 0
+    # Increased whenever an entity falls asleep, wakes or goes away.
+    _sleep_epoch = 0
 
-    _data = numpy.zeros((7, _space, 2), dtype=float)
-    _all = numpy.empty((_space,), dtype=object)
-    _nentities = 0
+    # tag name -> its bit in tag_bits
+    _tag_bits = {}
 
-    location = _array_property(LOCATION)
-    motion_a = _array_property(MOTION_A)
-    motion_v = _array_property(MOTION_V)
-    active_tl = _array_property(ACTIVE_TL)
-    active_br = _array_property(ACTIVE_BR)
-    passive_tl = _array_property(PASSIVE_TL)
-    passive_br = _array_property(PASSIVE_BR)
+    # Objects keeping data by arrayid (e.g. broadphase.SweepAndPrune).
+    # They must have insert(arrayid), remove(arrayid), swap(arrayid1, arrayid2) and
+    # permute(arrayids, sources) methods which are called when an entity's array is
+    # allocated, released or exchanged with another entity's, or many of them are moved
+    # at once (the ones at sources[k] to arrayids[k]).
+    _index_observers = []
+
+    # Functions called with each entity being disposed of and the frames it's about to release,
+    # e.g. to hold them for as long as the entity can be put back (see snapshot.restore).
+    _dispose_observers = []
+
+
+    @staticmethod
+    def create_store(position_dtype=float, capacity=128):
+        '''
+        Creates a new, empty entity store with the blocks and all added columns.
+        position_dtype - the type of location and hitbox corners, e.g. numpy.float32
+        Must not be called while there are entities.
+        '''
+        if entity._store is not None and entity._store.count > 0:
+            raise RuntimeError('Cannot replace the entity store while there are entities')
+        store = util.memdb.Table(capacity)
+        store.add_block('motion', entity.MOTION_FIELDS, (2,), float)
+        store.add_block('position', entity.POSITION_FIELDS, (2,), position_dtype)
+        store.add_column('instance', (), object, None)
+        for name, declared in entity._columns.iteritems():
+            store.add_column(name, declared.shape, declared.dtype, declared.default)
+        entity._store = store
+        entity._nawake = 0
+
+
+    @staticmethod
+    def current_store():
+        '''Returns the entity store and its bookkeeping, see use_store.'''
+        return (entity._store, entity._nawake, entity._sleep_epoch, entity._index_observers)
+
+
+    @staticmethod
+    def use_store(state):
+        '''Makes a store returned by current_store the one all entities use,
+        so several stores (e.g. one per world) can be kept in one process.'''
+        entity._store, entity._nawake, entity._sleep_epoch, entity._index_observers = state
+
+
+    @staticmethod
+    def add_column(name, declared):
+        '''
+        Adds a per-entity attribute kept in the entity store.
+        declared - a column instance describing it.
+        After that entity.name is the array of the attribute for all entities
+        and thing.name is the attribute of one entity.
+        '''
+        if name in entity._columns or hasattr(entity, name):
+            raise ValueError('entity already has an attribute {0}'.format(name))
+        declared.name = name
+        entity._columns[name] = declared
+        setattr(entity, name, declared)
+        if entity._store is not None:
+            entity._store.add_column(name, declared.shape, declared.dtype, declared.default)
+
+
+    @staticmethod
+    def tag_bit(name):
+        '''Returns the bit of the given tag in the tag_bits column.
+        New tags get the next free bit.'''
+        try:
+            return entity._tag_bits[name]
+        except KeyError:
+            if len(entity._tag_bits) == 64:
+                raise ValueError('Too many tags, cannot add {0}'.format(name))
+            bit = numpy.uint64(1) << numpy.uint64(len(entity._tag_bits))
+            entity._tag_bits[name] = bit
+            return bit
+
+
+    @staticmethod
+    def has_tag(name):
+        '''Returns a bool array, True for the entities with the given tag.'''
+        return (entity.tag_bits & entity.tag_bit(name)) != 0
+
+
+    @staticmethod
+    def set_tag(name, which=slice(None), value=True):
+        '''
+        Sets or clears a tag on many entities at once.
+        which - index, slice or mask into the entities' arrays
+        value - True to set, False to clear, or a bool array with a value for each entity in which
+        '''
+        bit = entity.tag_bit(name)
+        bits = entity.tag_bits
+        bits[which] = numpy.where(value, bits[which] | bit, bits[which] & ~bit)
+
+
+    @staticmethod
+    def instances():
+        '''Returns an array of all entities, ordered by arrayid.'''
+        return entity._store.rows('instance')
+
+
+    @staticmethod
+    def by_handle(handle):
+        '''Returns the entity with the given handle.
+        Raises KeyError if it has been disposed of.'''
+        return entity._store['instance'][entity._store.slot(handle)]
 
 
     def allocate_array(self):
-        if entity._nentities >= entity._space:
-            raise RuntimeError('exhausted _space for entity shit =[')
-        self.arrayid = entity._nentities
-        entity._data[:,self.arrayid] = 0
-        entity._all[self.arrayid] = self
-        entity._nentities += 1
+        '''Adds a row for this entity to the store.
+        self.handle stays the same for the entity's whole life,
+        self.arrayid is where its row is now.'''
+        self.handle = entity._store.append()
+        self.arrayid = entity._store.count - 1
+        entity._store['instance'][self.arrayid] = self
+        for observer in entity._index_observers:
+            observer.insert(self.arrayid)
+        # new entities start awake
+        entity._swap(self.arrayid, entity._nawake)
+        entity._nawake += 1
 
 
     def release_array(self):
-        entity._data[:, self.arrayid:entity._nentities - 1] = entity._data[:, self.arrayid + 1:entity._nentities]
-        entity._nentities -= 1
-        for thing in entity._all[self.arrayid:entity._nentities]:
-            thing.arrayid -= 1
-        entity._all[entity._nentities] = None
+        '''Removes this entity's row from the store in O(1) -
+        it goes to the end of its part (awake or sleeping), then to the end of the store.'''
+        if not self.sleeping:
+            entity._swap(self.arrayid, entity._nawake - 1)
+            entity._nawake -= 1
+        entity._swap(self.arrayid, entity._store.count - 1)
+        entity._store.pop()
+        entity._sleep_epoch += 1
+        for observer in entity._index_observers:
+            observer.remove(self.arrayid)
+
+
+    @staticmethod
+    def _swap(i, j):
+        '''Exchanges the places of two entities in the arrays.'''
+        if i == j:
+            return
+        entity._store.swap(i, j)
+        instance = entity._store['instance']
+        instance[i].arrayid = i
+        instance[j].arrayid = j
+        entity._sleep_epoch += 1
+        for observer in entity._index_observers:
+            observer.swap(i, j)
+
+
+    @staticmethod
+    def _permute(arrayids, sources):
+        '''Moves the entities at sources[k] to arrayids[k], like many _swaps at once.'''
+        entity._store.permute(arrayids, sources)
+        instance = entity._store['instance']
+        for arrayid in arrayids.tolist():
+            instance[arrayid].arrayid = arrayid
+        entity._sleep_epoch += 1
+        for observer in entity._index_observers:
+            observer.permute(arrayids, sources)
+
+
+    @staticmethod
+    def _unique(arrayids):
+        '''numpy.unique of a non-empty array, without its overhead for the few entities
+        which usually fall asleep or wake at once.'''
+        arrayids = numpy.sort(arrayids)
+        first = numpy.empty((len(arrayids),), dtype=bool)
+        first[0] = True
+        numpy.not_equal(arrayids[1:], arrayids[:-1], out=first[1:])
+        return arrayids[first]
+
+
+    @staticmethod
+    def _gather(arrayids, start, stop):
+        '''Moves the entities at arrayids (as many as stop - start, sorted, no repeats) to the places
+        from start to stop, exchanging them with the entities which were there.'''
+        inside = (arrayids >= start) & (arrayids < stop)
+        incoming = arrayids[~inside]
+        if len(incoming) == 0:
+            return
+        taken = numpy.zeros(stop - start, dtype=bool)
+        taken[arrayids[inside] - start] = True
+        vacated = (~taken).nonzero()[0] + start
+        entity._permute(numpy.concatenate((incoming, vacated)), numpy.concatenate((vacated, incoming)))
+
+
+    @staticmethod
+    def sleep_all(arrayids):
+        '''Puts the entities at arrayids to sleep, like sleep on each of them,
+        but moving them all to the sleeping part at once.'''
+        arrayids = numpy.asarray(arrayids, dtype=numpy.intp)
+        arrayids = arrayids[arrayids < entity._nawake]
+        if len(arrayids) == 0:
+            return
+        arrayids = entity._unique(arrayids)
+        end = entity._nawake
+        start = end - len(arrayids)
+        entity._gather(arrayids, start, end)
+        entity._nawake = start
+        entity._sleep_epoch += 1
+        entity.motion_v[start:end] = 0
+
+
+    @staticmethod
+    def wake_all(arrayids, keep_idle=False):
+        '''Wakes the entities at arrayids, like wake on each of them, but moving them
+        all to the awake part at once. The ones which were asleep end up from the old
+        _nawake to the new one.'''
+        arrayids = numpy.asarray(arrayids, dtype=numpy.intp)
+        if not keep_idle:
+            entity.idle_ticks[arrayids] = 0
+        arrayids = arrayids[arrayids >= entity._nawake]
+        if len(arrayids) == 0:
+            return
+        arrayids = entity._unique(arrayids)
+        start = entity._nawake
+        entity._gather(arrayids, start, start + len(arrayids))
+        entity._nawake += len(arrayids)
+        entity._sleep_epoch += 1
+
+
+    @staticmethod
+    def settle(moved, idle_ticks=SLEEP_TICKS, islands=None):
+        '''Puts to sleep the awake entities which haven't moved for idle_ticks ticks.
+        moved - (_nawake,) bool array, True for entities that moved on this tick
+        islands - optional (_nawake,) int array of the island (see collisions.resolve_movement)
+        of each entity. The still ones in an island where nothing moved go to sleep
+        together with anything in it which does.'''
+        idle = entity.idle_ticks[:entity._nawake]
+        idle += 1
+        idle[moved] = 0
+        sleepy = idle >= idle_ticks
+        if islands is not None and numpy.count_nonzero(sleepy):
+            # Else e.g. a box which just landed on a sleeping stack would wake the stack up
+            # by touching it on every tick until it goes to sleep itself
+            count = islands.max() + 1
+            island_sleepy = numpy.zeros((count,), dtype=bool)
+            island_sleepy[islands[sleepy]] = True
+            island_sleepy[islands[moved]] = False
+            sleepy |= island_sleepy[islands]
+            # so that they go back to sleep at once when touched with keep_idle, like the others
+            numpy.maximum(idle, idle_ticks, out=idle, where=sleepy)
+        entity.sleep_all(sleepy.nonzero()[0])
 
 
     @staticmethod
     def translate_all(delta):
-        entity._data[entity.LOCATION:,:entity._nentities] += delta
+        '''Moves all awake entities. delta must be broadcastable to (_nawake, 2).'''
+        entity._store['position'][:, :entity._nawake] += delta
+
+
+class column(object):
+    '''
+    Describes a per-entity attribute kept in the entity store (see entity.add_column).
+    On the entity class, it gives the column for all entities, on an instance - that entity's value.
+    '''
+
+    def __init__(self, shape=(), dtype=float, default=0):
+        '''shape - of one entity's value, () for scalars
+        dtype - numpy type of the values
+        default - the value of new entities'''
+        self.name = None
+        self.shape = tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+        self.default = default
+
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return entity._store.rows(self.name)
+        else:
+            return entity._store[self.name][instance.arrayid]
+
+
+    def __set__(self, instance, value):
+        entity._store[self.name][instance.arrayid] = value
+
+
+entity.add_column('hitpoints', column((), numpy.int32, 100))
+entity.add_column('mass', column((), float, 1.0))
+entity.add_column('elasticity', column((), float, 0.0))
+# tags as bits, see entity.tag_bit
+entity.add_column('tag_bits', column((), numpy.uint64, 0))
+# bitmask of the collision layers an entity is in
+entity.add_column('layers', column((), numpy.uint32, 0xFFFFFFFF))
+# how many ticks an entity has been still for
+entity.add_column('idle_ticks', column((), int, 0))
+# the entity's util.Sprite's id, -1 for none, and where it goes relative to the location
+entity.add_column('sprite_id', column((), numpy.int32, -1))
+entity.add_column('sprite_anchor', column((2,), float, 0.0))
+entity.create_store()
+
+
+class _tagset(object):
+    '''The tags of an entity, behaving like a set of names.'''
+    def __init__(self, thing):
+        self.thing = thing
+
+
+    def __contains__(self, name):
+        return bool(self.thing.tag_bits & entity.tag_bit(name))
+
+
+    def __iter__(self):
+        bits = self.thing.tag_bits
+        return iter([name for name, bit in entity._tag_bits.iteritems() if bits & bit])
+
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+
+    def add(self, name):
+        self.thing.tag_bits |= entity.tag_bit(name)
+
+
+    def discard(self, name):
+        self.thing.tag_bits &= ~entity.tag_bit(name)
+
+
+    def remove(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self.discard(name)
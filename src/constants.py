@@ -2,6 +2,14 @@ FRAME = 0.02
 # g = 980 cm/s**2;
 G = 4000.0 * (FRAME**2)
 
+# Entities which have been still for that many ticks go to sleep
+SLEEP_TICKS = 25
+# Still means moving less than that in a tick
+SLEEP_DISTANCE = 0.05
+
+# Tag of entities standing on something
+GROUNDED = 'grounded'
+
 # You can add event ids here
 # The minimum number available is 33 and the maximum is 255
 TICK = 33
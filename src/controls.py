@@ -18,7 +18,13 @@ class BaseActionState(util.basestate.BaseState):
 
     If the subclass defines a __reset__(self) method, it
     will be called before returning the next state from the next() method.
+
+    Attributes which change while the state runs must be listed in __saved__,
+    so that snapshots keep them. At most SAVED_MAX of them, all ints or bools.
     '''
+    __saved__ = ()
+    SAVED_MAX = 4
+
     def __init__(self, name):
         '''
         Initialise an action state.
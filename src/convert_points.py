@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import glob
+import os.path
+import sys
+import cPickle as pickle
+import numpy
+import components
+from util import framemeta
+
+
+def print_help():
+    print('Usage: {0} datadir [datadir ...]'.format(sys.argv[0]))
+    print('Convert the pickled .points files of frames to one {0} file'.format(framemeta.META_NAME))
+
+
+def convert(dirs):
+    for d in dirs:
+        path = os.path.join(d, framemeta.META_NAME)
+        records = framemeta.read(path) if os.path.exists(path) else numpy.zeros(0, dtype=framemeta.RECORD_DTYPE)
+        converted = []
+        for f in sorted(glob.glob(os.path.join(d, '*.points'))):
+            name = os.path.splitext(os.path.basename(f))[0]
+            try:
+                with open(f, 'rb') as data:
+                    points = pickle.load(data)
+                converted.append(framemeta.record(name, points['sp'], points['hbp'], points['hba']))
+            except Exception, e:
+                print('Error trying to convert {file}: {exception}'.format(file=f, exception=e))
+        names = set(r['name'] for r in converted)
+        records = [r for r in records if r['name'] not in names] + converted
+        framemeta.write(path, records)
+        print('{0} frames -> {1}'.format(len(converted), path))
+
+
+if __name__ == '__main__':
+    dirs = sys.argv[1:]
+    if len(dirs) == 0:
+        print_help()
+    else:
+        convert(dirs)
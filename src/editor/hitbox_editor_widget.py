@@ -6,11 +6,8 @@ import numpy
 from PyQt4 import QtCore, QtGui
 from PyQt4.QtCore import pyqtSlot, QPoint, QRect, Qt
 from PyQt4.QtGui import QPainter, QPen, QBrush
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle
 from components import hitbox
+from util import framemeta
 
 class HitboxEditorWidget(QtGui.QWidget):
     def __init__(self, parent=None):
@@ -30,15 +27,13 @@ class HitboxEditorWidget(QtGui.QWidget):
 
     @pyqtSlot()
     def save(self):
-        points = {'sp': numpy.array((self.sp.x(), self.sp.y())),
-                  'hba': hitbox((self.hba.x(), self.hba.y()),
-                                (self.hba.width(), self.hba.height())),
-                  'hbp': hitbox((self.hbp.x(), self.hbp.y()),
-                                (self.hbp.width(), self.hbp.height()))}
-
-        with file(self.points_file, 'wb') as data:
-            pickle.dump(points, data, 2)
-            self.dirty = False
+        dirname, name = os.path.split(os.path.splitext(self.image_file)[0])
+        framemeta.save_frame(dirname, name, numpy.array((self.sp.x(), self.sp.y())),
+                             hitbox((self.hbp.x(), self.hbp.y()),
+                                    (self.hbp.width(), self.hbp.height())),
+                             hitbox((self.hba.x(), self.hba.y()),
+                                    (self.hba.width(), self.hba.height())))
+        self.dirty = False
 
     @pyqtSlot(str)
     def load(self, imagefile):
@@ -49,15 +44,16 @@ class HitboxEditorWidget(QtGui.QWidget):
         else:
             self.image = None
 
-        self.points_file = os.path.splitext(imagefile)[0] + '.points'
-        if os.path.exists(self.points_file):
-            with file(self.points_file, 'rb') as data:
-                points = pickle.load(data)
-                self.sp = QPoint(points['sp'][0], points['sp'][1])
-                self.hba = QRect(points['hba'].point[0], points['hba'].point[1],
-                                 points['hba'].size[0], points['hba'].size[1])
-                self.hbp = QRect(points['hbp'].point[0], points['hbp'].point[1],
-                                 points['hbp'].size[0], points['hbp'].size[1])
+        dirname, name = os.path.split(os.path.splitext(imagefile)[0])
+        self.points_file = os.path.join(dirname, framemeta.META_NAME)
+        frames = framemeta.frames(dirname) if os.path.exists(self.points_file) else {}
+        if name in frames:
+            points = framemeta.points(frames[name])
+            self.sp = QPoint(points['sp'][0], points['sp'][1])
+            self.hba = QRect(points['hba'].point[0], points['hba'].point[1],
+                             points['hba'].size[0], points['hba'].size[1])
+            self.hbp = QRect(points['hbp'].point[0], points['hbp'].point[1],
+                             points['hbp'].size[0], points['hbp'].size[1])
         else:
             self.sp = QPoint(0, 0)
             self.hba = QRect(0, 0, 20, 20)
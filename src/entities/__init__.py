@@ -27,8 +27,8 @@ def viking(datadir, clock, keyboard, key_left, key_right, key_jump, key_punch):
                                graphics=components.graphics(None, None))
 
     physics.regular_physics(player)
-    player.physics.add(physics.apply_friction(2.0, 1.0), components.physics.GROUP_VELOCITY)
-    player.physics.add(physics.speed_limiter((10, 10000)), components.physics.GROUP_VELOCITY)
+    physics.add_friction(player, 2.0, 1.0)
+    physics.add_speed_limit(player, (10, 10000))
 
     player.controller = controls.Controller(player, viking_parts.IdleRight, viking_parts.IdleRightAnimation,
                                             {(key_left, KEYUP): 'left_release',
@@ -42,41 +42,49 @@ def viking(datadir, clock, keyboard, key_left, key_right, key_jump, key_punch):
     return player
 
 
-def drake(datadir, clock):
-    '''Make an inert drake'''
-    drake_frame = util.load_frame(datadir, 'drake')
+def drake(datadir, clock, frame=None):
+    '''Make an inert drake, showing frame if given (e.g. while the drake's loads),
+    which the caller keeps holding'''
     drake = components.entity('Drake', clock, location=(500, 0),
                               motion=components.motion(),
                               graphics=components.graphics(None),
                               hitpoints=200)
-    drake.set_frame(drake_frame)
+    if frame is None:
+        frame = util.load_frame(datadir, 'drake')
+        drake.hold_frame(frame)
+    drake.set_frame(frame)
     physics.regular_physics(drake)
-    drake.physics.add(physics.apply_friction(5), components.physics.GROUP_VELOCITY)
+    physics.add_friction(drake, 5)
     return drake
 
 
-def sheep(datadir, clock):
-    '''Make an inert sheep'''
-    sheep_frame = util.load_frame(datadir, 'sheep')
+def sheep(datadir, clock, frame=None):
+    '''Make an inert sheep, showing frame if given (e.g. while the sheep's loads),
+    which the caller keeps holding'''
     sheep = components.entity('Sheep', clock, location=(500, 0),
                               motion=components.motion(),
                               graphics=components.graphics(None),
                               hitpoints=2)
-    sheep.set_frame(sheep_frame)
+    if frame is None:
+        frame = util.load_frame(datadir, 'sheep')
+        sheep.hold_frame(frame)
+    sheep.set_frame(frame)
     physics.regular_physics(sheep)
-    sheep.physics.add(physics.apply_friction(0.5), components.physics.GROUP_VELOCITY)
+    physics.add_friction(sheep, 0.5)
     return sheep
 
 
-def floaty_sheep(datadir, clock):
-    '''Make an inert sheep unaffected by gravity'''
-    sheep_frame = util.load_frame(datadir, 'sheep')
+def floaty_sheep(datadir, clock, frame=None):
+    '''Make an inert sheep unaffected by gravity, showing frame if given, like sheep'''
     sheep = components.entity('Sheep', clock, location=(500, 400),
                               motion=components.motion(),
                               graphics=components.graphics(None),
                               hitpoints=2)
-    sheep.set_frame(sheep_frame)
+    if frame is None:
+        frame = util.load_frame(datadir, 'sheep')
+        sheep.hold_frame(frame)
+    sheep.set_frame(frame)
     components.physics(sheep)
-    sheep.physics.add(physics.apply_friction(0.5), components.physics.GROUP_VELOCITY)
+    physics.add_friction(sheep, 0.5)
     return sheep
 
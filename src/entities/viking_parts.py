@@ -84,6 +84,8 @@ class WalkLeft(controls.BaseActionState):
 
 class BaseJumpState(controls.BaseActionState):
     """Base jump."""
+    __saved__ = ('ticks', 'last_grounded')
+
     def __init__(self, name, horz_speed):
         super(BaseJumpState, self).__init__(name)
         self.da = util.arrayify((horz_speed, 0.0))
@@ -97,7 +99,7 @@ class BaseJumpState(controls.BaseActionState):
 
 
     def on_tick(self, entity):
-        grounded = 'grounded' in entity.tags
+        grounded = constants.GROUNDED in entity.tags
         last_grounded = self.last_grounded
 
         if (self.ticks == 0 and not grounded) or (grounded and not last_grounded):
@@ -109,6 +111,7 @@ class BaseJumpState(controls.BaseActionState):
         if self.ticks > JUMP_TICKS:
             da[1] = 0.0
         else:
+            da[1] = JUMP_SPEED
             self.ticks += 1
 
         entity.motion_a += da
@@ -167,6 +170,8 @@ class JumpFacingLeft(BaseJumpState):
 
 class PunchBaseState(controls.BaseActionState):
     '''Base state for punching'''
+    __saved__ = ('ticks',)
+
     def __init__(self, name):
         '''
         name - action's name.
@@ -262,15 +267,12 @@ class OneFrameLoopedAnimation(BaseAnimation):
     def __init__(self, frame_name, flipped=False):
         self._none_transition = self.__class__
         super(OneFrameLoopedAnimation, self).__init__()
-        frame = util.load_frame(util.find_datadir(), frame_name)
+        frame = self.hold(util.load_frame(util.find_datadir(), frame_name))
         if flipped:
-            frame = util.flip_frame(frame)
+            frame = self.hold(util.flip_frame(frame))
         self.frame = frame
-
-
-    def __iter__(self):
-        while True:
-            yield self.frame
+        # looped by the None transition, so its frame index stays small
+        self.__frames__ = [frame]
 
 
 class LoopedAnimation(BaseAnimation):
@@ -286,9 +288,9 @@ class LoopedAnimation(BaseAnimation):
     def __init__(self, frame_name, delays, flipped=False):
         self._none_transition = self.__class__
         super(LoopedAnimation, self).__init__()
-        frames = util.load_frame_sequence(util.find_datadir(), frame_name, len(delays))
+        frames = map(self.hold, util.load_frame_sequence(util.find_datadir(), frame_name, len(delays)))
         if (flipped):
-            frames = map(util.flip_frame, frames)
+            frames = map(self.hold, map(util.flip_frame, frames))
         self.__frames__ = list(util.repeat_each(frames, delays))
 
 
@@ -323,9 +325,9 @@ class JumpAnimation(BaseAnimation):
         self._next_transition = None
         self._iter = None
         delays = [3, 1]
-        frames = util.load_frame_sequence(util.find_datadir(), 'jump', 2)
+        frames = map(self.hold, util.load_frame_sequence(util.find_datadir(), 'jump', 2))
         if (flipped):
-            frames = map(util.flip_frame, frames)
+            frames = map(self.hold, map(util.flip_frame, frames))
         self.__frames__ = list(util.repeat_each(frames, delays))
 
 
@@ -384,7 +386,7 @@ class PunchRightAnimation(BaseAnimation):
     def __init__(self):
         self._none_transition = IdleRightAnimation
         super(PunchRightAnimation, self).__init__()
-        frames = util.load_frame_sequence(util.find_datadir(), 'punch', 3)
+        frames = map(self.hold, util.load_frame_sequence(util.find_datadir(), 'punch', 3))
         self.__frames__ = list(util.repeat_each(frames, [8, 6, 8]))
 
 
@@ -401,8 +403,8 @@ class PunchLeftAnimation(BaseAnimation):
     def __init__(self):
         self._none_transition = IdleLeftAnimation
         super(PunchLeftAnimation, self).__init__()
-        frames = util.load_frame_sequence(util.find_datadir(), 'punch', 3)
-        frames = map(util.flip_frame, frames)
+        frames = map(self.hold, util.load_frame_sequence(util.find_datadir(), 'punch', 3))
+        frames = map(self.hold, map(util.flip_frame, frames))
         self.__frames__ = list(util.repeat_each(frames, [8, 6, 8]))
 
 
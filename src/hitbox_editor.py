@@ -11,32 +11,22 @@ import components
 import controls
 from constants import *
 from collections import defaultdict
-from util import arrayify, find_datadir
-import cPickle as pickle
+from util import arrayify, find_datadir, framemeta
 
 def load_points(imagefile):
-    filename = os.path.splitext(imagefile)[0] + '.points'
-    if os.path.exists(filename):
-        data = file(filename, 'rb')
-        try:
-            points = pickle.load(data)
-            data.close()
-            return points
-        except EOFError:
-            data.close()
+    dirname, name = os.path.split(os.path.splitext(imagefile)[0])
+    if os.path.exists(os.path.join(dirname, framemeta.META_NAME)):
+        frames = framemeta.frames(dirname)
+        if name in frames:
+            return framemeta.points(frames[name])
 
     return {'sp': numpy.array([200, 200]),
             'hba': components.hitbox((0, 0), (10, 10)),
             'hbp': components.hitbox((0, 0), (10, 10))}
 
 def save_points(imagefile, sp, hbp, hba):
-    filename = os.path.splitext(imagefile)[0] + '.points'
-    points = {'sp': sp,
-              'hba': hba,
-              'hbp': hbp}
-    data = file(filename, 'wb')
-    points = pickle.dump(points, data, 2)
-    data.close()
+    dirname, name = os.path.split(os.path.splitext(imagefile)[0])
+    framemeta.save_frame(dirname, name, sp, hbp, hba)
 
 def main():
     if len(sys.argv) == 1:
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+'''
+Two-player networked play with rollback.
+
+Both peers run the same world. Each one sends its player's key events
+to the other as soon as they happen and doesn't wait for the other's -
+where they aren't known yet, it predicts that the other player pressed
+nothing new (i.e. held the same keys). When the other's events arrive
+and they weren't nothing, the world goes back to the snapshot from before
+the first mispredicted tick and the ticks since are simulated again.
+
+A peer only gets that many ticks (the window) ahead of the last tick it
+knows the other's events for, then it waits, so rolling back never takes
+more than window ticks.
+
+Datagrams are a header, then the events of a run of ticks, each tick
+as in a replay frame (see replay), without the checksums:
+    header - magic 'PVNP', the tick from which the sender is missing our events (uint32),
+             the first tick in the datagram (uint32), number of ticks in it (uint16)
+    tick - number of events (uint16), then for each event its type (uint8) and key (uint16)
+All numbers are little-endian. Each datagram has all of the sender's events the other side
+hasn't confirmed, so lost ones needn't be sent again.
+'''
+
+import errno
+import random
+import socket
+import struct
+import pygame.event
+import snapshot
+
+
+__all__ = ['Session',
+           'LoopbackTransport',
+           'UDPTransport']
+
+
+MAGIC = b'PVNP'
+# largest datagram received
+MAX_DATAGRAM = 65507
+
+_header = struct.Struct('<4sIIH')
+_count = struct.Struct('<H')
+_event = struct.Struct('<BH')
+
+
+def _encode(ack, first, ticks):
+    parts = [_header.pack(MAGIC, ack, first, len(ticks))]
+    for events in ticks:
+        parts.append(_count.pack(len(events)))
+        parts.extend(_event.pack(type, key) for type, key in events)
+    return b''.join(parts)
+
+
+def _decode(data):
+    '''Returns the ack, first tick and the events of each tick in a datagram.
+    Raises ValueError or struct.error if it isn't one.'''
+    magic, ack, first, count = _header.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Not a netplay datagram')
+    offset = _header.size
+    ticks = []
+    for n in xrange(count):
+        nevents, = _count.unpack_from(data, offset)
+        offset += _count.size
+        ticks.append([_event.unpack_from(data, offset + k * _event.size) for k in xrange(nevents)])
+        offset += nevents * _event.size
+    return ack, first, ticks
+
+
+class Session(object):
+    '''
+    One peer's side of a two-player game. Call step once per tick
+    instead of world.step, with this peer's key events.
+    '''
+
+    def __init__(self, world, transport, player, keyboards, window=8):
+        '''
+        world - the world.World, made in the same way on both peers
+        transport - to the other peer, something with send(data) and receive() -> [data]
+        player - which of the two players is this peer's, 0 or 1
+        keyboards - two event dispatchers, one for each player's entities
+        window - most ticks to go ahead of the other peer, and so to roll back
+        '''
+        self.world = world
+        self.transport = transport
+        self.player = player
+        self.keyboards = keyboards
+        self.window = window
+        # the next tick to simulate
+        self.tick = world.ticks
+        # the other peer's events are known for all ticks before this one
+        self.confirmed = self.tick
+        # the other peer has our events for all ticks before this one
+        self.acked = self.tick
+        # tick -> [(type, key)] of each player
+        self.inputs = ({}, {})
+        # local events which will go in the next tick simulated
+        self.pending = []
+        # snapshots from before each of the last ticks, by tick % len
+        self.snapshots = [None] * (window + 1)
+
+        # how many times it went back, how many ticks it simulated again and how many steps it waited
+        self.rollbacks = 0
+        self.resimulated = 0
+        self.stalls = 0
+
+
+    @property
+    def remote(self):
+        return 1 - self.player
+
+
+    def step(self, events=()):
+        '''
+        Simulates the next tick with the given local key events.
+        Returns a list of the entities which died on it (see world.World.step),
+        or None if it has to wait for the other peer - then the events go in the next tick.
+        '''
+        self.pending.extend((event.type, event.key) for event in events)
+        self._catch_up()
+        if self.tick - self.confirmed >= self.window:
+            self.stalls += 1
+            dead = None
+        else:
+            self.inputs[self.player][self.tick] = self.pending
+            self.pending = []
+            dead = self._simulate()
+        self._send()
+        return dead
+
+
+    def poll(self):
+        '''Takes in what the other peer sent, rolling back if needed, and tells it what we have.
+        step does it, call it when not stepping (e.g. while paused) to keep the other peer going.'''
+        self._catch_up()
+        self._send()
+
+
+    def _catch_up(self):
+        mispredicted = self._receive()
+        if mispredicted is not None:
+            self._rollback(mispredicted)
+        self._forget()
+
+
+    def _simulate(self):
+        tick = self.tick
+        self.snapshots[tick % len(self.snapshots)] = snapshot.take(self.world)
+        for player, inputs in enumerate(self.inputs):
+            for type, key in inputs.get(tick, ()):
+                self.keyboards[player].dispatch(pygame.event.Event(type, key=key))
+        self.tick += 1
+        return self.world.step()
+
+
+    def _rollback(self, tick):
+        '''Goes back to before tick and simulates up to where it was again.'''
+        assert self.tick - tick <= self.window
+        end = self.tick
+        snapshot.restore(self.world, self.snapshots[tick % len(self.snapshots)])
+        self.tick = tick
+        while self.tick < end:
+            self._simulate()
+        self.rollbacks += 1
+        self.resimulated += end - tick
+
+
+    def _receive(self):
+        '''Takes in the other peer's events.
+        Returns the first tick simulated with the wrong ones, or None.'''
+        mispredicted = None
+        inputs = self.inputs[self.remote]
+        for data in self.transport.receive():
+            try:
+                ack, first, ticks = _decode(data)
+            except (ValueError, struct.error):
+                continue
+            self.acked = max(self.acked, ack)
+            for tick, events in enumerate(ticks, first):
+                if tick < self.confirmed or tick in inputs:
+                    continue
+                inputs[tick] = events
+                # ticks without the events were simulated with none
+                if events and tick < self.tick and (mispredicted is None or tick < mispredicted):
+                    mispredicted = tick
+        while self.confirmed in inputs:
+            self.confirmed += 1
+        return mispredicted
+
+
+    def _send(self):
+        local = self.inputs[self.player]
+        ticks = [local[tick] for tick in xrange(self.acked, self.tick)]
+        self.transport.send(_encode(self.confirmed, self.acked, ticks))
+
+
+    def _forget(self):
+        '''Drops the events which will never be needed again.'''
+        # the other peer needs ours until it has them, we need both until the ticks
+        # can't be rolled back any more (and the other's until we simulate them)
+        for inputs, before in ((self.inputs[self.player], min(self.acked, self.confirmed)),
+                               (self.inputs[self.remote], min(self.confirmed, self.tick))):
+            for tick in [tick for tick in inputs if tick < before]:
+                del inputs[tick]
+
+
+class LoopbackTransport(object):
+    '''
+    An in-process stand-in for UDPTransport, make two connected ones with pair.
+    A datagram arrives on the other's delay-th call to receive after it was sent,
+    unless it's lost, which happens with probability loss.
+    '''
+
+    def __init__(self, delay=0, loss=0.0, seed=0):
+        self.delay = delay
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.peer = None
+        # (receive call on which it arrives, datagram)
+        self.inbox = []
+        self.polls = 0
+
+
+    @classmethod
+    def pair(cls, delay=0, loss=0.0, seed=0):
+        '''Returns two transports connected to each other.'''
+        a = cls(delay, loss, seed)
+        b = cls(delay, loss, seed + 1)
+        a.peer = b
+        b.peer = a
+        return a, b
+
+
+    def send(self, data):
+        if self.random.random() < self.loss:
+            return
+        self.peer.inbox.append((self.peer.polls + self.delay + 1, data))
+
+
+    def receive(self):
+        '''Returns the datagrams which have arrived.'''
+        self.polls += 1
+        arrived = [data for when, data in self.inbox if when <= self.polls]
+        self.inbox = [(when, data) for when, data in self.inbox if when > self.polls]
+        return arrived
+
+
+    def close(self):
+        pass
+
+
+class UDPTransport(object):
+    '''Sends datagrams to the other peer over UDP and receives only the ones from it.'''
+
+    def __init__(self, local_address, remote_address=None):
+        '''
+        local_address - (host, port) to receive on, port 0 for any
+        remote_address - (host, port) of the other peer. It can be set later.
+        '''
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(local_address)
+        self.socket.setblocking(False)
+        self.remote_address = remote_address
+
+
+    @property
+    def address(self):
+        '''The address this transport receives on.'''
+        return self.socket.getsockname()
+
+
+    @property
+    def remote_address(self):
+        return self._remote_address
+
+
+    @remote_address.setter
+    def remote_address(self, address):
+        if address is not None:
+            host, port = address
+            address = (socket.gethostbyname(host), port)
+        self._remote_address = address
+
+
+    def send(self, data):
+        try:
+            self.socket.sendto(data, self.remote_address)
+        except socket.error as e:
+            # the other peer isn't there yet - same as a lost datagram
+            if e.errno not in (errno.ECONNREFUSED, errno.ECONNRESET):
+                raise
+
+
+    def receive(self):
+        '''Returns the datagrams which have arrived, without waiting.'''
+        arrived = []
+        while True:
+            try:
+                data, address = self.socket.recvfrom(MAX_DATAGRAM)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return arrived
+                if e.errno in (errno.ECONNREFUSED, errno.ECONNRESET):
+                    continue
+                raise
+            if address == self.remote_address:
+                arrived.append(data)
+
+
+    def close(self):
+        self.socket.close()
@@ -9,15 +9,100 @@ from collections import defaultdict
 from util import *
 
 
+# Batched modifiers. Instead of a closure per entity, each of these is one
+# kernel which runs over all awake entities at once (see apply_batched).
+# An entity is in a kernel's group if its bit is set in its 'modifiers' column,
+# the kernel's parameters are columns too.
+FRICTION = 1 << 0
+SPEED_LIMIT = 1 << 1
+GROUND_LIMIT = 1 << 2
+
+components.entity.add_column('modifiers', components.column((), numpy.uint32, 0))
+components.entity.add_column('friction_ground', components.column((), float, 0.0))
+components.entity.add_column('friction_air', components.column((), float, 0.0))
+components.entity.add_column('speed_limit', components.column((2,), float, numpy.inf))
+components.entity.add_column('ground_level', components.column((), float, numpy.inf))
+
+
+def add_friction(entity, gnd, air=0):
+    '''Batched apply_friction - the entity's horizontal speed goes down
+    by gnd on each tick it's grounded and by air when it isn't.'''
+    entity.friction_ground = gnd
+    entity.friction_air = air
+    entity.modifiers |= FRICTION
+
+
+def add_speed_limit(entity, limit):
+    '''Batched speed_limiter - keeps the entity's velocity between -limit and limit.'''
+    entity.speed_limit = limit
+    entity.modifiers |= SPEED_LIMIT
+
+
+def add_ground_limit(entity, ground_level):
+    '''Batched ground_limiter - keeps the entity's location above ground_level.'''
+    entity.ground_level = ground_level
+    entity.modifiers |= GROUND_LIMIT
+
+
+def remove_batched(entity, group):
+    '''Takes the entity out of the given group(s), e.g. FRICTION | SPEED_LIMIT'''
+    entity.modifiers &= ~numpy.uint32(group)
+
+
+def _group(n, group):
+    return (components.entity.modifiers[:n] & group).nonzero()[0]
+
+
+def friction_kernel(n):
+    idx = _group(n, FRICTION)
+    if len(idx) == 0:
+        return
+    entity = components.entity
+    f = numpy.where(entity.has_tag(GROUNDED)[idx], entity.friction_ground[idx], entity.friction_air[idx])
+    vx = entity.motion_v[idx, 0]
+    entity.motion_v[idx, 0] = numpy.sign(vx) * numpy.maximum(numpy.abs(vx) - f, 0)
+
+
+def speed_limit_kernel(n):
+    idx = _group(n, SPEED_LIMIT)
+    if len(idx) == 0:
+        return
+    entity = components.entity
+    limit = entity.speed_limit[idx]
+    entity.motion_v[idx] = numpy.clip(entity.motion_v[idx], -limit, limit)
+
+
+def ground_limit_kernel(n):
+    idx = _group(n, GROUND_LIMIT)
+    if len(idx) == 0:
+        return
+    entity = components.entity
+    y = entity.location[idx, 1]
+    dist = entity.ground_level[idx] - y
+    under = dist <= 0
+    entity.set_tag(GROUNDED, idx, under)
+    entity.location[idx, 1] = numpy.where(under, y + dist, y)
+
+
+# In the order they run - velocity modifiers, then the ones limiting movement.
+kernels = [friction_kernel, speed_limit_kernel, ground_limit_kernel]
+
+
+def apply_batched(n):
+    '''Runs the batched modifiers on the first n entities (normally the awake ones).
+    Call after the clock tick, so they run after the per-entity closures.'''
+    for kernel in kernels:
+        kernel(n)
+
 
 def apply_friction(gnd, air=0):
     '''
     Create a function which will apply the given ground and air friction to an entity.
-    Intended to be added as a physics modifier.
+    Intended to be added as a physics modifier, add_friction does the same for many entities faster.
     Note: the model used will make a physicist cry, but it works ^_^
     '''
     def friction_on(entity):
-        if 'grounded' in entity.tags:
+        if GROUNDED in entity.tags:
             f = gnd
         else:
             f = air
@@ -33,6 +118,10 @@ def apply_friction(gnd, air=0):
 
 
 def speed_limiter(limit):
+    '''
+    Create a function which keeps an entity's velocity between -limit and limit.
+    See also add_speed_limit.
+    '''
     limit = arrayify(limit)
     def limiter(entity):
         for i in range(len(limit)):
@@ -54,14 +143,15 @@ def regular_physics(entity):
 def ground_limiter(ground_level):
     '''
     Returns a function, that moves an entity's location, making its lower edge stay above the given horizontal line.
+    See also add_ground_limit.
     '''
     def limiter(entity):
         dist = ground_level - (entity.location[1])# + entity.hitbox_passive.point[1] + entity.hitbox_passive.size[1])
         if dist <= 0:
-            entity.tags.add('grounded')
+            entity.tags.add(GROUNDED)
             entity.location[1] += dist
         elif dist > 0:
-            if 'grounded' in entity.tags:
-                entity.tags.remove('grounded')
+            if GROUNDED in entity.tags:
+                entity.tags.remove(GROUNDED)
 
     return limiter
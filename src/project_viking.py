@@ -1,70 +1,45 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, generators, print_function, with_statement
 
-import itertools
-import math
 import os
-import time
-import sys
-import random
 import numpy
 import pygame
-import pyglet
-import pyglet.gl
-from pyglet import gl
 
 import components
-import controls
-import events
-import physics
 import level
+import events
 from util import *
-from entities import drake, floaty_sheep, sheep, viking, shaders
-import collisions
+from entities import drake, floaty_sheep, sheep, viking
+from render import Renderer
+from netplay import Session, UDPTransport
+from replay import Recorder, Replay
+from world import World
 import constants
 
 
-def handle_resize(w, h):
-    gl.glViewport(0, 0, w, h)
-    gl.glMatrixMode(gl.GL_PROJECTION)
-    gl.glLoadIdentity()
-    gl.glOrtho(0, w, h, 0, 0, 1)
-    gl.glMatrixMode(gl.GL_MODELVIEW)
-    gl.glLoadIdentity()
+# most steps to run in one frame when the simulation falls behind
+MAX_CATCHUP_STEPS = 5
+# seconds a frame may spend putting loaded images in atlases
+UPLOAD_BUDGET = 0.002
 
 
-def main(level_file):
-    clock = events.dispatcher('Clock')
-    keyboard = events.dispatcher('Keyboard')
+def main(level_file, record_file=None, replay_file=None, net=None):
+    '''
+    Runs the game on the given level (or a box if it's None).
+    record_file - write the inputs of each tick to that file, see replay.Recorder
+    replay_file - instead of playing, replay the ticks in that file as fast as possible
+    net - (player, local port, (remote host, remote port)) to play against another
+          computer, each one controlling one of the players, see netplay.Session
+    '''
     pygame.init()
     pygame.display.gl_set_attribute(pygame.GL_ALPHA_SIZE, 8)
 
     pygame.display.set_mode((1000, 600), pygame.OPENGL | pygame.DOUBLEBUF | pygame.RESIZABLE)
-    handle_resize(1000, 600)
-    screen_center = (500, 300)
-    camera_offset = 230
-    gl.glEnable(gl.GL_TEXTURE_2D)
-
-    gl.glEnable(gl.GL_BLEND)
-    gl.glBlendEquation(gl.GL_FUNC_ADD)
-    gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
-    gl.glClearColor(0, 0, 0, 1)
 
-    tick_event = pygame.event.Event(constants.TICK)
     datadir = find_datadir()
-    loader = pyglet.resource.Loader(datadir)
+    # all frames from one file if they've been baked, see bake_atlases.py
+    load_baked_frames(datadir)
 
-    player1 = viking(datadir, clock, keyboard,
-                     pygame.K_a, pygame.K_d, pygame.K_w, pygame.K_j)
-    player2 = viking(datadir, clock, keyboard,
-                     pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_RETURN)
-    player2.location[0] = 900
-
-    entities = [player1, player2]
-    scream = pygame.mixer.Sound(os.path.join(datadir, 'wilhelm.wav'))
-    background = load_sprite(datadir, 'background')
-    backgroundbuf = GLBuffer(4 * 4, numpy.float32, gl.GL_STATIC_DRAW)
-    backgroundbuf[:] = background.xyuv
     if level_file is None:
         walls = [components.hitbox((-5, -5), (10, 610)),
                  components.hitbox((995, -5), (10, 610)),
@@ -74,51 +49,77 @@ def main(level_file):
         for w in walls:
             numpy.round(w.point, out=w.point)
             numpy.round(w.size, out=w.size)
-    walls_tlbr = numpy.empty((2, len(walls), 2))
-    walls_tlbr[0] = [w.point for w in walls]
-    walls_tlbr[1] = [w.point + w.size for w in walls]
-
-    # vertex positions for walls
-    quads = numpy.empty((len(walls), 4, 2), dtype=numpy.float32)
-    quads[:, 0, :] = [w.point for w in walls]
-    quads[:, 2, :] = [w.size for w in walls]
-    quads[:, 2, :] += quads[:, 0, :]
-    quads[:, 1, 0] = quads[:, 0, 0]
-    quads[:, 1, 1] = quads[:, 2, 1]
-    quads[:, 3, 0] = quads[:, 2, 0]
-    quads[:, 3, 1] = quads[:, 0, 1]
-    wallbuf = GLBuffer(quads.size, numpy.float32, gl.GL_STATIC_DRAW)
-    wallbuf[:] = quads
-    del quads
-
-    # contains vertex and texture positions for sprites
-    entitybuf = GLBuffer(dtype=numpy.float32)
-
-    # walls program
-    wallprog = shaders.wall()
+    world = World(walls)
+    clock = world.clock
+    if net is None:
+        keyboards = [world.keyboard, world.keyboard]
+    else:
+        # each computer's keys only go to its own player
+        keyboards = [events.dispatcher('Keyboard 1'), events.dispatcher('Keyboard 2')]
 
-    spriteprog = shaders.sprite()
+    player1 = world.add(viking(datadir, clock, keyboards[0],
+                               pygame.K_a, pygame.K_d, pygame.K_w, pygame.K_j))
+    player2 = world.add(viking(datadir, clock, keyboards[1],
+                               pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_RETURN))
+    player2.location[0] = 900
 
-    dragonprog = shaders.psycho()
-    dragonpalette = load_texture(os.path.join(datadir, 'wallpalette.png'), dimensions=1)
-    dragonsprite_scales = load_sprite(datadir, 'dragon_scales')
-    dragonsprite_contours = load_sprite(datadir, 'dragon_contours')
-    dragonbuf = GLBuffer(4 * 4, numpy.float32, gl.GL_STATIC_DRAW)
-    dragonbuf[:] = dragonsprite_scales.xyuv + (-100, 145, 0, 0)
-    contourbuf = GLBuffer(4 * 4, numpy.float32, gl.GL_STATIC_DRAW)
-    contourbuf[:] = dragonsprite_contours.xyuv + (-100, 145, 0, 0)
+    scream = pygame.mixer.Sound(os.path.join(datadir, 'wilhelm.wav'))
+    renderer = Renderer(datadir, world, (1000, 600))
+    loader = AssetLoader()
+
+    def spawn(make, frame_name):
+        '''Adds a thing right away, showing a placeholder until its image has loaded.
+        Its hitboxes are read at once, so it moves the same however long that takes.
+        The thing holds the frame the loader gives it, and releases it when it dies.'''
+        future = loader.load_frame(datadir, frame_name)
+        try:
+            frame = future.result() or loader.stand_in(datadir, frame_name)
+        except (EnvironmentError, KeyError, ValueError) as e:
+            print("Can't spawn", frame_name, e)
+            thing = None
+        else:
+            thing = world.add(make(datadir, clock, frame))
+
+        def loaded(future):
+            if future.exception() is not None:
+                # it keeps showing the placeholder
+                print("Can't load", frame_name, future.exception())
+            elif thing in world.entities:
+                thing.graphics.sprite = future.result()['sprite']
+                thing.hold_frame(future.result())
+            else:
+                release_frame(future.result())
+        future.add_done_callback(loaded)
+
+    if replay_file is not None:
+        with open(replay_file, 'rb') as fp:
+            start = monotonic()
+            ticks = Replay(fp, world).run()
+            print('Replayed', ticks, 'ticks in', monotonic() - start, 's')
+        return 0
+    session = None
+    recorder = None
+    if net is not None:
+        player, local_port, remote_address = net
+        session = Session(world, UDPTransport(('', local_port), remote_address), player, keyboards)
+        step_world = session.step
+    elif record_file is not None:
+        recorder = Recorder(open(record_file, 'wb'), world)
+        step_world = recorder.step
+    else:
+        step_world = world.step
 
-    debug_draw = False
+    timer = FixedStep(constants.FRAME, MAX_CATCHUP_STEPS)
     pause = False
     do_frame = False
-    ticks_done = 0
+    # keys pressed since the last step
+    key_events = []
     while True:
-        start = time.clock()
-
-        key_events = []
         resize_event = None
         for event in pygame.event.get():
-            if event.type == pygame.QUIT:
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                if recorder is not None:
+                    recorder.close()
                 return 0
             elif event.type == pygame.KEYDOWN or event.type == pygame.KEYUP:
                 key_events.append(event)
@@ -126,203 +127,82 @@ def main(level_file):
                 resize_event = event
 
             if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    return 0
                 if event.key == pygame.K_F2:
-                    debug_draw = not debug_draw
-                elif event.key == pygame.K_F3:
-                    entities.append(sheep(datadir, clock))
-                elif event.key == pygame.K_F4:
-                    entities.append(drake(datadir, clock))
-                elif event.key == pygame.K_F5:
-                    entities.append(floaty_sheep(datadir, clock))
+                    renderer.debug_draw = not renderer.debug_draw
                 elif event.key == pygame.K_p:
                     pause = not pause
                 elif event.key == pygame.K_PERIOD and pause:
                     do_frame = True
+                elif session is not None or recorder is not None:
+                    # no spawning: the other computer wouldn't know about it, and the
+                    # log only has key events, so a replay wouldn't either
+                    pass
+                elif event.key == pygame.K_F3:
+                    spawn(sheep, 'sheep')
+                elif event.key == pygame.K_F4:
+                    spawn(drake, 'drake')
+                elif event.key == pygame.K_F5:
+                    spawn(floaty_sheep, 'sheep')
 
         if resize_event:
-            handle_resize(resize_event.w, resize_event.h)
-            screen_center = (resize_event.w // 2, resize_event.h // 2)
-            background.xyuv[:, :2] = [[0, 0], [0, resize_event.h],
-                                      [resize_event.w, resize_event.h], [resize_event.w, 0]]
-            backgroundbuf[:] = background.xyuv
-
-        if (not pause) or do_frame:
-            for event in key_events:
-                keyboard.dispatch(event)
-
-            location = components.entity.location
-            delta = numpy.array(location)
-            motion_a = components.entity.motion_a
-            motion_v = components.entity.motion_v
-            active_tl = components.entity.active_tl
-            active_br = components.entity.active_br
-            passive_tl = components.entity.passive_tl
-            passive_br = components.entity.passive_br
-            instances = components.entity._all[:components.entity._nentities]
-            do_translate = components.entity.translate_all
-
-            GROUNDED = intern('grounded')
-            motion_a[:] = (0, constants.G)
-            clock.dispatch(tick_event)
-            for thing in entities:
-                thing.tags.discard(GROUNDED)
-            motion_v[:] += motion_a
-
-            collisions.resolve_passive_active_collisions(instances, active_tl, active_br, passive_tl, passive_br)
-            attempts = 0
-            adjust_significant = True
-            rppc = collisions.resolve_passive_passive_collisions
-            rwc = collisions.resolve_wall_collisions
-            grounded_mask = numpy.zeros((len(instances),), dtype=bool)
-            stop = numpy.empty((len(instances),2), dtype=bool)
-            adjust, sides = rwc(motion_v, passive_tl, passive_br, walls_tlbr[0], walls_tlbr[1])
-            numpy.logical_or.reduce(sides.reshape(-1, 2, 2), out=stop, axis=2)
-            motion_v[stop] = 0
-            do_translate(motion_v[:])
-            while attempts < 20 and adjust_significant:
-                adjust, sides, done_impulse = rppc(motion_v, passive_tl, passive_br)
-                grounded_mask |= sides[:,3]
-                adjust *= 0.5
-                do_translate(adjust)
-                adjust_significant = not numpy.allclose(adjust, 0, atol=0.125)
-                adjust_significant |= done_impulse > 0.125
-                del adjust, sides
-                adjust, sides = rwc(motion_v, passive_tl, passive_br, walls_tlbr[0], walls_tlbr[1])
-                adjust_significant |= not numpy.allclose(adjust, 0, atol=0.5)
-                do_translate(adjust)
-                numpy.logical_or.reduce(sides.reshape(-1, 2, 2), out=stop, axis=2)
-                motion_v[stop] = 0
-                grounded_mask |= sides[:,3]
-
-                attempts += 1
-
-            for thing in numpy.compress(grounded_mask, instances):
-                thing.tags.add(GROUNDED)
-
-            do_frame = False
-            ticks_done += 1
-
-        dead = []
-
-        gl.glLoadIdentity()
-        gl.glEnableVertexAttribArray(0)
-        gl.glUseProgram(spriteprog.id)
-        gl.glBindTexture(gl.GL_TEXTURE_2D, background.texid)
-        spriteprog['texture'] = 0
-
-        with backgroundbuf.bound:
-            gl.glVertexAttribPointer(0, 4, gl.GL_FLOAT, gl.GL_FALSE, 0, 0)
-            gl.glDrawArrays(gl.GL_TRIANGLE_FAN, 0, 4)
-
-        # Now move camera
-        camera_location = (screen_center - numpy.round(entities[0].location)) + (0, camera_offset)
-        gl.glTranslated(camera_location[0], camera_location[1], 0.0)
-
-        for thing in entities:
-            if thing.hitpoints <= 0 or thing.location[1] > 10000:
-                dead.append(thing)
-                continue
-
-        for thing in dead:
-            scream.play()
-            if thing.name == 'Player':
-                thing.hitpoints = 100
-                thing.location[:] = (500, -10)
-                thing.motion_v[:] = 0
-                if thing.physics is not None:
-                    thing.physics.last_position[:] = thing.location
-            else:
-                entities.remove(thing)
-                thing.dispose()
-
-        xyuv = numpy.empty((4, 4), dtype=numpy.float32)
-        texid = [0] * len(entities)
-        with entitybuf.bound:
-            for n, thing in enumerate(entities):
-                xyuv[:] = thing.graphics.sprite.xyuv
-                xy = xyuv[:, 0:2]
-                xy[:] += thing.graphics.anchor
-                xy[:] += thing.location
-                numpy.round(xy, out=xy)
-                offset = n * 16
-                entitybuf[offset:] = xyuv
-                texid[n] = thing.graphics.sprite.texid
-                #print('Loaded data for entity', n, xyuv, 'texid', texid[n])
-
-            gl.glVertexAttribPointer(0, 4, gl.GL_FLOAT, gl.GL_FALSE, 0, 0)
-
-            for n, t in enumerate(texid):
-                gl.glBindTexture(gl.GL_TEXTURE_2D, t)
-                gl.glDrawArrays(gl.GL_TRIANGLE_FAN, n * 4, 4)
-
-        # draw walls
-        gl.glUseProgram(wallprog.id)
-        wallprog['color'] = (162.0/255.0, 153.0/255.0, 118.0/255.0, 1.0)
-        with wallbuf.bound:
-            gl.glVertexAttribPointer(0, 2, gl.GL_FLOAT, gl.GL_FALSE, 0, 0)
-            gl.glDrawArrays(gl.GL_QUADS, 0, len(walls) * 8)
-
-        # draw some shaders
-        gl.glUseProgram(dragonprog.id)
-        gl.glBindTexture(gl.GL_TEXTURE_2D, dragonsprite_scales.texid)
-        gl.glActiveTexture(gl.GL_TEXTURE0 + 1)
-        gl.glBindTexture(gl.GL_TEXTURE_1D, dragonpalette)
-        gl.glActiveTexture(gl.GL_TEXTURE0)
-        dragonprog['texture'] = 0
-        dragonprog['palette'] = 1
-        dragonprog['perturb'] = (ticks_done % 1024) / 128
-        dragonprog['shift'] = ticks_done / 600
-        with dragonbuf.bound:
-            gl.glVertexAttribPointer(0, 4, gl.GL_FLOAT, gl.GL_FALSE, 0, 0)
-            gl.glDrawArrays(gl.GL_TRIANGLE_FAN, 0, 4)
-
-        # now draw the rest of the fuckin' dragon
-        gl.glUseProgram(spriteprog.id)
-        gl.glBindTexture(gl.GL_TEXTURE_2D, dragonsprite_contours.texid)
-        spriteprog['texture'] = 0
-        with contourbuf.bound:
-            gl.glVertexAttribPointer(0, 4, gl.GL_FLOAT, gl.GL_FALSE, 0, 0)
-            gl.glDrawArrays(gl.GL_TRIANGLE_FAN, 0, 4)
-
-        if debug_draw:
-            gl.glUseProgram(wallprog.id)
-            wallprog['color'] = (0.89, 0.89, 0.89, 1.0)
-            quads = numpy.zeros((len(entities), 4, 2), dtype=numpy.float32)
-            quads[:, 0, :] = components.entity.passive_tl
-            quads[:, 2, :] = components.entity.passive_br
-            quads[:, 1, 0] = quads[:, 0, 0]
-            quads[:, 1, 1] = quads[:, 2, 1]
-            quads[:, 3, 0] = quads[:, 2, 0]
-            quads[:, 3, 1] = quads[:, 0, 1]
-            gl.glVertexAttribPointer(0, 2, gl.GL_FLOAT, gl.GL_FALSE, 0, quads.ctypes.data)
-            gl.glDrawArrays(gl.GL_QUADS, 0, quads.size // 2)
-
-        gl.glColor3f(1, 1, 1)
-        gl.glEnable(gl.GL_TEXTURE_2D)
+            renderer.resize(resize_event.w, resize_event.h)
+
+        if pause:
+            steps = 1 if do_frame else 0
+            timer.reset()
+        else:
+            steps = timer.advance()
+        if session is not None and steps == 0:
+            session.poll()
+        for n in xrange(steps):
+            # a netplay session gives None while it waits for the other computer
+            died = step_world(key_events) or ()
+            for thing in died:
+                scream.play()
+            if died:
+                # dead things have released their frames
+                evict_frames()
+            key_events = []
+            if renderer.debug_draw:
+                print('tick', world.ticks, world.stats, 'awake', components.entity._nawake,
+                      'of', len(world.entities))
+        if renderer.debug_draw and steps > 1:
+            print('caught up', steps, 'steps, dropped', timer.dropped, 's so far')
+        do_frame = False
+
+        loader.upload(UPLOAD_BUDGET)
+        if renderer.debug_draw and loader.uploaded:
+            print('uploaded', loader.uploaded, 'frames in', loader.upload_time, 's', cache_stats())
+        renderer.draw(1.0 if pause else timer.alpha)
 
         #screen.fill((120, 50, 50), pygame.Rect(0, 10, player1.hitpoints * 2, 10))
         #screen.fill((120, 50, 50), pygame.Rect(1000 - player2.hitpoints * 2, 10, player2.hitpoints * 2, 10))
 
         pygame.display.flip()
 
-        delta = time.clock() - start
-        if delta < constants.FRAME:
-            time.sleep(constants.FRAME - delta)
-
 if __name__ == '__main__':
     # ask for a level file...
     import sys
     from Tkinter import Tk
     from tkFileDialog import askopenfilename
+    # project_viking.py [level [--record file | --replay file | --net player local_port host:port]]
     level_file = None
-    if len(sys.argv) == 2:
+    record_file = None
+    replay_file = None
+    net = None
+    if len(sys.argv) == 4 and sys.argv[2] == '--record':
+        record_file = sys.argv[3]
+    elif len(sys.argv) == 4 and sys.argv[2] == '--replay':
+        replay_file = sys.argv[3]
+    elif len(sys.argv) == 6 and sys.argv[2] == '--net':
+        host, port = sys.argv[5].rsplit(':', 1)
+        net = (int(sys.argv[3]), int(sys.argv[4]), (host, int(port)))
+    if len(sys.argv) >= 2:
         level_file = sys.argv[1]
     else:
         Tk().withdraw()
         level_file = askopenfilename(filetypes=('Level {.level}',))
         if level_file == '':
             level_file = None
-    main(level_file)
+    main(level_file, record_file, replay_file, net)
     pygame.quit()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+'''
+Draws a world.World with OpenGL. Only reads the world's state.
+'''
+
+import os
+import numpy
+from pyglet import gl
+
+import components
+from util import *
+from entities import shaders
+
+
+__all__ = ['Renderer',
+           'handle_resize']
+
+
+def handle_resize(w, h):
+    gl.glViewport(0, 0, w, h)
+    gl.glMatrixMode(gl.GL_PROJECTION)
+    gl.glLoadIdentity()
+    gl.glOrtho(0, w, h, 0, 0, 1)
+    gl.glMatrixMode(gl.GL_MODELVIEW)
+    gl.glLoadIdentity()
+
+
+class Renderer(object):
+    def __init__(self, datadir, world, size=(1000, 600)):
+        '''
+        Sets up the GL state and loads the things drawn around the entities.
+        There must be a GL context already.
+        world - the world.World to draw
+        size - of the window
+        '''
+        self.world = world
+        self.camera_offset = 230
+        self.debug_draw = False
+
+        gl.glEnable(gl.GL_TEXTURE_2D)
+        gl.glEnable(gl.GL_BLEND)
+        gl.glBlendEquation(gl.GL_FUNC_ADD)
+        gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+        gl.glClearColor(0, 0, 0, 1)
+
+        self.background = load_sprite(datadir, 'background')
+        self.backgroundbuf = GLBuffer(4 * 4, numpy.float32, gl.GL_STATIC_DRAW)
+        self.backgroundbuf[:] = self.background.xyuv
+        handle_resize(*size)
+        self.screen_center = (size[0] // 2, size[1] // 2)
+
+        # vertex positions for walls
+        walls = world.walls
+        quads = numpy.empty((len(walls), 4, 2), dtype=numpy.float32)
+        quads[:, 0, :] = world.walls_tl
+        quads[:, 2, :] = world.walls_br
+        quads[:, 1, 0] = quads[:, 0, 0]
+        quads[:, 1, 1] = quads[:, 2, 1]
+        quads[:, 3, 0] = quads[:, 2, 0]
+        quads[:, 3, 1] = quads[:, 0, 1]
+        self.wallbuf = GLBuffer(quads.size, numpy.float32, gl.GL_STATIC_DRAW)
+        self.wallbuf[:] = quads
+
+        # draws the entities' sprites
+        self.sprites = SpriteBatch()
+
+        # walls program
+        self.wallprog = shaders.wall()
+
+        self.spriteprog = shaders.sprite()
+
+        self.dragonprog = shaders.psycho()
+        self.dragonpalette = load_texture(os.path.join(datadir, 'wallpalette.png'), dimensions=1)
+        self.dragonsprite_scales = load_sprite(datadir, 'dragon_scales')
+        self.dragonsprite_contours = load_sprite(datadir, 'dragon_contours')
+        self.dragonbuf = GLBuffer(4 * 4, numpy.float32, gl.GL_STATIC_DRAW)
+        self.dragonbuf[:] = self.dragonsprite_scales.xyuv + (-100, 145, 0, 0)
+        self.contourbuf = GLBuffer(4 * 4, numpy.float32, gl.GL_STATIC_DRAW)
+        self.contourbuf[:] = self.dragonsprite_contours.xyuv + (-100, 145, 0, 0)
+
+
+    def resize(self, w, h):
+        '''Call when the window changes size, stretches the background over it.'''
+        handle_resize(w, h)
+        self.screen_center = (w // 2, h // 2)
+        self.background.xyuv[:, :2] = [[0, 0], [0, h], [w, h], [w, 0]]
+        self.backgroundbuf[:] = self.background.xyuv
+
+
+    def draw(self, alpha=1.0):
+        '''Draws the world, with the camera on its first entity.
+        alpha - how far between the world's last two steps to draw the entities,
+        see util.FixedStep.alpha'''
+        entities = self.world.entities
+        ticks_done = self.world.ticks
+        location = self.world.interpolated_location(alpha)
+
+        gl.glLoadIdentity()
+        gl.glEnableVertexAttribArray(0)
+        gl.glUseProgram(self.spriteprog.id)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.background.texid)
+        self.spriteprog['texture'] = 0
+
+        with self.backgroundbuf.bound:
+            gl.glVertexAttribPointer(0, 4, gl.GL_FLOAT, gl.GL_FALSE, 0, 0)
+            gl.glDrawArrays(gl.GL_TRIANGLE_FAN, 0, 4)
+
+        # Now move camera
+        camera_location = (self.screen_center - numpy.round(location[entities[0].arrayid])) + (0, self.camera_offset)
+        gl.glTranslated(camera_location[0], camera_location[1], 0.0)
+
+        # sprites of the entities in the world, in the order they were added
+        entity = components.entity
+        shown = numpy.flatnonzero((entity.sprite_id >= 0) & (entity.added >= 0))
+        shown = shown[numpy.argsort(entity.added[shown], kind='mergesort')]
+        xyuv, texids = sprite_table.quads(entity.sprite_id[shown], entity.sprite_anchor[shown] + location[shown])
+        self.sprites.draw(xyuv, texids)
+
+        # draw walls
+        wallprog = self.wallprog
+        gl.glUseProgram(wallprog.id)
+        wallprog['color'] = (162.0/255.0, 153.0/255.0, 118.0/255.0, 1.0)
+        with self.wallbuf.bound:
+            gl.glVertexAttribPointer(0, 2, gl.GL_FLOAT, gl.GL_FALSE, 0, 0)
+            gl.glDrawArrays(gl.GL_QUADS, 0, len(self.world.walls) * 8)
+
+        # draw some shaders
+        dragonprog = self.dragonprog
+        gl.glUseProgram(dragonprog.id)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.dragonsprite_scales.texid)
+        gl.glActiveTexture(gl.GL_TEXTURE0 + 1)
+        gl.glBindTexture(gl.GL_TEXTURE_1D, self.dragonpalette)
+        gl.glActiveTexture(gl.GL_TEXTURE0)
+        dragonprog['texture'] = 0
+        dragonprog['palette'] = 1
+        dragonprog['perturb'] = (ticks_done % 1024) / 128
+        dragonprog['shift'] = ticks_done / 600
+        with self.dragonbuf.bound:
+            gl.glVertexAttribPointer(0, 4, gl.GL_FLOAT, gl.GL_FALSE, 0, 0)
+            gl.glDrawArrays(gl.GL_TRIANGLE_FAN, 0, 4)
+
+        # now draw the rest of the fuckin' dragon
+        gl.glUseProgram(self.spriteprog.id)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.dragonsprite_contours.texid)
+        self.spriteprog['texture'] = 0
+        with self.contourbuf.bound:
+            gl.glVertexAttribPointer(0, 4, gl.GL_FLOAT, gl.GL_FALSE, 0, 0)
+            gl.glDrawArrays(gl.GL_TRIANGLE_FAN, 0, 4)
+
+        if self.debug_draw:
+            gl.glUseProgram(wallprog.id)
+            wallprog['color'] = (0.89, 0.89, 0.89, 1.0)
+            quads = numpy.zeros((len(entities), 4, 2), dtype=numpy.float32)
+            quads[:, 0, :] = components.entity.passive_tl
+            quads[:, 2, :] = components.entity.passive_br
+            quads[:, 1, 0] = quads[:, 0, 0]
+            quads[:, 1, 1] = quads[:, 2, 1]
+            quads[:, 3, 0] = quads[:, 2, 0]
+            quads[:, 3, 1] = quads[:, 0, 1]
+            gl.glVertexAttribPointer(0, 2, gl.GL_FLOAT, gl.GL_FALSE, 0, quads.ctypes.data)
+            gl.glDrawArrays(gl.GL_QUADS, 0, quads.size // 2)
+
+        gl.glColor3f(1, 1, 1)
+        gl.glEnable(gl.GL_TEXTURE_2D)
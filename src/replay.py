@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+'''
+Recording and replaying the inputs of a world.World, tick by tick.
+
+A log is a header, then a frame for each tick:
+    header - magic 'PVRP', format version (uint16), checksum interval N (uint16)
+    frame - number of events (uint16), then for each event its type (uint8) and key (uint16),
+            then after every N-th tick, the checksum of the entity store (uint32)
+All numbers are little-endian.
+
+Replaying a log gives the same ticks only if the world starts out the same
+as the recorded one did, so make both with the same code.
+'''
+
+import struct
+import zlib
+import numpy
+import pygame.event
+import components
+
+
+__all__ = ['MAGIC',
+           'ReplayDivergence',
+           'Recorder',
+           'Replay',
+           'checksum']
+
+
+MAGIC = b'PVRP'
+VERSION = 1
+
+_header = struct.Struct('<4sHH')
+_count = struct.Struct('<H')
+_event = struct.Struct('<BH')
+_checksum = struct.Struct('<I')
+
+
+class ReplayDivergence(Exception):
+    def __init__(self, tick, expected, actual):
+        super(ReplayDivergence, self).__init__(
+            'Replay diverged at tick {0}: checksum {1:08x}, recorded {2:08x}'.format(tick, actual, expected))
+        self.tick = tick
+        self.expected = expected
+        self.actual = actual
+
+
+def checksum(world):
+    '''Returns a CRC32 of all of the world's entity store, except the entities themselves.'''
+    world.activate()
+    store = components.entity._store
+    crc = 0
+    for name in sorted(store.columns()):
+        rows = store.rows(name)
+        if rows.dtype == object:
+            continue
+        crc = zlib.crc32(numpy.ascontiguousarray(rows).data, crc)
+    return crc & 0xFFFFFFFF
+
+
+class Recorder(object):
+    '''Steps a world and writes its inputs to a log.'''
+
+    def __init__(self, fp, world, checksum_every=50):
+        '''
+        fp - binary file to write the log to
+        world - the world.World to step
+        checksum_every - write a checksum after every that many ticks, 0 for none
+        '''
+        self.fp = fp
+        self.world = world
+        self.checksum_every = checksum_every
+        self.ticks = 0
+        fp.write(_header.pack(MAGIC, VERSION, checksum_every))
+
+
+    def step(self, inputs=()):
+        '''Same as world.step, but the inputs (key events) are recorded.'''
+        inputs = list(inputs)
+        frame = [_count.pack(len(inputs))]
+        frame.extend(_event.pack(event.type, event.key) for event in inputs)
+        dead = self.world.step(inputs)
+        self.ticks += 1
+        if self.checksum_every and self.ticks % self.checksum_every == 0:
+            frame.append(_checksum.pack(checksum(self.world)))
+        self.fp.write(b''.join(frame))
+        return dead
+
+
+    def close(self):
+        '''Closes the log file.'''
+        self.fp.close()
+
+
+class Replay(object):
+    '''Feeds the inputs from a log to a world, checking that it goes the same way.'''
+
+    def __init__(self, fp, world):
+        '''
+        fp - binary file with a log written by Recorder
+        world - the world.World to step, set up the same as the recorded one was
+        Raises ValueError if fp isn't a log.
+        '''
+        self.fp = fp
+        self.world = world
+        self.ticks = 0
+        header = fp.read(_header.size)
+        if len(header) < _header.size:
+            raise ValueError('Not a replay log: too short')
+        magic, version, self.checksum_every = _header.unpack(header)
+        if magic != MAGIC:
+            raise ValueError('Not a replay log')
+        if version != VERSION:
+            raise ValueError('Unknown replay log version {0}'.format(version))
+
+
+    def _read(self, fmt):
+        data = self.fp.read(fmt.size)
+        if len(data) < fmt.size:
+            raise EOFError
+        return fmt.unpack(data)
+
+
+    def step(self):
+        '''
+        Replays one tick. Returns what world.step did.
+        Raises EOFError at the end of the log and ReplayDivergence if
+        the world's checksum differs from the recorded one.
+        '''
+        count, = self._read(_count)
+        data = self.fp.read(_event.size * count)
+        if len(data) < _event.size * count:
+            raise EOFError
+        inputs = [pygame.event.Event(type, key=key)
+                  for type, key in (_event.unpack_from(data, n * _event.size) for n in xrange(count))]
+        dead = self.world.step(inputs)
+        self.ticks += 1
+        if self.checksum_every and self.ticks % self.checksum_every == 0:
+            expected, = self._read(_checksum)
+            actual = checksum(self.world)
+            if actual != expected:
+                raise ReplayDivergence(self.ticks, expected, actual)
+        return dead
+
+
+    def run(self):
+        '''Replays all of the log. Returns the number of ticks.'''
+        try:
+            while True:
+                self.step()
+        except EOFError:
+            return self.ticks
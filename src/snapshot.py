@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+'''
+Snapshots of the whole state of a world.World, for rollback, save states
+and seeking in replays.
+
+A snapshot is one flat buffer, so taking one is a few memory copies
+and restoring one reads the arrays straight from it with numpy.frombuffer:
+    header - see _header
+    the walls' top-left and bottom-right corners
+    a record for each controlled entity - the names of its action and animation states,
+        their saved attributes and how far the animation is, see _controller
+    the entity store's state (see util.memdb.Table.state), each array capacity rows long
+Each part starts at a multiple of 8 bytes. All numbers are little-endian.
+
+Like replays, snapshots only fit worlds set up by the same code,
+with the same columns and tags and the same walls.
+'''
+
+import struct
+import weakref
+import zlib
+import numpy
+import components
+import controls
+import util
+
+
+__all__ = ['MAGIC',
+           'Snapshot',
+           'take',
+           'restore']
+
+
+MAGIC = b'PVSS'
+VERSION = 1
+
+# magic, version, number of controller records, store capacity, entity count, awake entities,
+# CRC32 of the store layout and tags, number of walls, padding, entities added, world ticks
+_header = struct.Struct('<4sHHIIIIIIqq')
+
+_NAME = 'S40'
+_controller = numpy.dtype([('handle', '<i8'),
+                           ('action', _NAME),
+                           ('saved', '<i8', (controls.BaseActionState.SAVED_MAX,)),
+                           ('animation', _NAME),
+                           ('frame', '<i8'),
+                           # the next animation event, empty for None
+                           ('event', _NAME)])
+
+# (store layout, number of tags) -> its CRC
+_layouts = {}
+
+# the snapshots which can put back entities, see _hold_frames
+_revivers = weakref.WeakSet()
+
+
+class Snapshot(object):
+    '''
+    What take returns. data is the flat buffer, which can be saved and restored on its own.
+    things are the entities by arrayid and entities the world's entities when it was taken.
+    They are only kept in memory and let restore put back entities which were removed
+    after it was taken. The frames of those entities stay held until the snapshot is dropped,
+    so that they still show the same sprites when they are put back.
+    '''
+    __slots__ = ('data', 'things', 'entities', 'held', '__weakref__')
+
+    def __init__(self, data, things=None, entities=None):
+        self.data = data
+        self.things = things
+        self.entities = entities
+        # removed entity -> the frames it released, held for it
+        self.held = {}
+        if things is not None:
+            _revivers.add(self)
+
+
+    def __del__(self):
+        for frames in self.held.itervalues():
+            for frame in frames:
+                util.release_frame(frame)
+
+
+def _hold_frames(thing, frames):
+    '''Holds the frames of an entity being disposed of in each snapshot which can put it back.'''
+    for snapshot in _revivers:
+        if thing not in snapshot.held and thing in snapshot.things:
+            snapshot.held[thing] = [util.acquire_frame(frame) for frame in frames]
+
+components.entity._dispose_observers.append(_hold_frames)
+
+
+def _layout(store):
+    key = (store.layout, len(components.entity._tag_bits))
+    try:
+        return _layouts[key]
+    except KeyError:
+        tags = sorted(components.entity._tag_bits.iteritems(), key=lambda item: item[1])
+        crc = zlib.crc32(store.layout + ';' + ','.join(name for name, bit in tags)) & 0xFFFFFFFF
+        _layouts[key] = crc
+        return crc
+
+
+def _padding(size):
+    return b'\0' * (-size % 8)
+
+
+def take(world):
+    '''Returns a Snapshot of the world.'''
+    world.activate()
+    entity = components.entity
+    store = entity._store
+
+    records = numpy.zeros(len(world.controlled), _controller)
+    for record, thing in zip(records, world.controlled):
+        controller = thing.controller
+        action = controller.action
+        record['handle'] = thing.handle
+        record['action'] = action.__class__.__name__
+        record['saved'][:len(action.__saved__)] = [getattr(action, name) for name in action.__saved__]
+        record['animation'] = controller.animation.state.__class__.__name__
+        record['frame'] = controller.animation.index
+        record['event'] = controller.animation_event or b''
+
+    parts = [_header.pack(MAGIC, VERSION, len(records), store.capacity, store.count, entity._nawake,
+                          _layout(store), len(world.walls), 0, world.added, world.ticks)]
+    for array in [world.walls_tl, world.walls_br, records] + store.state():
+        data = array.tostring()
+        parts.append(data)
+        parts.append(_padding(len(data)))
+    return Snapshot(b''.join(parts), entity.instances().copy(), list(world.entities))
+
+
+def restore(world, snapshot):
+    '''
+    Puts the world back in the state it was in when the snapshot was taken.
+    snapshot - a Snapshot or just its data. With just the data, all entities
+    in the snapshot must still be in the world.
+    Entities added after the snapshot was taken are left out of the world and must not be used.
+    Raises ValueError if the snapshot doesn't fit the world.
+    '''
+    if isinstance(snapshot, Snapshot):
+        data, things, entities = snapshot.data, snapshot.things, snapshot.entities
+    else:
+        data, things, entities = snapshot, None, None
+    if len(data) < _header.size:
+        raise ValueError('Not a snapshot: too short')
+    (magic, version, ncontrollers, capacity, count, nawake,
+     layout, nwalls, _, nadded, ticks) = _header.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Not a snapshot')
+    if version != VERSION:
+        raise ValueError('Unknown snapshot version {0}'.format(version))
+
+    world.activate()
+    entity = components.entity
+    store = entity._store
+    if layout != _layout(store):
+        raise ValueError('The snapshot is of a world with other entity columns or tags')
+    if things is None:
+        # look the entities up by their handles once the store is restored
+        things = dict((thing.handle, thing) for thing in entity.instances())
+        by_handle = True
+    else:
+        by_handle = False
+
+    offset = [_header.size]
+    def read(dtype, shape):
+        size = 1
+        for n in shape:
+            size *= n
+        array = numpy.frombuffer(data, dtype, size, offset[0]).reshape(shape)
+        offset[0] += array.nbytes + -array.nbytes % 8
+        return array
+
+    walls_tl = read(float, (nwalls, 2))
+    walls_br = read(float, (nwalls, 2))
+    if not (numpy.array_equal(walls_tl, world.walls_tl) and numpy.array_equal(walls_br, world.walls_br)):
+        raise ValueError('The snapshot is of a world with other walls')
+    records = read(_controller, (ncontrollers,))
+
+    arrays = [read(array.dtype, shape) for array, shape in zip(store.state(), store.state_shapes(capacity))]
+    if by_handle:
+        id_of = arrays[-3][:count]
+        handles = arrays[-2][id_of] << 32 | id_of
+        try:
+            things = [things[handle] for handle in handles.tolist()]
+        except KeyError as e:
+            raise ValueError('Entity {0} of the snapshot is not in the world'.format(e.args[0]))
+    else:
+        # the removed entities coming back hold their frames again
+        instances = entity.instances()
+        for thing, frames in snapshot.held.iteritems():
+            if not (thing.arrayid < len(instances) and instances[thing.arrayid] is thing):
+                thing.held_frames = [util.acquire_frame(frame) for frame in frames]
+
+    if store.capacity != capacity:
+        store.resize(capacity)
+    store.set_state(count, arrays)
+    instance = store['instance']
+    instance[:count] = things
+    for arrayid, thing in enumerate(things):
+        thing.arrayid = arrayid
+    entity._nawake = nawake
+    entity._sleep_epoch += 1
+    world.sweep.reset()
+
+    if entities is None:
+        added = entity.added
+        ours = numpy.nonzero(added >= 0)[0]
+        entities = entity.instances()[ours[numpy.argsort(added[ours], kind='mergesort')]]
+    world.entities = list(entities)
+    world.controlled = [thing for thing in world.entities if thing.controller is not None]
+    world.added = nadded
+    world.ticks = ticks
+    world._sleepers_epoch = None
+
+    controlled = dict((thing.handle, thing) for thing in world.controlled)
+    for record in records:
+        thing = controlled[int(record['handle'])]
+        _restore_controller(thing, record)
+
+
+def _restore_controller(thing, record):
+    controller = thing.controller
+    action = controller.action.states()[record['action']]
+    for name, value in zip(action.__saved__, record['saved']):
+        setattr(action, name, type(getattr(action, name))(value))
+    controller.action = action
+    controller.animation_event = record['event'] or None
+
+    # the sprite is in the store, only the animation's place in its frames is restored
+    animation = controller.animation
+    animation.seek(animation.state.states()[record['animation']], int(record['frame']))
@@ -2,6 +2,7 @@
 from __future__ import absolute_import, division, generators, print_function, with_statement
 
 import unittest
+import util
 from animatorium import *
 
 
@@ -46,3 +47,28 @@ class TestAnimatorium(unittest.TestCase):
                           anim.send('keyrelease'), anim.next(),
                           anim.send('keypress'), anim.next()])
 
+    def test_seek(self):
+        anim = animatorium(IdleAnimation)
+        for n in range(3):
+            anim.send('keypress' if n == 1 else None)
+        state, index = anim.state, anim.index
+        self.assertEqual(2, index)
+        expected = [anim.next() for n in range(4)]
+        anim.send('keyrelease')
+        anim.seek(state, index)
+        self.assertEqual(2, anim.frame)
+        self.assertEqual(expected, [anim.next() for n in range(4)])
+
+    def test_release(self):
+        cache = util.sprite.frame_cache
+        cache['walk'] = {'name': 'walk'}
+        try:
+            anim = animatorium(IdleAnimation)
+            walk = anim.state.next('keypress')
+            walk.hold(cache.acquire('walk'))
+            walk.hold(cache.acquire('walk'))
+            anim.release()
+            self.assertEqual(0, cache.refcount('walk'))
+            self.assertEqual((), walk.held_frames)
+        finally:
+            del cache['walk']
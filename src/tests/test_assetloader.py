@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import pygame
+import components
+import util
+from util import AssetLoader, framemeta
+
+
+class TestAssetLoader(unittest.TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        for n in range(3):
+            image = pygame.Surface((4 + n, 3), pygame.SRCALPHA, 32)
+            image.fill((n, 2, 3, 255))
+            pygame.image.save(image, os.path.join(self.datadir, 'frame{0}.png'.format(n)))
+            framemeta.save_frame(self.datadir, 'frame{0}'.format(n), (n, 0),
+                                 components.hitbox((0, 0), (1, 1)), components.hitbox((0, 0), (0, 0)))
+        self.made = []
+        self.loader = AssetLoader(make_frame=self.make_frame)
+
+    def tearDown(self):
+        self.loader.close()
+        shutil.rmtree(self.datadir)
+
+    def make_frame(self, name, size, pixels, points):
+        self.made.append((name, threading.current_thread().name))
+        self.assertEqual(size[0] * size[1] * 4, len(pixels))
+        return dict(points, name=name, size=size, pixels=pixels)
+
+    def wait_decoded(self, n):
+        for tries in range(500):
+            if self.loader.decoded.qsize() >= n:
+                return
+            time.sleep(0.01)
+        self.fail('not decoded')
+
+    def test_upload(self):
+        futures = [self.loader.load_frame(self.datadir, 'frame{0}'.format(n)) for n in range(3)]
+        self.assertIs(futures[1], self.loader.load_frame(self.datadir, 'frame1'))
+        self.assertEqual([], self.made)
+        done = []
+        futures[2].add_done_callback(done.append)
+
+        self.wait_decoded(3)
+        self.assertFalse(any(future.done() for future in futures))
+        # out of time, but one is always uploaded
+        self.assertEqual(1, self.loader.upload(budget=0))
+        self.assertEqual(2, self.loader.upload(budget=1))
+        self.assertEqual(0, self.loader.upload())
+        self.assertEqual([futures[2]], done)
+        for n, future in enumerate(futures):
+            frame = future.result()
+            self.assertEqual((4 + n, 3), frame['size'])
+            self.assertEqual([n, 0], frame['sp'].tolist())
+        self.assertEqual(set([threading.current_thread().name]), set(thread for name, thread in self.made))
+
+    def test_wait(self):
+        future = self.loader.load_frame(self.datadir, 'frame0')
+        frame = self.loader.wait(future)
+        self.assertIs(frame, future.result())
+        self.assertEqual('frame0', frame['name'])
+
+    def test_missing(self):
+        future = self.loader.load_frame(self.datadir, 'nothing')
+        self.assertRaises(pygame.error, self.loader.wait, future)
+        self.assertTrue(future.done())
+        self.assertRaises(pygame.error, future.result)
+        self.assertIsInstance(future.exception(), pygame.error)
+
+    def test_stand_in(self):
+        frame = self.loader.stand_in(self.datadir, 'frame2')
+        self.assertEqual('placeholder', frame['name'])
+        self.assertEqual((8, 8), frame['size'])
+        self.assertEqual([2, 0], frame['sp'].tolist())
+        self.assertEqual([1, 1], frame['hbp'].size.tolist())
+        self.assertIs(self.loader.placeholder, self.loader.placeholder)
+        self.assertRaises(KeyError, self.loader.stand_in, self.datadir, 'nothing')
+
+    def test_already_loaded(self):
+        frame = {'name': 'cached'}
+        util.sprite.frame_cache['cached'] = frame
+        try:
+            future = self.loader.load_frame(self.datadir, 'cached')
+            self.assertTrue(future.done())
+            self.assertIs(frame, future.result())
+        finally:
+            del util.sprite.frame_cache['cached']
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import unittest
+import numpy
+from util import Atlas
+
+
+class TestAtlas(unittest.TestCase):
+    def assertPacked(self, atlas, sizes, coords):
+        '''Checks that the images are inside the atlas and don't overlap.'''
+        taken = numpy.zeros((atlas.h, atlas.w), dtype=int)
+        for (w, h), place in zip(sizes, coords):
+            if place is None:
+                continue
+            x, y = place
+            self.assertTrue(0 <= x and x + w <= atlas.w and 0 <= y and y + h <= atlas.h)
+            taken[y:y + h, x:x + w] += 1
+        self.assertLessEqual(taken.max(), 1)
+        self.assertEqual(taken.sum(), atlas.used)
+
+    def test_exact_fit(self):
+        atlas = Atlas(64, 64)
+        self.assertEqual([(0, 0), (32, 0), (0, 32), (32, 32)], [atlas.add(32, 32) for n in range(4)])
+        self.assertIsNone(atlas.add(1, 1))
+        self.assertEqual(1.0, atlas.occupancy)
+
+    def test_fills_gaps(self):
+        atlas = Atlas(64, 64)
+        self.assertEqual((0, 0), atlas.add(40, 30))
+        self.assertEqual((40, 0), atlas.add(24, 10))
+        # lower under the short one than on top of the tall one
+        self.assertEqual((40, 10), atlas.add(20, 20))
+        self.assertEqual((0, 30), atlas.add(64, 34))
+        self.assertIsNone(atlas.add(64, 1))
+        self.assertEqual([[0, 64, 64]], atlas.skyline)
+
+    def test_too_big(self):
+        atlas = Atlas(64, 32)
+        self.assertIsNone(atlas.add(65, 1))
+        self.assertIsNone(atlas.add(1, 33))
+        self.assertEqual([[0, 0, 64]], atlas.skyline)
+
+    def test_random(self):
+        random = numpy.random.RandomState(3)
+        sizes = [tuple(size) for size in random.randint(1, 40, (300, 2))]
+        atlas = Atlas(256, 256)
+        self.assertPacked(atlas, sizes, [atlas.add(*size) for size in sizes])
+
+        offline = Atlas(256, 256)
+        coords = offline.add_all(sizes)
+        self.assertPacked(offline, sizes, coords)
+        self.assertGreaterEqual(offline.occupancy, atlas.occupancy)
+        self.assertGreater(offline.occupancy, 0.85)
+
+    def test_free(self):
+        atlas = Atlas(64, 64)
+        self.assertEqual([(0, 0), (32, 0), (0, 32), (32, 32)], [atlas.add(32, 32) for n in range(4)])
+        atlas.free(32, 0, 32, 32)
+        self.assertEqual(0.75, atlas.occupancy)
+        # the smaller images share the freed place
+        coords = [(32, 0), (48, 0), (32, 16)]
+        self.assertEqual(coords, [atlas.add(16, 16), atlas.add(16, 8), atlas.add(32, 16)])
+        self.assertPacked(atlas, [(32, 32), (32, 32), (32, 32), (16, 16), (16, 8), (32, 16)],
+                          [(0, 0), (0, 32), (32, 32)] + coords)
+        self.assertIsNone(atlas.add(16, 16))
+
+        for x, y, w, h in [(0, 0, 32, 32), (0, 32, 32, 32), (32, 32, 32, 32),
+                           (32, 0, 16, 16), (48, 0, 16, 8), (32, 16, 32, 16)]:
+            atlas.free(x, y, w, h)
+        self.assertEqual([[0, 0, 64]], atlas.skyline)
+        self.assertEqual((0, 0), atlas.add(64, 64))
+
+
+if __name__ == '__main__':
+    unittest.main()
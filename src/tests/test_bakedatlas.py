@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+import pygame
+import components
+import util
+from util import bakedatlas, framemeta
+
+
+class TestBake(unittest.TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.path = os.path.join(self.datadir, bakedatlas.BAKED_NAME)
+        self.images = {}
+        for n, (w, h) in enumerate([(30, 20), (12, 40), (50, 30)]):
+            name = 'frame' + str(n)
+            image = pygame.Surface((w, h), pygame.SRCALPHA, 32)
+            image.fill((10 * n, 20, 30, 255))
+            image.fill((200, 100, 50, 128), pygame.Rect(0, 0, w // 2, h // 3))
+            pygame.image.save(image, os.path.join(self.datadir, name + '.png'))
+            points = {'sp': numpy.array([-n, -h]),
+                      'hbp': components.hitbox((-5, -h), (10, h)),
+                      'hba': components.hitbox((n, -3), (4, 2))}
+            framemeta.save_frame(self.datadir, name, points['sp'], points['hbp'], points['hba'])
+            self.images[name] = (image, points)
+        # an image without metadata isn't a frame
+        pygame.image.save(pygame.Surface((5, 5)), os.path.join(self.datadir, 'background.png'))
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+        for name in self.images:
+            util.sprite.frame_cache.pop(name + '/baked/flipped', None)
+
+    def test_bake(self):
+        self.assertFalse(bakedatlas.is_fresh(self.path, self.datadir))
+        self.assertEqual((2, 6), bakedatlas.bake(self.datadir, self.path, size=40))
+        self.assertTrue(bakedatlas.is_fresh(self.path, self.datadir))
+
+        with bakedatlas.BakedAtlases(self.path) as baked:
+            self.assertEqual([50, 50], baked.atlases['w'].tolist())
+            frames = dict((record['name'], record) for record in baked.frames)
+            self.assertEqual(['frame0', 'frame0/flipped', 'frame1', 'frame1/flipped', 'frame2', 'frame2/flipped'],
+                             sorted(frames))
+            for name, (image, points) in self.images.items():
+                record = frames[name]
+                w, h = image.get_size()
+                xyuv = record['xyuv']
+                self.assertEqual([w, h], xyuv[2, 0:2].tolist())
+                x, y = numpy.round(xyuv[0, 2:4] * 50).astype(int)
+                expected = numpy.frombuffer(pygame.image.tostring(image, 'RGBA'), numpy.uint8).reshape(h, w, 4)
+                self.assertTrue(numpy.array_equal(expected, baked.pixels(record['atlas'])[y:y + h, x:x + w]))
+                self.assertEqual(points['sp'].tolist(), record['sp'].tolist())
+                self.assertEqual([points['hbp'].point.tolist(), points['hbp'].size.tolist()], record['hbp'].tolist())
+
+                # the same as flipping it when loaded
+                atlas = type(str('Atlas'), (object,), {'texid': 1, 'sprites': 0})()
+                frame = dict(points, sprite=util.Sprite(atlas, numpy.array(xyuv)), name=name + '/baked')
+                flipped = util.flip_frame(frame)
+                record = frames[name + '/flipped']
+                self.assertEqual(flipped['sprite'].xyuv.tolist(), record['xyuv'].tolist())
+                self.assertEqual(flipped['sp'].tolist(), record['sp'].tolist())
+                self.assertEqual(flipped['hba'].point.tolist(), record['hba'][0].tolist())
+
+        later = os.path.getmtime(self.path) + 10
+        os.utime(os.path.join(self.datadir, framemeta.META_NAME), (later, later))
+        self.assertFalse(bakedatlas.is_fresh(self.path, self.datadir))
+
+    def test_not_baked(self):
+        with open(self.path, 'wb') as fp:
+            fp.write(b'PVRP' + b'\0' * 20)
+        self.assertRaises(ValueError, bakedatlas.BakedAtlases, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import unittest
+import numpy
+import components
+import physics
+from batch import BatchRunner, observe
+from world import World
+
+
+def make_world(index):
+    world = World([components.hitbox((-1000, 100), (2000, 100))])
+    for n in range(index + 2):
+        thing = components.entity(str(n), world.clock, location=(n * 30, -n * 10),
+                                  motion=components.motion((index - n, 0)),
+                                  hitbox_passive=components.hitbox((0, 0), (20, 20)))
+        components.physics(thing)
+        physics.add_friction(thing, 0.5)
+        world.add(thing)
+    return world
+
+
+class TestBatchRunner(unittest.TestCase):
+    def test_same_as_serial(self):
+        worlds = [make_world(n) for n in range(3)]
+        expected = numpy.zeros((3, 8, 6))
+        try:
+            for tick in range(20):
+                for world in worlds:
+                    world.step()
+            for n, world in enumerate(worlds):
+                self.assertEqual(n + 2, observe(world, expected[n]))
+        finally:
+            for world in worlds:
+                world.close()
+
+        runner = BatchRunner(make_world, 3, processes=2, capacity=8)
+        try:
+            for tick in range(20):
+                self.assertEqual({}, runner.step())
+            self.assertEqual([2, 3, 4], runner.counts.tolist())
+            self.assertEqual(expected.tolist(), runner.observations.tolist())
+        finally:
+            runner.close()
+
+    def test_worker_error(self):
+        self.assertRaises(RuntimeError, BatchRunner, int, 2, processes=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
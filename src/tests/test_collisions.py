@@ -0,0 +1,465 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import unittest
+import numpy
+import broadphase
+import collisions
+from itertools import izip
+
+
+def random_boxes(n, seed, world=400.0, size=40.0):
+    '''Returns (tl, br) of n random boxes. Coordinates are
+    rounded to halves, so there are plenty of exactly touching boxes.'''
+    rnd = numpy.random.RandomState(seed)
+    tl = numpy.round(rnd.uniform(0, world, (n, 2)) * 2) / 2
+    br = tl + numpy.round(rnd.uniform(1, size, (n, 2)) * 2) / 2
+    return tl, br
+
+
+def reference_passive_passive(motion_v, passive_tl, passive_br):
+    '''The original all-pairs, one-entity-at-a-time implementation.'''
+    nthings = len(motion_v)
+    adjust = numpy.zeros((nthings, 2))
+    diffs = numpy.zeros((nthings, 4))
+    sides = numpy.zeros((nthings, 4), dtype=bool)
+    received_v = numpy.array(motion_v)
+    done_impulse = 0.0
+    ppcollisions = collisions.passive_passive_collisions(passive_tl, passive_br)
+    dv = numpy.empty((4,))
+    for n, collisions_one in enumerate(ppcollisions):
+        collideswith_indices = numpy.nonzero(collisions_one)[0]
+        if len(collideswith_indices) == 1:
+            continue
+        diff_one = diffs[n]
+        side_one = sides[n]
+        v_one = motion_v[n]
+        other_tl = numpy.take(passive_tl, collideswith_indices, axis=0)
+        other_br = numpy.take(passive_br, collideswith_indices, axis=0)
+        side, diff = collisions.complete_collision(passive_tl[n], passive_br[n], other_tl, other_br)
+        for s, d, m in izip(side, diff, collideswith_indices):
+            if n == m:
+                continue
+            numpy.subtract(v_one, motion_v[m], out=dv[::2])
+            numpy.negative(dv[::2], out=dv[1::2])
+            if dv[s] < 0:
+                ax = s // 2
+                received_v[m, ax] = v_one[ax]
+                done_impulse += abs(v_one[ax])
+                if not side_one[s] or abs(d) > abs(diff_one[s]):
+                    side_one[s] = True
+                    diff_one[s] = d
+    numpy.sum(diffs.reshape(-1, 2, 2), out=adjust, axis=2)
+    motion_v[:] = received_v
+    return adjust, sides, done_impulse
+
+
+def reference_walls(motion_v, passive_tl, passive_br, walls_tl, walls_br):
+    '''The original one-entity-at-a-time implementation.'''
+    pwcollisions = collisions.passive_walls_collisions(passive_tl, passive_br, walls_tl, walls_br)
+    diffs = numpy.zeros((len(motion_v), 4))
+    sides = numpy.zeros((len(motion_v), 4), dtype=bool)
+    for n, collisions_one in enumerate(pwcollisions):
+        collideswith_indices = numpy.nonzero(collisions_one)[0]
+        if len(collideswith_indices) == 0:
+            continue
+        w_tl = numpy.take(walls_tl, collideswith_indices, axis=0)
+        w_br = numpy.take(walls_br, collideswith_indices, axis=0)
+        side, diff = collisions.complete_collision(passive_tl[n], passive_br[n], w_tl, w_br)
+        for s, d in izip(side, diff):
+            if not sides[n, s] or abs(d) > abs(diffs[n, s]):
+                sides[n, s] = True
+                diffs[n, s] = d
+    return numpy.sum(diffs.reshape(-1, 2, 2), axis=2), sides
+
+
+class TestGridPairs(unittest.TestCase):
+    def check(self, tl, br, cell_size=None):
+        expected = numpy.transpose(numpy.nonzero(numpy.triu(
+            collisions.passive_passive_collisions(tl, br), 1)))
+        pairs = broadphase.grid_pairs(tl, br, cell_size)
+        self.assertEqual(expected.tolist(), pairs.tolist())
+
+    def test_random(self):
+        for seed in range(5):
+            self.check(*random_boxes(200, seed))
+
+    def test_cell_sizes(self):
+        tl, br = random_boxes(100, 42)
+        for cell_size in (1.0, 7.5, 40.0, 1000.0):
+            self.check(tl, br, cell_size)
+
+    def test_touching(self):
+        tl = numpy.array([[0.0, 0.0], [10.0, 0.0], [20.0, 10.0]])
+        br = numpy.array([[10.0, 10.0], [20.0, 10.0], [30.0, 20.0]])
+        self.assertEqual([[0, 1], [1, 2]], broadphase.grid_pairs(tl, br, 10.0).tolist())
+
+    def test_few(self):
+        self.assertEqual((0, 2), broadphase.grid_pairs(numpy.zeros((0, 2)), numpy.zeros((0, 2))).shape)
+        self.assertEqual((0, 2), broadphase.grid_pairs(numpy.zeros((1, 2)), numpy.ones((1, 2))).shape)
+
+    def test_groups(self):
+        tl, br = random_boxes(200, 7)
+        groups = numpy.random.RandomState(7).randint(0, 4, 200)
+        expected = numpy.transpose(numpy.nonzero(numpy.triu(
+            collisions.passive_passive_collisions(tl, br, groups), 1)))
+        pairs = broadphase.grid_pairs(*broadphase.separate_groups(tl, br, groups))
+        self.assertEqual(expected.tolist(), pairs.tolist())
+        self.assertTrue(numpy.all(groups[pairs[:, 0]] == groups[pairs[:, 1]]))
+
+
+class TestSweepAndPrune(unittest.TestCase):
+    def test_moving(self):
+        tl, br = random_boxes(200, 7)
+        sweep = broadphase.SweepAndPrune()
+        rnd = numpy.random.RandomState(7)
+        for tick in range(10):
+            self.assertEqual(broadphase.grid_pairs(tl, br).tolist(), sweep.pairs(tl, br).tolist())
+            delta = numpy.round(rnd.uniform(-3, 3, tl.shape))
+            tl += delta
+            br += delta
+
+    def test_insert_remove(self):
+        tl, br = random_boxes(50, 8)
+        sweep = broadphase.SweepAndPrune()
+        sweep.pairs(tl, br)
+        for index in (49, 0, 20, 20):
+            sweep.remove(index)
+            tl = numpy.delete(tl, index, axis=0)
+            br = numpy.delete(br, index, axis=0)
+            self.assertEqual(broadphase.grid_pairs(tl, br).tolist(), sweep.pairs(tl, br).tolist())
+        new_tl, new_br = random_boxes(3, 9)
+        for n in range(3):
+            sweep.insert(len(tl))
+            tl = numpy.append(tl, new_tl[n:n + 1], axis=0)
+            br = numpy.append(br, new_br[n:n + 1], axis=0)
+            self.assertEqual(broadphase.grid_pairs(tl, br).tolist(), sweep.pairs(tl, br).tolist())
+
+    def test_permute(self):
+        tl, br = random_boxes(50, 10)
+        sweep = broadphase.SweepAndPrune()
+        sweep.pairs(tl, br)
+        slots = numpy.array([3, 40, 7, 12, 30])
+        sources = numpy.array([40, 7, 3, 30, 12])
+        tl[slots] = tl[sources]
+        br[slots] = br[sources]
+        sweep.permute(slots, sources)
+        # still sorted, without sorting again
+        left = tl[sweep.order, 0]
+        self.assertTrue(numpy.all(left[1:] >= left[:-1]))
+        self.assertEqual(broadphase.grid_pairs(tl, br).tolist(), sweep.pairs(tl, br).tolist())
+        # only the first 45 take part, as when the rest fell asleep
+        self.assertEqual(broadphase.grid_pairs(tl[:45], br[:45]).tolist(),
+                         sweep.pairs(tl[:45], br[:45]).tolist())
+
+    def test_permute_unknown(self):
+        # a box it has never seen moves in, e.g. a new entity woken up
+        tl, br = random_boxes(30, 11)
+        sweep = broadphase.SweepAndPrune()
+        sweep.pairs(tl[:20], br[:20])
+        sweep.reset()
+        sweep.pairs(tl[:20], br[:20])
+        slots = numpy.array([5, 25])
+        sources = numpy.array([25, 5])
+        tl[slots] = tl[sources]
+        br[slots] = br[sources]
+        sweep.permute(slots, sources)
+        self.assertEqual(broadphase.grid_pairs(tl[:20], br[:20]).tolist(),
+                         sweep.pairs(tl[:20], br[:20]).tolist())
+
+
+class TestConnectedComponents(unittest.TestCase):
+    def test_chain(self):
+        pairs = numpy.array([[5, 6], [0, 3], [3, 4], [1, 6]])
+        count, labels = broadphase.connected_components(8, pairs)
+        self.assertEqual(4, count)
+        self.assertEqual([0, 1, 2, 0, 0, 1, 1, 3], labels.tolist())
+
+    def test_no_pairs(self):
+        count, labels = broadphase.connected_components(3, numpy.empty((0, 2), dtype=int))
+        self.assertEqual(3, count)
+        self.assertEqual([0, 1, 2], labels.tolist())
+
+    def test_random(self):
+        tl, br = random_boxes(300, 3)
+        pairs = broadphase.grid_pairs(tl, br)
+        count, labels = broadphase.connected_components(300, pairs)
+        self.assertTrue(numpy.all(labels[pairs[:, 0]] == labels[pairs[:, 1]]))
+        # a component is spread by its pairs from its smallest node
+        reached = labels == labels[0]
+        for n in range(300):
+            reached[pairs[reached[pairs[:, 0]], 1]] = True
+            reached[pairs[reached[pairs[:, 1]], 0]] = True
+        self.assertEqual((labels == labels[0]).tolist(), reached.tolist())
+
+    def test_small_graphs(self):
+        # the union-find for small graphs gives the same labels as the numpy loop
+        limit = broadphase.SMALL_GRAPH_EDGES
+        for seed in range(10):
+            n = 5 + seed * 10
+            tl, br = random_boxes(n, seed, world=100.0 + seed * 20)
+            pairs = broadphase.grid_pairs(tl, br)
+            self.assertLessEqual(len(pairs), limit)
+            small = broadphase.connected_components(n, pairs)
+            broadphase.SMALL_GRAPH_EDGES = -1
+            try:
+                expected = broadphase.connected_components(n, pairs)
+            finally:
+                broadphase.SMALL_GRAPH_EDGES = limit
+            self.assertEqual(expected[0], small[0])
+            self.assertEqual(expected[1].tolist(), small[1].tolist())
+            self.assertEqual(expected[1].tolist(), broadphase.connected_components(n, pairs[::-1])[1].tolist())
+
+
+class TestAABBTree(unittest.TestCase):
+    def check(self, tl, br, walls_tl, walls_br):
+        expected = numpy.transpose(numpy.nonzero(
+            collisions.passive_walls_collisions(tl, br, walls_tl, walls_br)))
+        tree = broadphase.AABBTree(walls_tl, walls_br)
+        self.assertEqual(expected.tolist(), tree.query(tl, br).tolist())
+
+    def test_random(self):
+        tl, br = random_boxes(100, 1)
+        for nwalls in (1, 2, 3, 50, 333):
+            self.check(tl, br, *random_boxes(nwalls, nwalls, size=80.0))
+
+    def test_overlapping(self):
+        tl, br = random_boxes(300, 2, world=100.0)
+        other_tl, other_br = random_boxes(300, 3, world=100.0)
+        expected = [bool(numpy.all(tl1 <= br2) and numpy.all(tl2 <= br1))
+                    for tl1, br1, tl2, br2 in izip(tl, br, other_tl, other_br)]
+        self.assertTrue(any(expected))
+        self.assertFalse(all(expected))
+        self.assertEqual(expected, broadphase.overlapping(tl, br, other_tl, other_br).tolist())
+
+    def test_empty(self):
+        tl, br = random_boxes(10, 1)
+        tree = broadphase.AABBTree(numpy.zeros((0, 2)), numpy.zeros((0, 2)))
+        self.assertEqual((0, 2), tree.query(tl, br).shape)
+
+    def test_small_queries(self):
+        # testing every pair finds the same pairs in the same order as walking the tree
+        walls_tl, walls_br = random_boxes(40, 5, size=80.0)
+        queries = [random_boxes(n, n) for n in (1, 5, 50)]
+        tree = broadphase.AABBTree(walls_tl, walls_br)
+        tested = [tree.query(tl, br) for tl, br in queries[:2]]
+        # it's built when a query needs it
+        self.assertIsNone(tree.order)
+        tested.append(tree._query_all(*queries[2]))
+        limit = broadphase.BRUTE_FORCE_PAIRS
+        broadphase.BRUTE_FORCE_PAIRS = 0
+        try:
+            walked = [tree.query(tl, br) for tl, br in queries]
+        finally:
+            broadphase.BRUTE_FORCE_PAIRS = limit
+        self.assertIsNotNone(tree.order)
+        self.assertTrue(len(walked[2]))
+        for pairs, expected in zip(tested, walked):
+            self.assertEqual(expected.tolist(), pairs.tolist())
+
+
+
+class TestWalls(unittest.TestCase):
+    def test_same_as_reference(self):
+        for seed in range(5):
+            tl, br = random_boxes(100, seed)
+            walls_tl, walls_br = random_boxes(80, seed + 10, size=100.0)
+            v = numpy.zeros((100, 2))
+            expected = reference_walls(v, tl, br, walls_tl, walls_br)
+            for tree in (None, broadphase.AABBTree(walls_tl, walls_br)):
+                result = collisions.resolve_wall_collisions(v, tl, br, walls_tl, walls_br, tree)
+                self.assertTrue(numpy.array_equal(expected[0], result[0]))
+                self.assertTrue(numpy.array_equal(expected[1], result[1]))
+
+    def test_one_wall_each(self):
+        # boxes sunk into a floor, and some into one of two columns, each touching one wall
+        tl, br = random_boxes(60, 6, world=300.0)
+        tl[:, 1] += 380
+        br[:, 1] += 380
+        walls_tl = numpy.array([[-1000.0, 400.0], [-1000.0, -1000.0], [320.0, -1000.0]])
+        walls_br = numpy.array([[1000.0, 500.0], [-10.0, 398.0], [1000.0, 398.0]])
+        v = numpy.zeros((60, 2))
+        expected = reference_walls(v, tl, br, walls_tl, walls_br)
+        result = collisions.resolve_wall_collisions(v, tl, br, walls_tl, walls_br)
+        self.assertTrue(numpy.any(expected[1]))
+        self.assertTrue(numpy.array_equal(expected[0], result[0]))
+        self.assertTrue(numpy.array_equal(expected[1], result[1]))
+
+    def test_no_collisions(self):
+        tl = numpy.array([[0.0, 0.0]])
+        walls_tl = numpy.array([[50.0, 50.0]])
+        adjust, sides = collisions.resolve_wall_collisions(numpy.zeros((1, 2)), tl, tl + 10,
+                                                           walls_tl, walls_tl + 10)
+        self.assertFalse(numpy.any(adjust))
+        self.assertFalse(numpy.any(sides))
+        self.assertEqual((1, 2), adjust.shape)
+        self.assertEqual((1, 4), sides.shape)
+        self.assertEqual(bool, sides.dtype)
+
+    def test_complete_collision(self):
+        tl, br = random_boxes(50, 4)
+        walls_tl, walls_br = random_boxes(50, 5)
+        side, diff = collisions.complete_collision(tl, br, walls_tl, walls_br)
+        # the four ways out: moving right or left past the wall, then down or up
+        ways = numpy.array([walls_br[:, 0] - tl[:, 0], walls_tl[:, 0] - br[:, 0],
+                            walls_br[:, 1] - tl[:, 1], walls_tl[:, 1] - br[:, 1]]).T
+        shortest = numpy.argmin(numpy.abs(ways), axis=1)
+        self.assertEqual(shortest.tolist(), side.tolist())
+        self.assertEqual(ways[numpy.arange(50), shortest].tolist(), diff.tolist())
+
+
+class TestPassivePassive(unittest.TestCase):
+    def test_same_as_reference(self):
+        for seed in range(5):
+            tl, br = random_boxes(150, seed)
+            v = numpy.random.RandomState(seed).uniform(-5, 5, (150, 2))
+            v_expected = numpy.array(v)
+            expected = reference_passive_passive(v_expected, tl, br)
+            result = collisions.resolve_passive_passive_collisions(v, tl, br)
+            self.assertTrue(numpy.array_equal(expected[0], result[0]))
+            self.assertTrue(numpy.array_equal(expected[1], result[1]))
+            self.assertEqual(expected[2], result[2])
+            self.assertTrue(numpy.array_equal(v_expected, v))
+
+    def test_stacks_same_as_reference(self):
+        # columns of overlapping boxes, each touched on the same side by several others
+        tl = numpy.array([[x * 15.0 + y % 3, y * 8.0] for x in range(4) for y in range(6)])
+        br = tl + 10
+        v = numpy.zeros((len(tl), 2))
+        v[:, 1] = numpy.arange(len(tl)) % 5 - 2
+        v_expected = numpy.array(v)
+        expected = reference_passive_passive(v_expected, tl, br)
+        result = collisions.resolve_passive_passive_collisions(v, tl, br)
+        self.assertTrue(numpy.any(expected[1]))
+        self.assertTrue(numpy.array_equal(expected[0], result[0]))
+        self.assertTrue(numpy.array_equal(expected[1], result[1]))
+        self.assertEqual(expected[2], result[2])
+        self.assertTrue(numpy.array_equal(v_expected, v))
+
+    def test_no_collisions(self):
+        tl = numpy.array([[0.0, 0.0], [100.0, 0.0]])
+        v = numpy.array([[1.0, 0.0], [-1.0, 0.0]])
+        adjust, sides, done_impulse = collisions.resolve_passive_passive_collisions(v, tl, tl + 10)
+        self.assertFalse(numpy.any(adjust))
+        self.assertFalse(numpy.any(sides))
+        self.assertEqual(0.0, done_impulse)
+
+    def test_moving_apart(self):
+        # touching, but nothing runs into anything
+        tl = numpy.array([[0.0, 0.0], [10.0, 0.0], [0.0, 10.0]])
+        v = numpy.array([[-1.0, -1.0], [1.0, 0.0], [0.0, 2.0]])
+        impulses = numpy.ones((3,))
+        adjust, sides, done_impulse = collisions.resolve_passive_passive_collisions(
+            v, tl, tl + 10, impulses=impulses)
+        self.assertEqual((3, 2), adjust.shape)
+        self.assertFalse(numpy.any(adjust))
+        self.assertFalse(numpy.any(sides))
+        self.assertEqual(0.0, done_impulse)
+        self.assertEqual([1, 1, 1], impulses.tolist())
+        self.assertEqual([[-1, -1], [1, 0], [0, 2]], v.tolist())
+
+    def test_impulses(self):
+        tl, br = random_boxes(150, 3)
+        v = numpy.random.RandomState(3).uniform(-5, 5, (150, 2))
+        impulses = numpy.zeros((150,))
+        done_impulse = collisions.resolve_passive_passive_collisions(v, tl, br, impulses=impulses)[2]
+        self.assertTrue(done_impulse > 0)
+        self.assertAlmostEqual(done_impulse, impulses.sum())
+        self.assertTrue(numpy.all(impulses >= 0))
+
+
+def translator(*arrays):
+    def translate(delta):
+        for a in arrays:
+            a += delta
+    return translate
+
+
+def reference_movement(motion_v, passive_tl, passive_br, walls_tl, walls_br, translate):
+    '''The resolution loop as it was in project_viking.main - everything in one island.'''
+    grounded = numpy.zeros((len(motion_v),), dtype=bool)
+    stop = numpy.empty((len(motion_v), 2), dtype=bool)
+    adjust, sides = collisions.resolve_wall_collisions(motion_v, passive_tl, passive_br, walls_tl, walls_br)
+    numpy.logical_or.reduce(sides.reshape(-1, 2, 2), out=stop, axis=2)
+    motion_v[stop] = 0
+    translate(motion_v[:])
+    attempts = 0
+    adjust_significant = True
+    while attempts < 20 and adjust_significant:
+        adjust, sides, done_impulse = collisions.resolve_passive_passive_collisions(motion_v, passive_tl, passive_br)
+        grounded |= sides[:, 3]
+        adjust *= 0.5
+        translate(adjust)
+        adjust_significant = not numpy.allclose(adjust, 0, atol=0.125)
+        adjust_significant |= done_impulse > 0.125
+        adjust, sides = collisions.resolve_wall_collisions(motion_v, passive_tl, passive_br, walls_tl, walls_br)
+        adjust_significant |= not numpy.allclose(adjust, 0, atol=0.5)
+        translate(adjust)
+        numpy.logical_or.reduce(sides.reshape(-1, 2, 2), out=stop, axis=2)
+        motion_v[stop] = 0
+        grounded |= sides[:, 3]
+        attempts += 1
+    return grounded, attempts
+
+
+class TestResolveMovement(unittest.TestCase):
+    def setUp(self):
+        self.walls_tl = numpy.array([[-100.0, 100.0]])
+        self.walls_br = numpy.array([[1000.0, 110.0]])
+
+    def test_one_island_same_as_reference(self):
+        tl = numpy.array([[0.0, 60.0], [10.0, 70.0], [25.0, 50.0], [5.0, 40.0]])
+        br = tl + 40
+        v = numpy.array([[0.0, 2.0], [1.0, 3.0], [-2.0, 0.0], [0.0, 5.0]])
+        expected_tl, expected_br, expected_v = numpy.array(tl), numpy.array(br), numpy.array(v)
+        expected = reference_movement(expected_v, expected_tl, expected_br,
+                                      self.walls_tl, self.walls_br, translator(expected_tl, expected_br))
+        grounded, stats = collisions.resolve_movement(v, tl, br, self.walls_tl, self.walls_br,
+                                                      translator(tl, br))
+        self.assertEqual(1, stats.islands)
+        self.assertEqual(expected[1], stats.iterations)
+        self.assertEqual(expected[0].tolist(), grounded.tolist())
+        self.assertTrue(numpy.array_equal(expected_tl, tl))
+        self.assertTrue(numpy.array_equal(expected_v, v))
+
+    def test_islands_same_as_alone(self):
+        # the island of test_one_island_same_as_reference, and a copy far away moving faster,
+        # which needs other iterations and runs past the margin of the broadphase
+        tl = numpy.array([[0.0, 60.0], [10.0, 70.0], [25.0, 50.0], [5.0, 40.0]])
+        v = numpy.array([[0.0, 2.0], [1.0, 3.0], [-2.0, 0.0], [0.0, 5.0]])
+        tl = numpy.concatenate((tl, tl + (500, 0)))
+        v = numpy.concatenate((v, v * 3))
+        br = tl + 40
+        for sweep in (None, broadphase.SweepAndPrune()):
+            for island in (slice(0, 4), slice(4, 8)):
+                expected_tl, expected_br, expected_v = tl[island].copy(), br[island].copy(), v[island].copy()
+                expected = reference_movement(expected_v, expected_tl, expected_br,
+                                              self.walls_tl, self.walls_br,
+                                              translator(expected_tl, expected_br))
+                result_tl, result_br, result_v = tl.copy(), br.copy(), v.copy()
+                islands = numpy.zeros((8,), dtype=numpy.intp)
+                grounded, stats = collisions.resolve_movement(
+                    result_v, result_tl, result_br, self.walls_tl, self.walls_br,
+                    translator(result_tl, result_br), sweep=sweep, islands=islands)
+                self.assertEqual(2, stats.islands)
+                self.assertEqual([0, 0, 0, 0, 1, 1, 1, 1], islands.tolist())
+                self.assertEqual(expected[0].tolist(), grounded[island].tolist())
+                self.assertTrue(numpy.array_equal(expected_tl, result_tl[island]))
+                self.assertTrue(numpy.array_equal(expected_v, result_v[island]))
+
+    def test_settled_island_sleeps(self):
+        # two sheep running into each other, one standing on the floor far away
+        tl = numpy.array([[0.0, 60.0], [20.0, 60.0], [500.0, 60.0]])
+        br = tl + 40
+        v = numpy.array([[4.0, 0.0], [-4.0, 0.0], [0.0, 0.0]])
+        grounded, stats = collisions.resolve_movement(v, tl, br, self.walls_tl, self.walls_br,
+                                                      translator(tl, br), sweep=broadphase.SweepAndPrune())
+        self.assertEqual(2, stats.islands)
+        self.assertTrue(stats.iterations > 1)
+        self.assertEqual(3 + 2 * (stats.iterations - 1), stats.resolved)
+        self.assertEqual([True, True, True], grounded.tolist())
+        self.assertEqual([500.0, 60.0], tl[2].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
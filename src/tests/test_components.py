@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import unittest
+import numpy
+import broadphase
+import components
+import util
+
+
+class RecordingObserver(object):
+    '''Keeps a list of the entities by arrayid, like a broadphase would.'''
+    def __init__(self):
+        self.ids = []
+
+    def insert(self, index):
+        self.ids.insert(index, 'new')
+
+    def remove(self, index):
+        del self.ids[index]
+
+    def swap(self, index1, index2):
+        self.ids[index1], self.ids[index2] = self.ids[index2], self.ids[index1]
+
+    def permute(self, slots, sources):
+        ids = list(self.ids)
+        for slot, source in zip(slots, sources):
+            ids[slot] = self.ids[source]
+        self.ids = ids
+
+
+class TestSleep(unittest.TestCase):
+    def setUp(self):
+        self.observer = RecordingObserver()
+        components.entity._index_observers.append(self.observer)
+        self.things = []
+        for n in range(4):
+            self.spawn(n)
+
+    def tearDown(self):
+        components.entity._index_observers.remove(self.observer)
+        for thing in self.things:
+            thing.dispose()
+
+    def spawn(self, n):
+        thing = components.entity(str(n), location=(n * 100, 0))
+        self.observer.ids[thing.arrayid] = thing.name
+        self.things.append(thing)
+        return thing
+
+    def check_arrays(self):
+        for thing in self.things:
+            self.assertIs(thing, components.entity.instances()[thing.arrayid])
+            self.assertEqual(thing.name, self.observer.ids[thing.arrayid])
+            self.assertEqual(int(thing.name) * 100, thing.location[0])
+        nawake = components.entity._nawake
+        self.assertEqual(sorted(t.name for t in self.things if not t.sleeping),
+                         sorted(t.name for t in components.entity.instances()[:nawake]))
+
+    def test_sleep_and_wake(self):
+        self.things[1].sleep()
+        self.things[0].sleep()
+        self.assertEqual(2, components.entity._nawake)
+        self.assertTrue(self.things[1].sleeping)
+        self.assertFalse(self.things[2].sleeping)
+        self.check_arrays()
+
+        self.things[1].wake()
+        self.assertEqual(3, components.entity._nawake)
+        self.assertFalse(self.things[1].sleeping)
+        self.check_arrays()
+
+    def test_sleep_all_and_wake_all(self):
+        things = self.things
+        components.entity.sleep_all([things[2].arrayid, things[0].arrayid, things[0].arrayid])
+        self.assertEqual(2, components.entity._nawake)
+        self.assertTrue(things[0].sleeping)
+        self.assertTrue(things[2].sleeping)
+        self.check_arrays()
+
+        components.entity.wake_all([things[2].arrayid, things[1].arrayid])
+        self.assertEqual(3, components.entity._nawake)
+        self.assertFalse(things[2].sleeping)
+        self.assertTrue(things[0].sleeping)
+        self.check_arrays()
+
+    def test_sleep_epoch(self):
+        # the last awake entity and the first sleeping one don't move to change parts
+        entity = components.entity
+        last = entity.instances()[entity._nawake - 1]
+        for change in [last.sleep, last.wake,
+                       lambda: entity.sleep_all([last.arrayid]),
+                       lambda: entity.wake_all([last.arrayid])]:
+            epoch = entity._sleep_epoch
+            change()
+            self.assertNotEqual(epoch, entity._sleep_epoch)
+        self.check_arrays()
+
+    def test_spawn_and_dispose(self):
+        self.things[3].sleep()
+        thing = self.spawn(4)
+        self.assertFalse(thing.sleeping)
+        self.check_arrays()
+
+        self.things.remove(thing)
+        thing.dispose()
+        self.things[0].dispose()
+        del self.things[0]
+        self.assertEqual(2, components.entity._nawake)
+        self.check_arrays()
+
+    def test_translate_skips_sleepers(self):
+        self.things[2].sleep()
+        components.entity.translate_all(numpy.ones((components.entity._nawake, 2)))
+        self.assertEqual([200, 0], self.things[2].location.tolist())
+        self.assertEqual([301, 1], self.things[3].location.tolist())
+        self.assertEqual([301, 1], self.things[3].passive_tl.tolist())
+
+    def test_settle(self):
+        moving = numpy.array([t.name == '0' for t in components.entity.instances()])
+        for tick in range(components.SLEEP_TICKS - 1):
+            components.entity.settle(moving)
+        self.assertEqual(4, components.entity._nawake)
+        components.entity.settle(moving)
+        self.assertEqual(1, components.entity._nawake)
+        self.assertFalse(self.things[0].sleeping)
+        self.check_arrays()
+
+    def test_settle_islands(self):
+        entity = components.entity
+        by_name = dict((t.name, t) for t in self.things)
+        by_name['1'].idle_ticks = components.SLEEP_TICKS
+        by_name['3'].idle_ticks = components.SLEEP_TICKS
+        names = [t.name for t in entity.instances()[:entity._nawake]]
+        # 0 and 1 touch, so do 2 and 3, but 2 is moving
+        islands = numpy.array([int(name) // 2 for name in names])
+        moved = numpy.array([name == '2' for name in names])
+        entity.settle(moved, islands=islands)
+        self.assertEqual(['2'], [t.name for t in self.things if not t.sleeping])
+        # it went to sleep with 1, so it goes back to sleep at once when woken with it
+        self.assertEqual(components.SLEEP_TICKS, by_name['0'].idle_ticks)
+        self.check_arrays()
+
+    def test_sweep_observer(self):
+        sweep = broadphase.SweepAndPrune()
+        components.entity._index_observers.append(sweep)
+        try:
+            spawned = [self.spawn(n) for n in range(4, 8)]
+            for thing in spawned:
+                thing.hitbox_passive = components.hitbox((0, 0), (150, 10))
+            spawned[1].sleep()
+            self.things[0].sleep()
+            spawned[3].dispose()
+            self.things.remove(spawned[3])
+            nawake = components.entity._nawake
+            tl = components.entity.passive_tl[:nawake]
+            br = components.entity.passive_br[:nawake]
+            self.assertEqual(broadphase.grid_pairs(tl, br).tolist(), sweep.pairs(tl, br).tolist())
+        finally:
+            components.entity._index_observers.remove(sweep)
+
+
+class TestStore(unittest.TestCase):
+    def test_many(self):
+        things = [components.entity(str(n), location=(n, 0)) for n in range(1000)]
+        try:
+            self.assertTrue(components.entity._store.capacity >= 1000)
+            for thing in things[::3]:
+                thing.dispose()
+            alive = [thing for n, thing in enumerate(things) if n % 3]
+            for thing in alive:
+                self.assertIs(thing, components.entity.by_handle(thing.handle))
+                self.assertEqual(int(thing.name), thing.location[0])
+            self.assertRaises(KeyError, components.entity.by_handle, things[0].handle)
+            self.assertEqual(len(alive), len(components.entity.location))
+        finally:
+            for thing in alive:
+                thing.dispose()
+
+    def test_columns(self):
+        thing = components.entity('hurt', hitpoints=30)
+        try:
+            self.assertEqual(30, thing.hitpoints)
+            self.assertEqual(1.0, thing.mass)
+            components.entity.hitpoints[thing.arrayid] -= 5
+            self.assertEqual(25, thing.hitpoints)
+            self.assertRaises(ValueError, components.entity.add_column,
+                              'mass', components.column())
+            self.assertRaises(RuntimeError, components.entity.create_store)
+        finally:
+            thing.dispose()
+
+    def test_graphics(self):
+        atlas = type(str('Atlas'), (object,), {'texid': 5, 'sprites': 0})()
+        sprite = util.Sprite(atlas, numpy.zeros((4, 4), numpy.float32))
+        thing = components.entity('drawn', graphics=components.graphics(sprite, (3, 4)))
+        blank = components.entity('blank', graphics=components.graphics(None))
+        try:
+            self.assertEqual(sprite.id, thing.sprite_id)
+            self.assertEqual([3, 4], thing.sprite_anchor.tolist())
+            self.assertIs(sprite, thing.graphics.sprite)
+            self.assertEqual(-1, blank.sprite_id)
+            self.assertIsNone(blank.graphics.sprite)
+            thing.graphics.sprite = None
+            thing.graphics.anchor = (1, 2)
+            self.assertEqual(-1, thing.sprite_id)
+            self.assertEqual([1, 2], components.entity.sprite_anchor[thing.arrayid].tolist())
+        finally:
+            thing.dispose()
+            blank.dispose()
+
+    def test_float32_positions(self):
+        components.entity.create_store(position_dtype=numpy.float32)
+        try:
+            thing = components.entity('small', location=(1.5, 2))
+            self.assertEqual(numpy.float32, components.entity.location.dtype)
+            components.entity.translate_all(1)
+            self.assertEqual([2.5, 3], thing.location.tolist())
+            self.assertEqual(100, thing.hitpoints)
+            thing.dispose()
+        finally:
+            components.entity.create_store()
+
+
+class TestTags(unittest.TestCase):
+    def setUp(self):
+        self.things = [components.entity(str(n)) for n in range(5)]
+
+    def tearDown(self):
+        for thing in self.things:
+            thing.dispose()
+
+    def test_view(self):
+        thing = self.things[0]
+        thing.tags.add('red')
+        thing.tags.add('grounded')
+        self.assertIn('red', thing.tags)
+        self.assertNotIn('red', self.things[1].tags)
+        self.assertEqual(set(['red', 'grounded']), set(thing.tags))
+        thing.tags.discard('red')
+        thing.tags.discard('red')
+        self.assertEqual(['grounded'], list(thing.tags))
+        self.assertRaises(KeyError, thing.tags.remove, 'red')
+        thing.tags = ['blue']
+        self.assertEqual(['blue'], list(thing.tags))
+
+    def test_vectorized(self):
+        entity = components.entity
+        entity.set_tag('grounded', slice(0, 4), [True, False, True, False])
+        entity.set_tag('blue', [1, 2])
+        self.assertEqual([True, False, True, False, False], entity.has_tag('grounded').tolist())
+        entity.set_tag('grounded', entity.has_tag('blue'), False)
+        self.assertEqual([True, False, False, False, False], entity.has_tag('grounded').tolist())
+        self.assertIn('grounded', self.things[0].tags)
+        self.assertEqual(set(['blue']), set(self.things[2].tags))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import os
+import shutil
+import tempfile
+import unittest
+import components
+from util import framemeta
+
+
+class TestFrameMeta(unittest.TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.path = os.path.join(self.datadir, framemeta.META_NAME)
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def test_save_frame(self):
+        framemeta.save_frame(self.datadir, 'walk', (3, -40),
+                             components.hitbox((-5, -40), (10, 40)), components.hitbox((0, 0), (0, 0)))
+        framemeta.save_frame(self.datadir, 'jump', (1, 2),
+                             components.hitbox((0, 0), (1, 1)), components.hitbox((2, 3), (4, 5)))
+        framemeta.save_frame(self.datadir, 'walk', (7, -40),
+                             components.hitbox((-5, -40), (10, 40)), components.hitbox((0, 0), (0, 0)))
+
+        records = framemeta.read(self.path)
+        self.assertEqual([b'jump', b'walk'], records['name'].tolist())
+        self.assertEqual([[1, 2], [7, -40]], records['sp'].tolist())
+        self.assertEqual([[0, 0], [-5, -40]], records['hbp'][:, 0].tolist())
+
+        points = framemeta.points(framemeta.frames(self.datadir)['jump'])
+        self.assertEqual([1, 2], points['sp'].tolist())
+        self.assertEqual([2, 3], points['hba'].point.tolist())
+        self.assertEqual([4, 5], points['hba'].size.tolist())
+
+    def test_not_meta(self):
+        with open(self.path, 'wb') as fp:
+            fp.write(b'PVBA' + b'\0' * 20)
+        self.assertRaises(ValueError, framemeta.read, self.path)
+        framemeta.write(self.path, [framemeta.record('a', (0, 0), components.hitbox((0, 0), (1, 1)),
+                                                     components.hitbox((0, 0), (1, 1)))])
+        with open(self.path, 'ab') as fp:
+            fp.write(b'\0')
+        self.assertRaises(ValueError, framemeta.read, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import ctypes
+import unittest
+import numpy
+import pyglet.gl
+from util import GLBuffer
+
+
+class FakeGL(object):
+    '''Stands in for pyglet.gl, keeps buffer data stores as byte strings and counts the calls.'''
+
+    def __init__(self):
+        self.calls = []
+        self.stores = {}
+        self.bound = 0
+
+    def __getattr__(self, name):
+        if name.startswith('GL_'):
+            return getattr(pyglet.gl, name)
+        raise AttributeError(name)
+
+    def count(self, name):
+        return sum(1 for call in self.calls if call == name)
+
+    def glGenBuffers(self, n, ids):
+        ids._obj.value = len(self.stores) + 1
+        self.stores[ids._obj.value] = b''
+
+    def glGetIntegerv(self, name, value):
+        self.calls.append('glGetIntegerv')
+        ctypes.cast(value, ctypes.POINTER(ctypes.c_int))[0] = self.bound
+
+    def glBindBuffer(self, target, bufid):
+        self.bound = getattr(bufid, 'value', bufid)
+
+    def glBufferData(self, target, size, data, usage):
+        self.calls.append('glBufferData')
+        self.stores[self.bound] = b'\0' * size if data is None else ctypes.string_at(data, size)
+
+    def glBufferSubData(self, target, offset, size, data):
+        self.calls.append('glBufferSubData')
+        store = self.stores[self.bound]
+        assert offset + size <= len(store)
+        self.stores[self.bound] = store[:offset] + ctypes.string_at(data, size) + store[offset + size:]
+
+    def glGetBufferParameteriv(self, target, name, value):
+        self.calls.append('glGetBufferParameteriv')
+
+    def glGetBufferSubData(self, target, offset, size, data):
+        self.calls.append('glGetBufferSubData')
+
+    def contents(self, buf):
+        return numpy.frombuffer(self.stores[buf.bufid.value], dtype=buf.dtype)
+
+
+class TestGLBuffer(unittest.TestCase):
+    def setUp(self):
+        self.gl = FakeGL()
+
+    def test_set_and_grow(self):
+        buf = GLBuffer(4, numpy.float32, gl=self.gl)
+        buf[0:2] = numpy.array([1, 2])
+        buf[2:] = numpy.array([3, 4, 5, 6])
+        self.assertEqual(8, len(buf))
+        self.assertEqual([1, 2, 3, 4, 5, 6, 0, 0], self.gl.contents(buf).tolist())
+        self.assertEqual([2, 3], buf[1:3].tolist())
+        buf[7] = 9
+        self.assertEqual(9, self.gl.contents(buf)[7])
+        # the size and the old contents never come from the GL
+        self.assertEqual(0, self.gl.count('glGetBufferParameteriv'))
+        self.assertEqual(0, self.gl.count('glGetBufferSubData'))
+        self.assertRaises(IndexError, buf.__getitem__, 8)
+
+    def test_stream(self):
+        buf = GLBuffer(usage=pyglet.gl.GL_STREAM_DRAW, gl=self.gl)
+        self.assertEqual(3, buf.stream(numpy.arange(3)))
+        self.assertEqual([0, 1, 2], self.gl.contents(buf).tolist())
+        self.assertEqual(2, buf.stream([7, 8]))
+        self.assertEqual(3, len(buf))
+        self.assertEqual([7, 8], self.gl.contents(buf)[:2].tolist())
+        self.assertEqual([7, 8], buf[0:2].tolist())
+        self.assertEqual([0], buf[2].tolist())
+        # each one orphans the old store and fills the new one
+        self.assertEqual(2, self.gl.count('glBufferData'))
+        self.assertEqual(2, self.gl.count('glBufferSubData'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import ctypes
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+import pygame
+import components
+import util
+from util import Atlas, AssetLoader, LRUCache, framemeta
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_lru(self):
+        cache = LRUCache()
+        for key in 'abcd':
+            cache[key] = key.upper()
+        self.assertEqual('B', cache['b'])
+        self.assertRaises(KeyError, lambda: cache['e'])
+        self.assertEqual(['a', 'c', 'd', 'b'], cache.evictable())
+
+        self.assertEqual('C', cache.acquire('c'))
+        cache.acquire('c')
+        cache.acquire('a')
+        self.assertEqual(['d', 'b'], cache.evictable())
+        cache.release('c')
+        self.assertEqual(1, cache.refcount('c'))
+        cache.release('c')
+        cache.release('a')
+        self.assertEqual(['a', 'c', 'd', 'b'], cache.evictable())
+
+        self.assertEqual('A', cache.evict('a'))
+        self.assertNotIn('a', cache)
+        self.assertEqual(3, len(cache))
+        self.assertEqual((1, 1, 1), (cache.hits, cache.misses, cache.evicted))
+        self.assertEqual(0.5, cache.hit_rate)
+
+
+class FakeAtlas(Atlas):
+    '''An atlas without a texture.'''
+
+    def __init__(self, w, h):
+        super(FakeAtlas, self).__init__(w, h)
+        self.texid = 1
+        self.sprites = 0
+        self.deleted = False
+
+    def delete(self):
+        self.deleted = True
+
+
+class TestEviction(unittest.TestCase):
+    def setUp(self):
+        self.budget = util.sprite.texture_budget
+        self.frames = util.sprite.frame_cache
+        self.cache = util.sprite.frame_cache = LRUCache()
+        self.atlas = FakeAtlas(64, 64)
+
+    def tearDown(self):
+        util.sprite.texture_budget = self.budget
+        util.sprite.frame_cache = self.cache = self.frames
+
+    def add(self, name, w, h):
+        coords = self.atlas.add(w, h)
+        sprite = util.Sprite(self.atlas, numpy.zeros((4, 4), numpy.float32), region=coords + (w, h))
+        return util.add_frame(name, sprite, {'sp': numpy.zeros(2),
+                                             'hbp': components.hitbox((0, 0), (w, h)),
+                                             'hba': components.hitbox((0, 0), (0, 0))})
+
+    def test_evict(self):
+        walk, jump = self.add('walk', 32, 32), self.add('jump', 32, 32)
+        self.cache.acquire('walk')
+        flipped = util.flip_frame(walk)
+        self.assertIs(walk['sprite'], flipped['sprite'].base)
+        util.release_frame(walk)
+        self.assertEqual(0.5, self.atlas.occupancy)
+
+        # nothing needs to be evicted under the budget
+        self.assertEqual(0, util.evict_frames())
+        util.sprite.texture_budget = 0
+        self.assertEqual(2, util.evict_frames(1))
+        self.assertEqual(['walk/flipped'], list(self.cache))
+        # kept for the flipped frame, which shows the same image
+        self.assertIs(walk['sprite'], util.sprite_table[walk['sprite'].id])
+        self.assertEqual(0.25, self.atlas.occupancy)
+        self.assertIsNone(util.sprite_table[jump['sprite'].id])
+        self.assertFalse(self.atlas.deleted)
+
+        util.release_frame(flipped)
+        self.assertEqual(1, util.evict_frames(1))
+        self.assertIsNone(util.sprite_table[walk['sprite'].id])
+        self.assertIsNone(util.sprite_table[flipped['sprite'].id])
+        self.assertEqual(0, self.atlas.sprites)
+        self.assertTrue(self.atlas.deleted)
+        self.assertEqual(3, self.cache.evicted)
+
+
+
+class TestBudget(unittest.TestCase):
+    '''Frames loaded like project_viking's spawn, into atlases without textures.'''
+
+    # names of the module's globals the test replaces
+    patched = ['empty_texture', 'texture_sub_data', 'delete_texture', 'texture_budget',
+               'atlases', 'resident_atlases', 'frame_cache', 'sprite_cache']
+
+    def setUp(self):
+        sprite = util.sprite
+        self.saved = dict((name, getattr(sprite, name)) for name in self.patched)
+        self.deleted = []
+        sprite.empty_texture = lambda size: ctypes.c_uint(1)
+        sprite.texture_sub_data = lambda *args: None
+        sprite.delete_texture = self.deleted.append
+        # two atlases, an image takes one
+        sprite.texture_budget = 2 * 512 * 512 * 4
+        sprite.atlases = []
+        sprite.resident_atlases = set()
+        sprite.frame_cache = LRUCache()
+        sprite.sprite_cache = LRUCache()
+
+        self.datadir = tempfile.mkdtemp()
+        for n in range(8):
+            image = pygame.Surface((300, 300), pygame.SRCALPHA, 32)
+            pygame.image.save(image, os.path.join(self.datadir, 'frame{0}.png'.format(n)))
+            framemeta.save_frame(self.datadir, 'frame{0}'.format(n), (0, 0),
+                                 components.hitbox((0, 0), (300, 300)), components.hitbox((0, 0), (0, 0)))
+        self.loader = AssetLoader()
+
+    def tearDown(self):
+        self.loader.close()
+        shutil.rmtree(self.datadir)
+        for name, value in self.saved.items():
+            setattr(util.sprite, name, value)
+
+    def spawn(self, name):
+        frame = self.loader.wait(self.loader.load_frame(self.datadir, name))
+        thing = components.entity(name, graphics=components.graphics(None))
+        thing.set_frame(frame)
+        thing.hold_frame(frame)
+        return thing
+
+    def test_spawn_and_kill(self):
+        sprite = util.sprite
+        alive = self.spawn('frame0')
+        for n in range(1, 8):
+            thing = self.spawn('frame{0}'.format(n))
+            self.assertLessEqual(sprite.resident_bytes(), sprite.texture_budget)
+            self.assertEqual(thing.sprite_id, thing.graphics.sprite.id)
+            alive.dispose()
+            self.assertEqual(0, sprite.frame_cache.refcount(alive.name))
+            alive = thing
+        stats = util.cache_stats()
+        self.assertLessEqual(stats['atlases'], 2)
+        self.assertEqual(6, stats['evicted'])
+
+        alive.dispose()
+        sprite.texture_budget = 0
+        self.assertEqual(2, util.evict_frames())
+        self.assertEqual(0, sprite.resident_bytes())
+        self.assertEqual(8, len(self.deleted))
+
+
+if __name__ == '__main__':
+    unittest.main()
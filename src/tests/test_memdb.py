@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import unittest
+import numpy
+from util.memdb import Table
+
+
+class TestTable(unittest.TestCase):
+    def setUp(self):
+        self.table = Table(2)
+        self.table.add_column('value', (), int)
+        self.table.add_block('pos', ['tl', 'br'], (2,), float)
+
+    def add(self, value):
+        handle = self.table.append()
+        slot = self.table.count - 1
+        self.table['value'][slot] = value
+        self.table['pos'][:, slot] = value
+        return handle
+
+    def values(self):
+        return sorted(self.table['value'][:self.table.count].tolist())
+
+    def test_grow(self):
+        handles = [self.add(n) for n in range(100)]
+        self.assertEqual(128, self.table.capacity)
+        self.assertEqual(range(100), self.values())
+        for n, handle in enumerate(handles):
+            slot = self.table.slot(handle)
+            self.assertEqual(n, self.table['value'][slot])
+            self.assertEqual([n, n], self.table['pos'][self.table.field('pos', 'br'), slot].tolist())
+
+    def test_remove(self):
+        handles = [self.add(n) for n in range(10)]
+        for n in (3, 0, 9):
+            self.table.remove(self.table.slot(handles[n]))
+        self.assertEqual([1, 2, 4, 5, 6, 7, 8], self.values())
+        for n in (3, 0, 9):
+            self.assertRaises(KeyError, self.table.slot, handles[n])
+        for n in (1, 2, 4, 5, 6, 7, 8):
+            self.assertEqual(n, self.table['value'][self.table.slot(handles[n])])
+
+    def test_reused_ids(self):
+        first = self.add(1)
+        self.table.remove(self.table.slot(first))
+        second = self.add(2)
+        self.assertNotEqual(first, second)
+        self.assertRaises(KeyError, self.table.slot, first)
+        self.assertEqual(0, self.table.slot(second))
+
+    def test_new_rows_are_zero(self):
+        self.add(5)
+        self.table.remove(0)
+        self.table.append()
+        self.assertEqual(0, self.table['value'][0])
+        self.assertEqual([[0, 0], [0, 0]], self.table['pos'][:, 0].tolist())
+
+    def test_defaults(self):
+        self.add(5)
+        self.table.add_column('hp', (), int, 100)
+        self.assertEqual(100, self.table['hp'][0])
+        self.table['hp'][0] = 1
+        self.table.remove(0)
+        self.table.append()
+        self.assertEqual([100], self.table.rows('hp').tolist())
+        self.assertEqual((2, 1, 2), self.table.rows('pos').shape)
+
+    def test_rows_are_views(self):
+        for n in range(3):
+            self.add(n)
+        self.table.rows('value')[1] = 7
+        self.table.rows('pos')[self.table.field('pos', 'br'), 2] = (8, 9)
+        self.assertEqual([0, 7, 2], self.table['value'][:3].tolist())
+        self.assertEqual([8, 9], self.table['pos'][self.table.field('pos', 'br'), 2].tolist())
+        self.assertEqual((3,), self.table.rows('value').shape)
+
+    def test_permute(self):
+        handles = [self.add(n) for n in range(6)]
+        # the same as swapping 1 with 4 and 2 with 5, then 4 with 5
+        self.table.permute(numpy.array([1, 4, 2, 5]), numpy.array([4, 2, 5, 1]))
+        self.assertEqual([0, 4, 5, 3, 2, 1], self.table['value'][:6].tolist())
+        self.assertEqual([0, 4, 5, 3, 2, 1], self.table['pos'][self.table.field('pos', 'tl'), :6, 0].tolist())
+        for n, handle in enumerate(handles):
+            self.assertEqual(n, self.table['value'][self.table.slot(handle)])
+
+    def test_state(self):
+        handles = [self.add(n) for n in range(5)]
+        saved = [array.copy() for array in self.table.state()]
+        count = self.table.count
+        self.table.remove(self.table.slot(handles[1]))
+        for n in range(20):
+            self.add(10 + n)
+        self.table.resize(len(saved[-1]))
+        self.table.set_state(count, saved)
+        self.assertEqual(range(5), self.values())
+        for n, handle in enumerate(handles):
+            self.assertEqual(n, self.table['value'][self.table.slot(handle)])
+        # the same handle is given out next
+        after = self.add(5)
+        self.table.set_state(count, saved)
+        self.assertEqual(after, self.add(5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import socket
+import time
+import unittest
+import pygame
+import animatorium
+import components
+import controls
+import events
+import physics
+import replay
+from netplay import LoopbackTransport, Session, UDPTransport
+from world import World
+
+
+FRAME = {'sprite': None, 'sp': (0, 0),
+         'hbp': components.hitbox((0, 0), (20, 20)), 'hba': components.hitbox((0, 0), (0, 0))}
+
+
+class Still(animatorium.BaseAnimationState):
+    __frames__ = [FRAME]
+
+    def __transitions__(self):
+        return {None: Still}
+
+
+class Idle(controls.BaseActionState):
+    def __init__(self):
+        super(Idle, self).__init__('idle')
+
+    def on_tick(self, entity):
+        pass
+
+    def __transitions__(self):
+        return {'right': Right, 'left': Left}
+
+
+class Right(controls.BaseActionState):
+    def __init__(self):
+        super(Right, self).__init__('right')
+
+    def on_tick(self, entity):
+        entity.motion_a[0] += 2
+
+    def __transitions__(self):
+        return {'stop': Idle, 'left': Left}
+
+
+class Left(controls.BaseActionState):
+    def __init__(self):
+        super(Left, self).__init__('left')
+
+    def on_tick(self, entity):
+        entity.motion_a[0] -= 2
+
+    def __transitions__(self):
+        return {'stop': Idle, 'right': Right}
+
+
+KEYMAP = {(pygame.K_a, pygame.KEYDOWN): 'left',
+          (pygame.K_d, pygame.KEYDOWN): 'right',
+          (pygame.K_a, pygame.KEYUP): 'stop',
+          (pygame.K_d, pygame.KEYUP): 'stop'}
+
+
+def make_world():
+    '''A world with two players and some boxes. Returns it and the players' keyboards.'''
+    world = World([components.hitbox((-1000, 100), (2000, 100))])
+    keyboards = [events.dispatcher('Keyboard 1'), events.dispatcher('Keyboard 2')]
+    for n, keyboard in enumerate(keyboards):
+        player = components.entity('Player', world.clock, keyboard, location=(n * 300, 0),
+                                   motion=components.motion(), graphics=components.graphics(None))
+        player.controller = controls.Controller(player, Idle, Still, KEYMAP)
+        physics.add_friction(player, 1.0)
+        world.add(player)
+    for n in range(4):
+        thing = components.entity('Box', world.clock, location=(50 + n * 50, -n * 20),
+                                  motion=components.motion(),
+                                  hitbox_passive=components.hitbox((0, 0), (20, 20)))
+        physics.add_friction(thing, 0.5)
+        world.add(thing)
+    return world, keyboards
+
+
+def key(type, key):
+    return pygame.event.Event(type, key=key)
+
+
+# tick -> events of each player
+SCRIPT = [{3: [key(pygame.KEYDOWN, pygame.K_d)], 30: [key(pygame.KEYUP, pygame.K_d)],
+           41: [key(pygame.KEYDOWN, pygame.K_a), key(pygame.KEYUP, pygame.K_a)]},
+          {10: [key(pygame.KEYDOWN, pygame.K_a)], 12: [key(pygame.KEYDOWN, pygame.K_d)],
+           50: [key(pygame.KEYUP, pygame.K_d)]}]
+TICKS = 70
+
+
+class TestSession(unittest.TestCase):
+    def reference(self):
+        '''The checksum with both players' events known all along.'''
+        world, keyboards = make_world()
+        try:
+            for tick in range(TICKS):
+                for player, keyboard in enumerate(keyboards):
+                    for event in SCRIPT[player].get(tick, ()):
+                        keyboard.dispatch(event)
+                world.step()
+            return replay.checksum(world)
+        finally:
+            world.close()
+
+    def play(self, transports, rounds=1000):
+        sessions = []
+        for player, transport in enumerate(transports):
+            world, keyboards = make_world()
+            sessions.append(Session(world, transport, player, keyboards))
+        try:
+            given = [set(), set()]
+            for n in range(rounds):
+                done = True
+                for player, session in enumerate(sessions):
+                    if session.tick < TICKS:
+                        tick = session.tick
+                        events = [] if tick in given[player] else SCRIPT[player].get(tick, [])
+                        given[player].add(tick)
+                        session.step(events)
+                    else:
+                        session.poll()
+                    done = done and session.tick == TICKS and session.confirmed == TICKS
+                if done:
+                    break
+            self.assertTrue(done)
+            return sessions, [replay.checksum(session.world) for session in sessions]
+        finally:
+            for session in sessions:
+                session.world.close()
+
+    def test_no_delay(self):
+        sessions, checksums = self.play(LoopbackTransport.pair())
+        self.assertEqual([self.reference()] * 2, checksums)
+
+    def test_delay(self):
+        sessions, checksums = self.play(LoopbackTransport.pair(delay=3))
+        self.assertEqual([self.reference()] * 2, checksums)
+        self.assertGreater(sessions[0].rollbacks, 0)
+        self.assertLessEqual(sessions[0].resimulated, sessions[0].rollbacks * sessions[0].window)
+
+    def test_long_delay_stalls(self):
+        sessions, checksums = self.play(LoopbackTransport.pair(delay=12))
+        self.assertEqual([self.reference()] * 2, checksums)
+        self.assertGreater(sessions[0].stalls, 0)
+
+    def test_loss(self):
+        sessions, checksums = self.play(LoopbackTransport.pair(delay=2, loss=0.3, seed=4))
+        self.assertEqual([self.reference()] * 2, checksums)
+
+
+class TestUDPTransport(unittest.TestCase):
+    def test_send(self):
+        a = UDPTransport(('127.0.0.1', 0))
+        b = UDPTransport(('127.0.0.1', 0), a.address)
+        a.remote_address = b.address
+        try:
+            self.assertEqual([], a.receive())
+            a.send(b'one')
+            a.send(b'two')
+            b.send(b'three')
+            received = []
+            for n in range(100):
+                received.extend(b.receive())
+                if len(received) == 2:
+                    break
+                time.sleep(0.01)
+            self.assertEqual([b'one', b'two'], received)
+            self.assertEqual([b'three'], a.receive())
+        finally:
+            a.close()
+            b.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import unittest
+import numpy
+import components
+import physics
+
+
+class TestBatched(unittest.TestCase):
+    '''The batched modifiers must do the same as the closures.'''
+    def setUp(self):
+        rnd = numpy.random.RandomState(0)
+        self.batched = []
+        self.closures = []
+        for n in range(20):
+            v = rnd.uniform(-15, 15, 2)
+            location = rnd.uniform(-10, 10, 2)
+            grounded = n % 2 == 0
+            for things in (self.batched, self.closures):
+                thing = components.entity(str(n), location=location,
+                                          motion=components.motion(v))
+                if grounded:
+                    thing.tags.add('grounded')
+                things.append(thing)
+
+    def tearDown(self):
+        for thing in self.batched + self.closures:
+            thing.dispose()
+
+    def run_closures(self, *modifiers):
+        for thing in self.closures:
+            for modifier in modifiers:
+                modifier(thing)
+
+    def check(self):
+        for a, b in zip(self.batched, self.closures):
+            self.assertEqual(b.motion_v.tolist(), a.motion_v.tolist())
+            self.assertEqual(b.location.tolist(), a.location.tolist())
+            self.assertEqual('grounded' in b.tags, 'grounded' in a.tags)
+
+    def test_friction_and_speed_limit(self):
+        for thing in self.batched[::3]:
+            physics.add_friction(thing, 2.0, 1.0)
+            physics.add_speed_limit(thing, (10, 5))
+        physics.apply_batched(components.entity._nawake)
+        for thing in self.closures[::3]:
+            for modifier in (physics.apply_friction(2.0, 1.0), physics.speed_limiter((10, 5))):
+                modifier(thing)
+        self.check()
+
+    def test_ground_limit(self):
+        for thing in self.batched:
+            physics.add_ground_limit(thing, 3)
+        physics.apply_batched(components.entity._nawake)
+        self.run_closures(physics.ground_limiter(3))
+        self.check()
+
+    def test_empty_groups(self):
+        # only the ground limit has anyone, the other kernels have nothing to do
+        physics.add_ground_limit(self.batched[0], 3)
+        physics.apply_batched(components.entity._nawake)
+        physics.ground_limiter(3)(self.closures[0])
+        self.check()
+
+    def test_remove(self):
+        thing = self.batched[0]
+        physics.add_friction(thing, 100)
+        physics.add_speed_limit(thing, (1, 1))
+        physics.remove_batched(thing, physics.FRICTION)
+        self.assertEqual(physics.SPEED_LIMIT, thing.modifiers)
+
+
+if __name__ == '__main__':
+    unittest.main()
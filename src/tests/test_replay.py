@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import unittest
+import io
+import pygame
+import components
+import physics
+import replay
+from world import World
+
+
+def make_world():
+    world = World([components.hitbox((-1000, 100), (2000, 100))])
+    for n in range(5):
+        thing = components.entity(str(n), world.clock, location=(n * 25, -n * 20),
+                                  motion=components.motion((3 - n, 0)),
+                                  hitbox_passive=components.hitbox((0, 0), (20, 20)))
+        physics.add_friction(thing, 0.5)
+        world.add(thing)
+    return world
+
+
+class Pusher(object):
+    '''Pushes the first entity right while a key is held.'''
+    def __init__(self, world):
+        self.thing = world.entities[0]
+        self.held = False
+        world.keyboard.add(self.on_key)
+        world.clock.add(self.on_tick)
+
+    def on_key(self, event):
+        self.held = event.type == pygame.KEYDOWN
+        return self.on_key
+
+    def on_tick(self, event):
+        if self.held:
+            self.thing.wake()
+            self.thing.motion_a[0] += 1
+        return self.on_tick
+
+
+def inputs(tick):
+    if tick % 40 == 5:
+        return [pygame.event.Event(pygame.KEYDOWN, key=pygame.K_d)]
+    if tick % 40 == 25:
+        return [pygame.event.Event(pygame.KEYUP, key=pygame.K_d)]
+    return []
+
+
+class TestReplay(unittest.TestCase):
+    def record(self, ticks=100):
+        log = io.BytesIO()
+        world = make_world()
+        Pusher(world)
+        recorder = replay.Recorder(log, world, checksum_every=10)
+        for tick in range(ticks):
+            recorder.step(inputs(tick))
+        checksum = replay.checksum(world)
+        world.close()
+        return log.getvalue(), checksum
+
+    def test_replay(self):
+        log, checksum = self.record()
+        world = make_world()
+        try:
+            Pusher(world)
+            self.assertEqual(100, replay.Replay(io.BytesIO(log), world).run())
+            self.assertEqual(checksum, replay.checksum(world))
+        finally:
+            world.close()
+
+    def test_divergence(self):
+        log, checksum = self.record()
+        world = make_world()
+        try:
+            # without the pusher the inputs do nothing
+            player = replay.Replay(io.BytesIO(log), world)
+            with self.assertRaises(replay.ReplayDivergence) as raised:
+                player.run()
+            self.assertEqual(10, raised.exception.tick)
+        finally:
+            world.close()
+
+    def test_close(self):
+        log = io.BytesIO()
+        world = make_world()
+        try:
+            replay.Recorder(log, world).close()
+            self.assertTrue(log.closed)
+        finally:
+            world.close()
+
+    def test_not_a_log(self):
+        self.assertRaises(ValueError, replay.Replay, io.BytesIO(b'PNG\x00\x00\x00\x00\x00'), None)
+        self.assertRaises(ValueError, replay.Replay, io.BytesIO(b''), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import unittest
+import numpy
+import pygame
+import animatorium
+import components
+import controls
+import physics
+import replay
+import snapshot
+import util
+from world import World
+
+
+FRAME = {'sprite': None, 'sp': (0, 0),
+         'hbp': components.hitbox((0, 0), (20, 20)), 'hba': components.hitbox((0, 0), (0, 0))}
+
+
+class Standing(animatorium.BaseAnimationState):
+    __frames__ = [FRAME] * 3
+
+    def __transitions__(self):
+        return {None: Standing, 'push': Pushing}
+
+
+class Pushing(animatorium.BaseAnimationState):
+    __frames__ = [FRAME] * 5
+
+    def __transitions__(self):
+        return {None: Pushing, 'stand': Standing}
+
+
+class Stand(controls.BaseActionState):
+    def __init__(self):
+        super(Stand, self).__init__('stand')
+
+    def on_tick(self, entity):
+        pass
+
+    def __transitions__(self):
+        return {'push': Push}
+
+
+class Push(controls.BaseActionState):
+    __saved__ = ('ticks',)
+
+    def __init__(self):
+        super(Push, self).__init__('push')
+        self.ticks = 0
+
+    def __reset__(self):
+        self.ticks = 0
+
+    def on_tick(self, entity):
+        self.ticks += 1
+        entity.motion_a[0] += 1
+        if self.ticks == 30:
+            return self.next('stand')
+
+    def __transitions__(self):
+        return {'stand': Stand}
+
+
+def make_world():
+    world = World([components.hitbox((-1000, 100), (2000, 100))])
+    for n in range(5):
+        thing = components.entity(str(n), world.clock, location=(n * 25, -n * 20),
+                                  motion=components.motion((3 - n, 0)),
+                                  hitbox_passive=components.hitbox((0, 0), (20, 20)))
+        physics.add_friction(thing, 0.5)
+        world.add(thing)
+    pusher = components.entity('Pusher', world.clock, world.keyboard, location=(-200, 0),
+                               motion=components.motion(), graphics=components.graphics(None))
+    pusher.controller = controls.Controller(pusher, Stand, Standing, {(pygame.K_d, pygame.KEYDOWN): 'push'})
+    physics.add_friction(pusher, 0.5)
+    world.add(pusher)
+    return world
+
+
+PUSH = [pygame.event.Event(pygame.KEYDOWN, key=pygame.K_d)]
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.world = make_world()
+
+    def tearDown(self):
+        self.world.close()
+
+    def run_world(self, ticks, push_at=None):
+        for tick in range(ticks):
+            self.world.step(PUSH if tick == push_at else [])
+        return replay.checksum(self.world)
+
+    def test_restore(self):
+        self.run_world(5)
+        saved = snapshot.take(self.world)
+        expected = self.run_world(50, 10)
+        pusher = self.world.controlled[0]
+        self.assertIsInstance(pusher.controller.action, Stand)
+
+        snapshot.restore(self.world, saved)
+        self.assertEqual(5, self.world.ticks)
+        self.assertIsInstance(pusher.controller.action, Stand)
+        self.assertEqual(expected, self.run_world(50, 10))
+
+    def test_restore_mid_action(self):
+        self.run_world(20, 5)
+        pusher = self.world.controlled[0]
+        self.assertEqual(15, pusher.controller.action.ticks)
+        saved = snapshot.take(self.world)
+        expected = self.run_world(30)
+        snapshot.restore(self.world, saved)
+        self.assertIsInstance(pusher.controller.action, Push)
+        self.assertEqual(15, pusher.controller.action.ticks)
+        self.assertEqual(expected, self.run_world(30))
+
+    def test_restore_data(self):
+        saved = snapshot.take(self.world).data
+        expected = self.run_world(40, 3)
+        snapshot.restore(self.world, saved)
+        self.assertEqual(expected, self.run_world(40, 3))
+
+    def test_removed_entities(self):
+        saved = snapshot.take(self.world)
+        sheep = self.world.entities[0]
+        sheep.hitpoints = 0
+        self.world.step()
+        self.assertNotIn(sheep, self.world.entities)
+        self.assertRaises(ValueError, snapshot.restore, self.world, saved.data)
+
+        snapshot.restore(self.world, saved)
+        self.assertIs(sheep, self.world.entities[0])
+        self.assertIs(sheep, components.entity.by_handle(sheep.handle))
+        self.assertEqual(100, sheep.hitpoints)
+
+    def test_removed_entities_frames(self):
+        atlas = type(str('Atlas'), (object,), {'texid': 5, 'sprites': 1})()
+        sprite = util.Sprite(atlas, numpy.zeros((4, 4), numpy.float32))
+        frame = util.acquire_frame(util.add_frame('test_snapshot/pusher', sprite, FRAME))
+        pusher = self.world.controlled[0]
+        pusher.set_frame(frame)
+        pusher.hold_frame(frame)
+        saved = snapshot.take(self.world)
+        pusher.hitpoints = 0
+        self.world.step()
+        self.assertNotIn(pusher, self.world.entities)
+        # the snapshot holds it, so the sprite keeps its id
+        self.assertEqual(1, util.sprite.frame_cache.refcount(frame['name']))
+        self.assertNotIn(frame['name'], util.sprite.frame_cache.evictable())
+
+        snapshot.restore(self.world, saved)
+        self.assertIs(pusher, self.world.controlled[0])
+        self.assertEqual(sprite.id, pusher.sprite_id)
+        self.assertIs(sprite, util.sprite_table[pusher.sprite_id])
+        self.assertEqual(2, util.sprite.frame_cache.refcount(frame['name']))
+        del saved
+        self.assertEqual(1, util.sprite.frame_cache.refcount(frame['name']))
+        pusher.dispose()
+        self.world.entities.remove(pusher)
+        self.world.controlled.remove(pusher)
+        self.assertIn(frame['name'], util.sprite.frame_cache.evictable())
+        util.sprite.frame_cache.pop(frame['name'])
+        util.free_sprite(sprite)
+
+    def test_not_a_snapshot(self):
+        self.assertRaises(ValueError, snapshot.restore, self.world, b'PVRP' + b'\0' * 60)
+        self.assertRaises(ValueError, snapshot.restore, self.world, b'')
+
+    def test_other_walls(self):
+        saved = snapshot.take(self.world)
+        other = World([components.hitbox((-1000, 200), (2000, 100))])
+        try:
+            self.assertRaises(ValueError, snapshot.restore, other, saved.data)
+        finally:
+            other.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
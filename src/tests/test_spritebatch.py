@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import ctypes
+import unittest
+import numpy
+import pyglet.gl
+from util import SpriteBatch, SpriteTable
+
+
+class RecordingGL(object):
+    '''Stands in for pyglet.gl, records the calls and what was uploaded.'''
+
+    def __init__(self):
+        self.calls = []
+        self.uploads = []
+
+    def __getattr__(self, name):
+        if name.startswith('GL_'):
+            return getattr(pyglet.gl, name)
+        if not name.startswith('gl'):
+            raise AttributeError(name)
+
+        def call(*args):
+            self.calls.append((name,) + args)
+        return call
+
+    def glGenBuffers(self, n, ids):
+        if hasattr(ids, '_obj'):
+            # a GLBuffer's, by reference
+            ids._obj.value = 100
+        else:
+            for k in range(n):
+                ids[k] = k + 1
+
+    def glBufferData(self, target, size, data, usage):
+        self.calls.append(('glBufferData', target, size))
+        if data is not None:
+            self.uploads.append((target, ctypes.string_at(data, size)))
+
+    def glBufferSubData(self, target, offset, size, data):
+        self.calls.append(('glBufferSubData', target, offset, size))
+        self.uploads.append((target, ctypes.string_at(data, size)))
+
+    def named(self, name):
+        return [call[1:] for call in self.calls if call[0] == name]
+
+
+class TestSpriteBatch(unittest.TestCase):
+    def setUp(self):
+        self.gl = RecordingGL()
+        self.batch = SpriteBatch(self.gl)
+
+    def test_one_call_per_texture(self):
+        xyuv = numpy.arange(5 * 16, dtype=numpy.float32).reshape(5, 4, 4)
+        self.batch.draw(xyuv, [3, 7, 3, 3, 7])
+        gl = self.gl
+
+        vertices = [data for target, data in gl.uploads if target == gl.GL_ARRAY_BUFFER]
+        self.assertEqual(1, len(vertices))
+        uploaded = numpy.frombuffer(vertices[0], dtype=numpy.float32).reshape(5, 4, 4)
+        self.assertTrue(numpy.array_equal(xyuv[[0, 2, 3, 1, 4]], uploaded))
+
+        self.assertEqual([(gl.GL_TEXTURE_2D, 3), (gl.GL_TEXTURE_2D, 7)], gl.named('glBindTexture'))
+        self.assertEqual([(gl.GL_TRIANGLES, 18, gl.GL_UNSIGNED_INT, 0),
+                          (gl.GL_TRIANGLES, 12, gl.GL_UNSIGNED_INT, 72)], gl.named('glDrawElements'))
+        self.assertEqual(2, self.batch.draw_calls)
+
+    def test_indices(self):
+        gl = self.gl
+        self.batch.draw(numpy.zeros((3, 4, 4), numpy.float32), [1, 1, 1])
+        self.batch.draw(numpy.zeros((10, 4, 4), numpy.float32), [1] * 10)
+        indices = [data for target, data in gl.uploads if target == gl.GL_ELEMENT_ARRAY_BUFFER]
+        self.assertEqual(1, len(indices))
+        indices = numpy.frombuffer(indices[0], dtype=numpy.uint32)
+        self.assertEqual([0, 1, 2, 0, 2, 3, 4, 5, 6, 4, 6, 7], indices[:12].tolist())
+
+        self.batch.draw(numpy.zeros((100, 4, 4), numpy.float32), [1] * 100)
+        indices = [data for target, data in gl.uploads if target == gl.GL_ELEMENT_ARRAY_BUFFER]
+        self.assertEqual(2, len(indices))
+        self.assertGreaterEqual(len(indices[1]), 100 * 6 * 4)
+
+    def test_empty(self):
+        self.batch.draw(numpy.zeros((0, 4, 4), numpy.float32), [])
+        self.assertEqual([], self.gl.named('glDrawElements'))
+        self.assertEqual(0, self.batch.draw_calls)
+
+
+class TestSpriteTable(unittest.TestCase):
+    def test_quads(self):
+        table = SpriteTable(capacity=2)
+        corners = numpy.array([[0, 0], [0, 10], [20, 10], [20, 0]], numpy.float32)
+        for n in range(5):
+            xyuv = numpy.zeros((4, 4), numpy.float32)
+            xyuv[:, 0:2] = corners * (n + 1)
+            xyuv[:, 2:4] = n / 10
+            self.assertEqual(n, table.add(None, xyuv, ctypes.c_uint(n % 2 + 1)))
+        self.assertEqual((5, 4, 4), table.xyuv.shape)
+
+        xyuv, texids = table.quads(numpy.array([4, 1, 1]), numpy.array([[0.4, 0], [10, 20], [-1.6, 0]]))
+        self.assertEqual([1, 2, 2], texids.tolist())
+        self.assertEqual((corners * 5).tolist(), xyuv[0, :, 0:2].tolist())
+        self.assertEqual((corners * 2 + (10, 20)).tolist(), xyuv[1, :, 0:2].tolist())
+        self.assertEqual((corners * 2 + (-2, 0)).tolist(), xyuv[2, :, 0:2].tolist())
+        self.assertTrue(numpy.allclose(0.1, xyuv[1:, :, 2:4]))
+        # the table itself isn't moved
+        self.assertEqual((corners * 2).tolist(), table.xyuv[1, :, 0:2].tolist())
+
+    def test_remove(self):
+        table = SpriteTable(capacity=2)
+        ids = [table.add(n, numpy.ones((4, 4), numpy.float32), n + 1) for n in range(3)]
+        table.remove(ids[1])
+        self.assertEqual(2, len(table))
+        self.assertEqual(0, table.texids[1])
+        self.assertEqual(0, table.xyuv[1].max())
+        self.assertIsNone(table[1])
+        # the id is reused, the table doesn't grow
+        self.assertEqual(1, table.add('again', numpy.ones((4, 4), numpy.float32), 7))
+        self.assertEqual(3, table.count)
+        self.assertEqual('again', table[1])
+        self.assertEqual([1, 7, 3], table.texids.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import unittest
+from util.timing import FixedStep, monotonic
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestFixedStep(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.timer = FixedStep(0.25, max_steps=5, clock=self.clock)
+
+    def test_steps(self):
+        self.clock.now += 0.625
+        self.assertEqual(2, self.timer.advance())
+        self.assertEqual(0.5, self.timer.alpha)
+        self.clock.now += 0.0625
+        self.assertEqual(0, self.timer.advance())
+        self.assertEqual(0.75, self.timer.alpha)
+        self.clock.now += 0.0625
+        self.assertEqual(1, self.timer.advance())
+
+    def test_spiral_of_death(self):
+        self.clock.now += 2.0
+        self.assertEqual(5, self.timer.advance())
+        self.assertEqual(0.75, self.timer.dropped)
+        self.clock.now += 0.25
+        self.assertEqual(1, self.timer.advance())
+
+    def test_reset(self):
+        self.clock.now += 0.5
+        self.timer.reset()
+        self.clock.now += 0.125
+        self.assertEqual(0, self.timer.advance())
+
+    def test_monotonic(self):
+        t = monotonic()
+        self.assertTrue(monotonic() >= t)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import unittest
+import pygame
+import components
+import constants
+import physics
+from world import World
+
+
+class TestWorld(unittest.TestCase):
+    def setUp(self):
+        floor = components.hitbox((-1000, 100), (2000, 100))
+        self.world = World([floor])
+
+    def tearDown(self):
+        self.world.close()
+
+    def box(self, name, x, y):
+        thing = components.entity(name, self.world.clock, location=(x, y),
+                                  motion=components.motion(),
+                                  hitbox_passive=components.hitbox((0, 0), (10, 10)))
+        components.physics(thing)
+        physics.add_friction(thing, 0.5)
+        return self.world.add(thing)
+
+    def test_fall_and_sleep(self):
+        things = [self.box(str(n), n * 20, 50) for n in range(5)]
+        for tick in range(100):
+            self.assertEqual([], self.world.step())
+        self.assertEqual(100, self.world.ticks)
+        for thing in things:
+            self.assertAlmostEqual(90, thing.location[1])
+            self.assertIn(constants.GROUNDED, thing.tags)
+            self.assertTrue(thing.sleeping)
+
+    def test_stack_sleeps(self):
+        things = [self.box(str(n), 0, 70 - n * 20) for n in range(3)]
+        for tick in range(200):
+            self.world.step()
+        self.assertEqual(0, components.entity._nawake)
+
+    def test_wake_down_a_stack(self):
+        stack = [self.box(str(n), 0, 70 - n * 20) for n in range(3)]
+        for tick in range(200):
+            self.world.step()
+        dropped = self.box('3', 0, -100)
+        while stack[-1].sleeping:
+            self.world.step()
+        # the one under it is woken on the same tick, the bottom one which stayed still
+        # went back to sleep at once
+        self.assertEqual([True, False, False], [thing.sleeping for thing in stack])
+        for tick in range(200):
+            self.world.step()
+        self.assertEqual(0, components.entity._nawake)
+        self.assertLess(dropped.location[1], stack[-1].location[1])
+
+    def test_woken_get_friction(self):
+        thing = self.box('0', 0, 50)
+        for tick in range(100):
+            self.world.step()
+        self.assertTrue(thing.sleeping)
+        # pushed while asleep, it wakes and slows down on the same tick
+        thing.motion_v[0] = 3
+        self.world.step()
+        self.assertFalse(thing.sleeping)
+        self.assertEqual(2.5, thing.motion_v[0])
+
+    def test_death(self):
+        player = self.box('Player', 0, 0)
+        sheep = self.box('Sheep', 5000, 0)
+        dead = []
+        for tick in range(1000):
+            dead.extend(self.world.step())
+        self.assertEqual([sheep], dead)
+        self.assertEqual([player], self.world.entities)
+
+    def test_respawn(self):
+        player = self.box('Player', 0, 0)
+        player.hitpoints = 0
+        self.assertEqual([player], self.world.step())
+        self.assertEqual(100, player.hitpoints)
+        self.assertEqual(list(World.RESPAWN_LOCATION), player.location.tolist())
+
+    def test_interpolation(self):
+        thing = self.box('0', 0, 0)
+        self.assertEqual([0, 0], self.world.interpolated_location(0.5)[thing.arrayid].tolist())
+        self.world.step()
+        self.world.step()
+        before, after = 1.6, 1.6 + 3.2
+        self.assertAlmostEqual(before, self.world.interpolated_location(0)[thing.arrayid, 1])
+        self.assertAlmostEqual((before + after) / 2, self.world.interpolated_location(0.5)[thing.arrayid, 1])
+        self.assertAlmostEqual(after, self.world.interpolated_location(1)[thing.arrayid, 1])
+
+    def test_inputs(self):
+        seen = []
+        def handler(event):
+            seen.append(event.key)
+            return handler
+        self.world.keyboard.add(handler)
+        self.world.step([pygame.event.Event(pygame.KEYDOWN, key=2)])
+        self.assertEqual([2], seen)
+
+
+class TestPacked(unittest.TestCase):
+    LEVEL = [((-1000, 100), (2000, 100)), ((-50, -500), (50, 600)), ((300, -500), (50, 600))]
+
+    def level(self):
+        return [components.hitbox(point, size) for point, size in self.LEVEL]
+
+    def populate(self, world, index, world_id=0):
+        # all worlds overlap, so things would collide across them if they weren't kept apart
+        for n in range(4):
+            thing = components.entity(str(n), world.clock, location=(n * 50, -n * 30),
+                                      motion=components.motion((index * 3 - n * 2, 0)),
+                                      hitbox_passive=components.hitbox((0, 0), (40, 30)))
+            physics.add_friction(thing, 0.5)
+            world.add(thing, world_id)
+
+    def run_world(self, world, ticks=60):
+        for tick in range(ticks):
+            world.step()
+        world.activate()
+        return [thing.location.tolist() for thing in world.entities]
+
+    def test_same_as_separate(self):
+        expected = []
+        for index in range(3):
+            world = World(self.level())
+            self.populate(world, index)
+            expected.extend(self.run_world(world))
+            world.close()
+
+        world = World.packed([self.level() for index in range(3)])
+        try:
+            for index in range(3):
+                self.populate(world, index, index)
+            locations = self.run_world(world)
+            for a, b in zip(expected, locations):
+                self.assertAlmostEqual(a[0], b[0])
+                self.assertAlmostEqual(a[1], b[1])
+        finally:
+            world.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,8 +2,15 @@
 from __future__ import absolute_import, division, generators, print_function, with_statement
 
 from .generic import *
+from .lrucache import *
 from .sprite import *
 from .glbuffer import *
 from .glshader import *
+from .spritebatch import *
 from .atlas import *
+from .timing import *
+from .assetloader import *
 from . import basestate
+from . import bakedatlas
+from . import framemeta
+from . import memdb
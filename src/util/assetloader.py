@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+'''
+Loads frames in the background: the images are decoded and the frame metadata
+read on a pool of threads, and the main thread, which has the OpenGL context,
+puts them in atlases a few at a time, so that it never waits for a file.
+'''
+
+import os
+import Queue
+import numpy
+import components
+from multiprocessing.pool import ThreadPool
+from . import sprite
+from .timing import monotonic
+
+
+__all__ = ['AssetLoader',
+           'AssetFuture']
+
+
+class AssetFuture(object):
+    '''A frame being loaded by an AssetLoader.'''
+
+    def __init__(self, name):
+        self.name = name
+        # how many times it's been asked for, each one holds the frame once it's loaded
+        self.requests = 1
+        self._done = False
+        self._frame = None
+        self._error = None
+        self._callbacks = []
+
+
+    def done(self):
+        '''Whether the frame has been loaded, or failed to.'''
+        return self._done
+
+
+    def result(self):
+        '''Returns the frame (see util.load_frame), None while it's not loaded yet.
+        Raises the error if loading it failed.'''
+        if self._error is not None:
+            raise self._error
+        return self._frame
+
+
+    def exception(self):
+        '''Returns the error if loading the frame failed, None otherwise.'''
+        return self._error
+
+
+    def add_done_callback(self, fn):
+        '''Calls fn(future) when the frame is loaded or failed to, on the thread which
+        uploads it (see AssetLoader.upload) - right away if that's already happened.'''
+        if self._done:
+            fn(self)
+        else:
+            self._callbacks.append(fn)
+
+
+    def _finish(self, frame=None, error=None):
+        self._frame = frame
+        self._error = error
+        self._done = True
+        callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn(self)
+
+
+def _make_frame(name, size, pixels, points):
+    '''Puts a decoded frame in an atlas and the frame cache. Needs the OpenGL context.'''
+    try:
+        frame_sprite = sprite.sprite_cache[name]
+    except KeyError:
+        frame_sprite = sprite.add_sprite(name, size, pixels)
+    return sprite.add_frame(name, frame_sprite, points)
+
+
+class AssetLoader(object):
+    '''
+    Loads frames like util.load_frame, but returns AssetFutures right away.
+    Decoded frames wait in a queue until upload is called, which should happen
+    on the main thread once a frame.
+    '''
+
+    def __init__(self, workers=2, make_frame=_make_frame):
+        '''
+        workers - how many threads decode images
+        make_frame - called by upload as make_frame(name, (w, h), RGBA bytes, points)
+                     to turn a decoded frame into a frame, e.g. a stub for tests
+        '''
+        self.pool = ThreadPool(workers)
+        self.make_frame = make_frame
+        # (name, size, pixels, points, error) of decoded frames, put there by the pool's threads
+        self.decoded = Queue.Queue()
+        # name -> AssetFuture of the frames being loaded
+        self.pending = {}
+        self._placeholder = None
+
+        # frames uploaded and time spent on them by the last upload
+        self.uploaded = 0
+        self.upload_time = 0.0
+
+
+    def load_frame(self, dir, name):
+        '''Starts loading dir/name.png and the frame's metadata, returns its AssetFuture.
+        Frames already loaded (e.g. baked, see util.load_baked_frames) are done at once.
+        Like util.load_frame, each call holds the frame until util.release_frame.'''
+        future = self.pending.get(name)
+        if future is not None:
+            future.requests += 1
+            return future
+        future = AssetFuture(name)
+        try:
+            frame = sprite.frame_cache[name]
+        except KeyError:
+            pass
+        else:
+            sprite.frame_cache.acquire(name)
+            future._finish(frame)
+            return future
+        self.pending[name] = future
+        self.pool.apply_async(self._decode, (dir, name), callback=self.decoded.put)
+        return future
+
+
+    def _decode(self, dir, name):
+        try:
+            size, pixels = sprite.decode_image(os.path.join(dir, name) + '.png')
+            points = sprite.read_points(dir, name)
+            return (name, size, pixels, points, None)
+        except Exception as e:
+            return (name, None, None, None, e)
+
+
+    def upload(self, budget=0.002):
+        '''
+        Turns decoded frames into frames until budget seconds have passed, but at
+        least one if there are any, and finishes their AssetFutures. Returns how many.
+        '''
+        start = monotonic()
+        uploaded = 0
+        while uploaded == 0 or monotonic() - start < budget:
+            try:
+                item = self.decoded.get_nowait()
+            except Queue.Empty:
+                break
+            self._finish(*item)
+            uploaded += 1
+        self.uploaded = uploaded
+        self.upload_time = monotonic() - start
+        return uploaded
+
+
+    def wait(self, future):
+        '''Uploads decoded frames until the future is done, waiting for them
+        to be decoded if need be. Returns its result.'''
+        while not future.done():
+            self._finish(*self.decoded.get())
+        return future.result()
+
+
+    def _finish(self, name, size, pixels, points, error):
+        future = self.pending.pop(name)
+        if error is not None:
+            future._finish(error=error)
+            return
+        try:
+            frame = self._hold(self.make_frame(name, size, pixels, points), future.requests)
+        except Exception as e:
+            future._finish(error=e)
+        else:
+            future._finish(frame)
+
+
+    def _hold(self, frame, count):
+        # frames of other make_frames aren't in the cache
+        if sprite.frame_cache.get(frame['name']) is frame:
+            sprite.frame_cache.acquire(frame['name'], count)
+        return frame
+
+
+    @property
+    def placeholder(self):
+        '''A frame to show while the real one loads: a small white square with no hitboxes.
+        It's held by the loader, don't release it.'''
+        if self._placeholder is None:
+            points = {'sp': numpy.zeros(2),
+                      'hbp': components.hitbox((0, 0), (0, 0)),
+                      'hba': components.hitbox((0, 0), (0, 0))}
+            self._placeholder = self._hold(
+                self.make_frame('placeholder', (8, 8), b'\xff' * (8 * 8 * 4), points), 1)
+        return self._placeholder
+
+
+    def stand_in(self, dir, name):
+        '''A frame to show while dir/name loads: the placeholder's image with the frame's
+        own sprite point and hitboxes, read right away, so that only the image changes
+        once it's loaded. It's held by the loader, like the placeholder.'''
+        frame = dict(self.placeholder)
+        frame.update(sprite.read_points(dir, name))
+        return frame
+
+
+    def close(self):
+        '''Stops the threads, after they've decoded what they've started.'''
+        self.pool.close()
+        self.pool.join()
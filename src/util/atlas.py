@@ -9,22 +9,139 @@ Provides functions for fitting images in a texture atlas.
 
 
 class Atlas(object):
-    '''Holds the world (or at least enough data to fit textures)'''
+    '''
+    Holds the world (or at least enough data to fit textures).
+
+    Images are packed with a skyline: the top edge of the space taken so far,
+    kept as segments of equal height. Each image goes on the skyline where its
+    top ends lowest, and of those where it leaves the least unused space under it.
+    Places of freed images (see free) are kept as holes, which images fill first.
+    '''
+
     def __init__(self, w, h):
         '''Create an empty atlas with space for width by height pixels'''
-        # holds how much of each column is allocated
-        self.allocated = numpy.zeros((w,), dtype=numpy.int16)
+        # [x, y, width] of the segments of the skyline, left to right
+        self.skyline = [[0, 0, w]]
+        # the lowest segment's y, so that full atlases turn images down at once
+        self.lowest = 0
+        # area taken by images
+        self.used = 0
+        # [x, y, width, height] of places freed under the skyline
+        self.holes = []
         self.w = w
         self.h = h
 
 
+    @property
+    def occupancy(self):
+        '''How much of the atlas is taken by images, from 0 to 1.'''
+        return self.used / (self.w * self.h)
+
+
     def add(self, w, h):
         '''Adds an image of size (w, h) to the atlas and returns the coordinates of the top-left
         corner as a tuple (x, y). If it can't fit, return None'''
-        cond = self.allocated <= self.h - h
-        for x in xrange(self.w - w + 1):
-            if numpy.all(cond[x:x + w]):
-                y = numpy.max(self.allocated[x:x + w])
-                self.allocated[x:x + w] = y + h
-                return (x, y)
-        return None
+        if self.holes:
+            coords = self._fill_hole(w, h)
+            if coords is not None:
+                self.used += w * h
+                return coords
+        if w > self.w or self.lowest + h > self.h:
+            return None
+        skyline = self.skyline
+        nsegments = len(skyline)
+        best = None
+        # the highest the image can go, then the best place's y
+        best_y = self.h - h
+        best_waste = 0
+        for index in xrange(nsegments):
+            x = skyline[index][0]
+            right = x + w
+            if right > self.w:
+                break
+            # the image rests on the highest segment under it,
+            # give up as soon as that's higher than the best place so far
+            y = 0
+            end = index
+            while end < nsegments and skyline[end][0] < right:
+                if skyline[end][1] > y:
+                    y = skyline[end][1]
+                    if y > best_y:
+                        break
+                end += 1
+            if y > best_y:
+                continue
+            waste = 0
+            for sx, sy, sw in skyline[index:end]:
+                waste += (y - sy) * (min(sx + sw, right) - sx)
+            if best is None or y < best_y or waste < best_waste:
+                best, best_y, best_waste = index, y, waste
+        if best is None:
+            return None
+        x = skyline[best][0]
+        self._raise(best, x, best_y + h, w)
+        self.used += w * h
+        return (x, best_y)
+
+
+    def add_all(self, sizes):
+        '''
+        Adds many images at once, the tallest first, which packs them tighter than
+        adding them in any order. Returns the coordinates of each one as add does,
+        in the order of sizes, None for the ones which didn't fit.
+        sizes - a sequence of (w, h)
+        '''
+        coords = [None] * len(sizes)
+        for n in sorted(xrange(len(sizes)), key=lambda n: (-sizes[n][1], -sizes[n][0])):
+            coords[n] = self.add(*sizes[n])
+        return coords
+
+
+    def free(self, x, y, w, h):
+        '''Frees the place of an image added at (x, y) with size (w, h) for other images.
+        Once all images are freed the atlas is empty again.'''
+        self.used -= w * h
+        if self.used == 0:
+            self.skyline = [[0, 0, self.w]]
+            self.lowest = 0
+            self.holes = []
+        else:
+            self.holes.append([x, y, w, h])
+
+
+    def _fill_hole(self, w, h):
+        '''Puts an image in the smallest hole it fits in, what's left of the hole
+        to its right and under it become two holes. Returns (x, y) or None.'''
+        best = None
+        for index, (hx, hy, hw, hh) in enumerate(self.holes):
+            if hw >= w and hh >= h and (best is None or hw * hh < best_area):
+                best, best_area = index, hw * hh
+        if best is None:
+            return None
+        hx, hy, hw, hh = self.holes.pop(best)
+        if hw > w:
+            self.holes.append([hx + w, hy, hw - w, h])
+        if hh > h:
+            self.holes.append([hx, hy + h, hw, hh - h])
+        return (hx, hy)
+
+
+    def _raise(self, index, x, top, w):
+        '''Puts a segment at height top from x to x + w on the skyline,
+        replacing the segments under it, from the one at index.'''
+        skyline = self.skyline
+        end = x + w
+        while index < len(skyline) and skyline[index][0] < end:
+            sx, sy, sw = skyline[index]
+            if sx + sw <= end:
+                del skyline[index]
+            else:
+                skyline[index] = [end, sy, sx + sw - end]
+                break
+        skyline.insert(index, [x, top, w])
+        # join segments of the same height
+        if index + 1 < len(skyline) and skyline[index + 1][1] == top:
+            skyline[index][2] += skyline.pop(index + 1)[2]
+        if index > 0 and skyline[index - 1][1] == top:
+            skyline[index - 1][2] += skyline.pop(index)[2]
+        self.lowest = min(segment[1] for segment in skyline)
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+'''
+Frames baked ahead of time into a few atlases, with all their data in one file,
+so that loading them is mapping that file and uploading each atlas at once
+instead of reading an image for every frame.
+
+The file (BAKED_NAME in the data directory) is, in little-endian:
+    header - magic 'PVBA', version (uint16), number of atlases (uint16), number of frames (uint32)
+    atlases - ATLAS_DTYPE records: width, height and where the atlas' pixels start in the file
+    frames - FRAME_DTYPE records, the flipped ones (see util.flip_frame) included,
+             named as flip_frame names them
+    the pixels of each atlas - RGBA, one byte each, rows from the top, each atlas at
+             a multiple of 16 bytes
+
+Make it with bake_atlases.py, again whenever an image or the frame metadata changes.
+'''
+
+import mmap
+import os
+import struct
+import numpy
+import pygame.image
+from . import framemeta
+from .atlas import Atlas
+
+
+MAGIC = b'PVBA'
+VERSION = 1
+BAKED_NAME = 'frames.baked'
+
+_header = struct.Struct('<4sHHI')
+
+ATLAS_DTYPE = numpy.dtype([('w', '<u4'), ('h', '<u4'), ('offset', '<u8')])
+# hitboxes are (point, size)
+FRAME_DTYPE = numpy.dtype([('name', 'S64'), ('atlas', '<u2'), ('xyuv', '<f4', (4, 4)),
+                           ('sp', '<f8', (2,)), ('hbp', '<f8', (2, 2)), ('hba', '<f8', (2, 2))])
+
+
+def quad_xyuv(place, size, atlas_size):
+    '''Returns the (4, 4) xyuv of a sprite (see util.Sprite) of the given size
+    at place in an atlas of atlas_size, all of them (x, y) pairs.'''
+    (x, y), (w, h), (atlas_w, atlas_h) = place, size, atlas_size
+    f_uv = numpy.array((x, y, x + w, y + h), dtype=numpy.float32)
+    f_uv[0::2] /= atlas_w
+    f_uv[1::2] /= atlas_h
+    f_xy = numpy.array((0, 0, w, h), dtype=numpy.float32)
+    # indices of the coordinates of the corners of the quad in the
+    # above arrays
+    indices = ((0, 1), (0, 3), (2, 3), (2, 1))
+    f_data = numpy.empty((4, 4), dtype=numpy.float32)
+    f_data[:, 0:2] = numpy.take(f_xy, indices)
+    f_data[:, 2:4] = numpy.take(f_uv, indices)
+    return f_data
+
+
+def flip_xyuv(xyuv):
+    '''Returns the xyuv of a sprite mirrored left to right.'''
+    f_data = numpy.copy(xyuv)
+    f_data[:, 2:4] = xyuv[::-1, 2:4]
+    return f_data
+
+
+def flip_point(point, size=(0, 0)):
+    '''Returns the corner of a box of the given size at point, mirrored left to right around x = 0.'''
+    return numpy.asarray(point) * (-1, 1) + numpy.asarray(size) * (-1, 0)
+
+
+def frame_names(datadir):
+    '''Returns the names of the frames in datadir, the images in its frame metadata.'''
+    if not os.path.exists(os.path.join(datadir, framemeta.META_NAME)):
+        return []
+    return sorted(name for name in framemeta.frames(datadir)
+                  if os.path.exists(os.path.join(datadir, name + '.png')))
+
+
+def is_fresh(path, datadir):
+    '''Whether the baked file at path exists and is newer than the frames in datadir.'''
+    meta = os.path.join(datadir, framemeta.META_NAME)
+    if not os.path.exists(path) or not os.path.exists(meta):
+        return False
+    baked = os.path.getmtime(path)
+    return (os.path.getmtime(meta) <= baked and
+            all(os.path.getmtime(os.path.join(datadir, name + '.png')) <= baked
+                for name in frame_names(datadir)))
+
+
+def bake(datadir, path, size=1024):
+    '''
+    Packs all frames in datadir into size by size atlases (bigger if a frame is)
+    and writes them to path. Returns the number of atlases and frames.
+    '''
+    names = frame_names(datadir)
+    images = [pygame.image.load(os.path.join(datadir, name + '.png')) for name in names]
+    meta = framemeta.frames(datadir)
+    sizes = [image.get_size() for image in images]
+    size = max([size] + [max(wh) for wh in sizes])
+
+    atlases = []
+    places = [None] * len(names)
+    left = range(len(names))
+    while left:
+        atlas = Atlas(size, size)
+        coords = atlas.add_all([sizes[n] for n in left])
+        for n, place in zip(left, coords):
+            if place is not None:
+                places[n] = (len(atlases), place)
+        atlases.append(atlas)
+        left = [n for n, place in zip(left, coords) if place is None]
+
+    pixels = [numpy.zeros((size, size, 4), dtype=numpy.uint8) for atlas in atlases]
+    frames = numpy.zeros(2 * len(names), dtype=FRAME_DTYPE)
+    for n, (name, image) in enumerate(zip(names, images)):
+        index, (x, y) = places[n]
+        w, h = sizes[n]
+        pixels[index][y:y + h, x:x + w] = numpy.frombuffer(
+            pygame.image.tostring(image, 'RGBA'), dtype=numpy.uint8).reshape(h, w, 4)
+        xyuv = quad_xyuv((x, y), (w, h), (size, size))
+        data = meta[name]
+        frame, flipped = frames[2 * n], frames[2 * n + 1]
+        frame['name'], flipped['name'] = name, name + '/flipped'
+        frame['atlas'] = flipped['atlas'] = index
+        frame['xyuv'], flipped['xyuv'] = xyuv, flip_xyuv(xyuv)
+        frame['sp'], flipped['sp'] = data['sp'], flip_point(data['sp'], (w, 0))
+        for box in ('hbp', 'hba'):
+            point, box_size = data[box]
+            frame[box], flipped[box] = (point, box_size), (flip_point(point, box_size), box_size)
+
+    records = numpy.zeros(len(atlases), dtype=ATLAS_DTYPE)
+    offset = _align(_header.size + records.nbytes + frames.nbytes)
+    for record, atlas_pixels in zip(records, pixels):
+        record['w'] = record['h'] = size
+        record['offset'] = offset
+        offset = _align(offset + atlas_pixels.nbytes)
+
+    with open(path, 'wb') as fp:
+        fp.write(_header.pack(MAGIC, VERSION, len(records), len(frames)))
+        fp.write(records.tobytes())
+        fp.write(frames.tobytes())
+        for record, atlas_pixels in zip(records, pixels):
+            fp.write(b'\0' * (int(record['offset']) - fp.tell()))
+            fp.write(atlas_pixels.tobytes())
+    return len(atlases), len(frames)
+
+
+def _align(offset):
+    return (offset + 15) // 16 * 16
+
+
+class BakedAtlases(object):
+    '''
+    A baked file mapped into memory. Nothing is copied out of it:
+    baked.atlases and baked.frames are arrays of ATLAS_DTYPE and FRAME_DTYPE records
+    and baked.pixels(n) is the n-th atlas' pixels, all valid until close.
+    '''
+
+    def __init__(self, path):
+        '''Raises ValueError if path isn't a baked file.'''
+        with open(path, 'rb') as fp:
+            self.map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self.map) < _header.size:
+                raise ValueError('Not a baked atlas file')
+            magic, version, natlases, nframes = _header.unpack_from(self.map)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError('Not a baked atlas file, or of another version')
+            self.atlases = numpy.frombuffer(self.map, ATLAS_DTYPE, natlases, _header.size)
+            self.frames = numpy.frombuffer(self.map, FRAME_DTYPE, nframes,
+                                           _header.size + self.atlases.nbytes)
+        except:
+            self.map.close()
+            raise
+
+
+    def pixels(self, index):
+        '''Returns the pixels of an atlas as an (h, w, 4) array.'''
+        record = self.atlases[index]
+        w, h = int(record['w']), int(record['h'])
+        return numpy.frombuffer(self.map, numpy.uint8, w * h * 4, int(record['offset'])).reshape(h, w, 4)
+
+
+    def close(self):
+        self.atlases = self.frames = None
+        self.map.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -38,6 +38,23 @@ class BaseState(object):
         return self.transitions.get(event)
 
 
+    def states(self):
+        '''
+        Returns a dict mapping class names to the instances of all states
+        of the state machine this state is in.
+        '''
+        if getattr(self, 'transitions', None) is None:
+            BaseState._init_transitions(self)
+        states = {}
+        pending = [self]
+        while pending:
+            state = pending.pop()
+            if state.__class__.__name__ not in states:
+                states[state.__class__.__name__] = state
+                pending.extend(state.transitions.values())
+        return states
+
+
     @staticmethod
     def _init_transitions(root):
         '''
@@ -48,8 +65,7 @@ class BaseState(object):
         while len(classes) > 0:
             cls = classes.pop()
             if cls not in instances:
-                state = cls()
-                instances[cls] = cls()
+                state = instances[cls] = cls()
                 classes.extend(state.__transitions__().values())
 
         for state in instances.values():
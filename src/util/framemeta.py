@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+'''
+Frame metadata - the sprite point and the passive and active hitboxes of frames -
+for all frames of a directory in one file (META_NAME in it), instead of a pickled
+.points file per frame (convert_points.py converts those).
+
+The file is, in little-endian:
+    header - magic 'PVFM', version (uint16), size of a record in bytes (uint16), number of frames (uint32)
+    frames - RECORD_DTYPE records sorted by name, hitboxes as (point, size)
+'''
+
+import os
+import struct
+import numpy
+import components
+
+
+MAGIC = b'PVFM'
+VERSION = 1
+META_NAME = 'frames.meta'
+
+_header = struct.Struct('<4sHHI')
+
+RECORD_DTYPE = numpy.dtype([('name', 'S64'), ('sp', '<f4', (2,)),
+                            ('hbp', '<f4', (2, 2)), ('hba', '<f4', (2, 2))])
+
+# path -> (modification time, name -> record) of files read by frames
+_cache = {}
+
+
+def read(path):
+    '''Returns all frames in a metadata file as an array of RECORD_DTYPE records,
+    so e.g. read(path)['hbp'] is the passive hitboxes of all of them.
+    Raises ValueError if it isn't one.'''
+    with open(path, 'rb') as fp:
+        data = fp.read()
+    if len(data) < _header.size:
+        raise ValueError('Not a frame metadata file')
+    magic, version, record_size, count = _header.unpack_from(data)
+    if magic != MAGIC or version != VERSION or record_size != RECORD_DTYPE.itemsize:
+        raise ValueError('Not a frame metadata file, or of another version')
+    if len(data) != _header.size + count * record_size:
+        raise ValueError('Truncated frame metadata file')
+    return numpy.frombuffer(data, RECORD_DTYPE, count, _header.size).copy()
+
+
+def write(path, records):
+    '''Writes the records to a metadata file, replacing it at once so a reader never sees half of it.'''
+    records = numpy.sort(numpy.asarray(records, dtype=RECORD_DTYPE), order='name')
+    temp = path + '.new'
+    with open(temp, 'wb') as fp:
+        fp.write(_header.pack(MAGIC, VERSION, RECORD_DTYPE.itemsize, len(records)))
+        fp.write(records.tobytes())
+    if os.path.exists(path):
+        # os.rename doesn't replace files on Windows
+        os.remove(path)
+    os.rename(temp, path)
+
+
+def record(name, sp, hbp, hba):
+    '''Returns a record of a frame, hbp and hba are components.hitbox.'''
+    r = numpy.zeros(1, dtype=RECORD_DTYPE)[0]
+    r['name'] = name
+    r['sp'] = sp
+    r['hbp'] = (hbp.point, hbp.size)
+    r['hba'] = (hba.point, hba.size)
+    return r
+
+
+def points(r):
+    '''Returns a record's data as the dict util.load_frame's frames have:
+    'sp' - the sprite point, 'hbp', 'hba' - passive and active components.hitbox.'''
+    return {'sp': numpy.array(r['sp'], dtype=float),
+            'hbp': components.hitbox(*r['hbp']),
+            'hba': components.hitbox(*r['hba'])}
+
+
+def frames(dir):
+    '''Returns the frames in dir's metadata file by name, reading it only if it's changed.
+    The records are shared, don't change them.'''
+    path = os.path.join(dir, META_NAME)
+    mtime = os.path.getmtime(path)
+    cached = _cache.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, dict((r['name'], r) for r in read(path)))
+        _cache[path] = cached
+    return cached[1]
+
+
+def save_frame(dir, name, sp, hbp, hba):
+    '''Puts one frame's data in dir's metadata file, adding to it or replacing what was there.'''
+    path = os.path.join(dir, META_NAME)
+    records = read(path) if os.path.exists(path) else numpy.zeros(0, dtype=RECORD_DTYPE)
+    records = records[records['name'] != name]
+    write(path, numpy.append(records, record(name, sp, hbp, hba)))
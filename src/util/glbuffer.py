@@ -19,15 +19,17 @@ class _GLBufferContext(object):
     and restores state on exit.'''
 
 
-    def __init__(self, bufid):
+    def __init__(self, bufid, gl=pyglet.gl):
         '''bufid - a valid OpenGL buffer object id'''
 
         self.bufid = bufid
+        self.gl = gl
         self.previd = c_uint(0)
         self.entrycount = 0
 
 
     def __enter__(self):
+        gl = self.gl
         if self.entrycount == 0:
             gl.glGetIntegerv(gl.GL_ARRAY_BUFFER_BINDING, ctypes.cast(byref(self.previd), c_intp))
             gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.bufid)
@@ -37,14 +39,17 @@ class _GLBufferContext(object):
     def __exit__(self, exc_type, exc_value, traceback):
         self.entrycount -= 1
         if self.entrycount == 0:
-            gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.previd)
+            self.gl.glBindBuffer(self.gl.GL_ARRAY_BUFFER, self.previd)
 
 
 class GLBuffer(object):
     '''Abstracts an OpenGL buffer object with a defined datatype.
-    Automatically resizes when adding data.'''
+    Automatically resizes when adding data.
 
-    def __init__(self, size=0, dtype=numpy.float32, usage=gl.GL_DYNAMIC_DRAW):
+    A copy of the contents is kept in memory (buffer.shadow), so the size is
+    known and reading or growing the buffer never waits for the GPU.'''
+
+    def __init__(self, size=0, dtype=numpy.float32, usage=gl.GL_DYNAMIC_DRAW, gl=pyglet.gl):
         '''
         size - how much storage to allocate for this buffer in advance (in items, not bytes)
         dtype - type of items in storage (float, float16, float32, int, etc.)
@@ -69,70 +74,89 @@ class GLBuffer(object):
             and used to return that data when queried by the application.
         COPY
             The data store contents are modified by reading data from the GL,
-            and used as the source for GL drawing and image specification commands.'''
+            and used as the source for GL drawing and image specification commands.
+
+        gl - the OpenGL module to call, e.g. a stub for tests'''
 
+        self.gl = gl
         self.usage = usage
         self.dtype = numpy.dtype(dtype)
+        self.shadow = numpy.zeros((size,), dtype=self.dtype)
         bufid = ctypes.c_uint(0)
         gl.glGenBuffers(1, ctypes.byref(bufid))
         self.bufid = bufid
-        self.bound = _GLBufferContext(self.bufid)
+        self.bound = _GLBufferContext(self.bufid, gl)
         if size > 0:
             with self.bound:
-                gl.glBufferData(gl.GL_ARRAY_BUFFER, size * self.dtype.itemsize,
+                gl.glBufferData(gl.GL_ARRAY_BUFFER, self.shadow.nbytes,
                                 None, self.usage)
 
 
     def __len__(self):
-        with self.bound:
-            size = c_int(0)
-            gl.glGetBufferParameteriv(gl.GL_ARRAY_BUFFER, gl.GL_BUFFER_SIZE, byref(size))
-            return size.value // self.dtype.itemsize
+        return len(self.shadow)
 
 
     def __getitem__(self, key):
-        with self.bound:
-            if isinstance(key, slice):
-                start = int(key.start)
-                stop = int(key.stop)
-            else:
-                start = int(key)
-                stop = start + 1
-            sz = len(self)
-            if start < 0 or start >= sz or stop < 0 or stop > sz or start >= stop:
-                raise IndexError
-            shape = (stop - start,)
-            a = numpy.empty(shape=shape, dtype=self.dtype)
-            gl.glGetBufferSubData(gl.GL_ARRAY_BUFFER, start * self.dtype.itemsize,
-                                  (stop - start) * self.dtype.itemsize, a.ctypes.data)
-            return a
+        if isinstance(key, slice):
+            start = int(key.start)
+            stop = int(key.stop)
+        else:
+            start = int(key)
+            stop = start + 1
+        sz = len(self)
+        if start < 0 or start >= sz or stop < 0 or stop > sz or start >= stop:
+            raise IndexError
+        return self.shadow[start:stop].copy()
 
 
     def __setitem__(self, key, value):
+        gl = self.gl
         with self.bound:
             sz = len(self)
             if isinstance(key, slice):
                 start = int(key.start) if key.start is not None else 0
-                stop = int(key.stop) if key.stop is not None else start + value.size
+                stop = int(key.stop) if key.stop is not None else start + numpy.size(value)
             else:
                 start = int(key)
                 stop = start + 1
             if start < 0 or stop < 0 or start >= stop:
                 raise IndexError
             if stop > sz:
-                newsz = max(sz * 2, stop)
-                a = numpy.empty((newsz,), dtype=self.dtype)
-                # intel dies when querying an empty buffer :[
-                if sz > 0:
-                    gl.glGetBufferSubData(gl.GL_ARRAY_BUFFER, 0,
-                                          sz * self.dtype.itemsize,
-                                          a.ctypes.data)
-                b = numpy.asarray(value).reshape(-1)
-                a[start:stop] = b
-                gl.glBufferData(gl.GL_ARRAY_BUFFER, newsz * self.dtype.itemsize,
-                                a.ctypes.data, self.usage)
+                self._grow(max(sz * 2, stop))
+                self.shadow[start:stop] = numpy.asarray(value).reshape(-1)
+                gl.glBufferData(gl.GL_ARRAY_BUFFER, self.shadow.nbytes,
+                                self.shadow.ctypes.data, self.usage)
             else:
                 a = numpy.ascontiguousarray(value, self.dtype).reshape(-1)
                 sz = min((stop - start), len(a))
+                self.shadow[start:start + sz] = a[:sz]
                 gl.glBufferSubData(gl.GL_ARRAY_BUFFER, start * self.dtype.itemsize,
                                    sz * self.dtype.itemsize, a.ctypes.data)
+
+
+    def _grow(self, size):
+        shadow = numpy.zeros((size,), dtype=self.dtype)
+        shadow[:len(self.shadow)] = self.shadow
+        self.shadow = shadow
+
+
+    def stream(self, value):
+        '''
+        Replaces the contents from the start with value, for data which changes every frame.
+        The old data store is orphaned - given up to the driver, which can keep it
+        for draws still using it and hand out a fresh one - so this never waits for them.
+        The rest of the buffer is blank, it reads as zeros.
+        Returns how many items were written.
+        '''
+        gl = self.gl
+        a = numpy.ascontiguousarray(value, self.dtype).reshape(-1)
+        if len(a) > len(self):
+            self.shadow = numpy.zeros((max(len(self) * 2, len(a)),), dtype=self.dtype)
+        self.shadow[:len(a)] = a
+        # the old data past it went with the orphaned store
+        self.shadow[len(a):] = 0
+        with self.bound:
+            gl.glBufferData(gl.GL_ARRAY_BUFFER, self.shadow.nbytes, None, self.usage)
+            if len(a) > 0:
+                gl.glBufferSubData(gl.GL_ARRAY_BUFFER, 0, a.nbytes, a.ctypes.data)
+        return len(a)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+'''
+A dict that remembers the order its items were used in and who holds them,
+so that the least recently used items nobody holds can be thrown away.
+'''
+
+from collections import OrderedDict
+
+
+__all__ = ['LRUCache']
+
+
+class LRUCache(object):
+    '''
+    Mostly like a dict, but:
+    cache[key] - marks the item as just used and counts a hit, or a miss if it's not there
+    cache.acquire(key) - adds a reference to the item
+    cache.release(key) - removes one
+    cache.evictable() - the keys of the items with no references, least recently used first
+    cache.evict(key) - removes an item and counts it as evicted
+    '''
+
+    def __init__(self):
+        # least recently used first
+        self.items = OrderedDict()
+        # key -> number of references, for the referenced items only
+        self.refs = {}
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+
+    def __getitem__(self, key):
+        try:
+            value = self.items.pop(key)
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        self.items[key] = value
+        return value
+
+
+    def __setitem__(self, key, value):
+        self.items.pop(key, None)
+        self.items[key] = value
+
+
+    def __delitem__(self, key):
+        del self.items[key]
+        self.refs.pop(key, None)
+
+
+    def pop(self, key, *default):
+        self.refs.pop(key, None)
+        return self.items.pop(key, *default)
+
+
+    def __contains__(self, key):
+        return key in self.items
+
+
+    def __len__(self):
+        return len(self.items)
+
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+    def get(self, key, default=None):
+        '''Returns an item without marking it used or counting the lookup.'''
+        return self.items.get(key, default)
+
+
+    def acquire(self, key, count=1):
+        '''Adds count references to an item and returns it, doesn't count as a lookup.'''
+        value = self.items[key]
+        self.refs[key] = self.refs.get(key, 0) + count
+        return value
+
+
+    def release(self, key):
+        '''Removes a reference added by acquire.'''
+        refs = self.refs[key] - 1
+        if refs:
+            self.refs[key] = refs
+        else:
+            del self.refs[key]
+
+
+    def refcount(self, key):
+        return self.refs.get(key, 0)
+
+
+    def evictable(self):
+        '''Returns the keys of the items with no references, least recently used first.'''
+        return [key for key in self.items if key not in self.refs]
+
+
+    def evict(self, key):
+        '''Removes an item nobody references and returns it.'''
+        assert key not in self.refs
+        self.evicted += 1
+        return self.items.pop(key)
+
+
+    @property
+    def hit_rate(self):
+        '''The part of lookups which found the item, 0 before any.'''
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
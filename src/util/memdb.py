@@ -36,3 +36,261 @@ You must be this high to enter
  |
 ---
 '''
+
+import numpy
+
+
+__all__ = ['Table']
+
+
+class Table(object):
+    '''
+    Rows of objects kept as parallel arrays - one array per attribute (column).
+
+    Columns come in two kinds:
+    - plain columns, arrays of shape (capacity,) + shape
+    - blocks, several same-typed columns in one array of shape (len(fields), capacity) + shape,
+      so that operations on neighbouring fields (e.g. all positions) are a single numpy call.
+    Use rows(name) (i.e. column[:table.count] or block[:, :table.count]) to get the rows in use.
+    Each column has a default value which new rows get.
+
+    The storage doubles when it runs out of space, so adding a row is amortized O(1).
+    Growing replaces the arrays, so don't keep the arrays around across an append -
+    get them from the table again.
+
+    Rows are removed by moving the last row in their place (O(1)), so the order of rows
+    is not kept. Each row gets a handle when it is added, which stays the same until the row
+    is removed, whatever happens to the row's place - see slot().
+    '''
+
+    def __init__(self, capacity=16):
+        self.capacity = max(int(capacity), 1)
+        self.count = 0
+        self._arrays = {}
+        # name -> index of the row axis
+        self._axis = {}
+        self._fields = {}
+        self._default = {}
+        # handle bookkeeping. A handle is (generation << 32) | id; ids get reused,
+        # generations tell apart the rows which had the same id
+        self._slot_of = numpy.zeros((self.capacity,), dtype=numpy.intp)
+        self._id_of = numpy.zeros((self.capacity,), dtype=numpy.intp)
+        self._generation = numpy.zeros((self.capacity,), dtype=numpy.int64)
+        # stack of the unused ids, the top is at capacity - count - 1
+        self._free_ids = numpy.arange(self.capacity - 1, -1, -1, dtype=numpy.intp)
+        # names of the arrays making up the table's state, see state
+        self._state_names = []
+        # capacity -> shapes of the arrays of the state, see state_shapes
+        self._state_shapes = {}
+        # describes the columns, tables with the same layout can exchange states
+        self.layout = ''
+
+
+    def add_column(self, name, shape=(), dtype=float, default=0):
+        '''Adds a column of items of the given shape and type.
+        New rows (and the rows already there) get the default value.'''
+        array = numpy.zeros((self.capacity,) + tuple(shape), dtype=dtype)
+        self._add(name, array, 0, default)
+
+
+    def add_block(self, name, fields, shape=(), dtype=float, default=0):
+        '''Adds a block of columns of the same shape and type.
+        fields - the names of the columns, in order. See field().'''
+        fields = list(fields)
+        array = numpy.zeros((len(fields), self.capacity) + tuple(shape), dtype=dtype)
+        self._add(name, array, 1, default)
+        self._fields[name] = dict((field, n) for n, field in enumerate(fields))
+
+
+    def _add(self, name, array, axis, default):
+        if name in self._arrays:
+            raise ValueError('Column {0} already exists'.format(name))
+        self._arrays[name] = array
+        self._axis[name] = axis
+        self._default[name] = default
+        array[self._rows(name, slice(0, self.count))] = default
+        self._state_names = sorted(name for name, array in self._arrays.iteritems() if array.dtype != object)
+        self._state_shapes = {}
+        self.layout = ';'.join('{0}:{1}:{2}:{3}'.format(name, self._arrays[name].dtype.str, self._axis[name],
+                                                        self._shape(name))
+                               for name in self._state_names)
+
+
+    def __contains__(self, name):
+        return name in self._arrays
+
+
+    def __getitem__(self, name):
+        '''Returns the whole array of a column or block, capacity rows long.'''
+        return self._arrays[name]
+
+
+    def field(self, block, field):
+        '''Returns the index of field in block.'''
+        return self._fields[block][field]
+
+
+    def columns(self):
+        return self._arrays.keys()
+
+
+    def rows(self, name):
+        '''Returns the part of a column (or block) which is in use.'''
+        if self._axis[name]:
+            return self._arrays[name][:, :self.count]
+        return self._arrays[name][:self.count]
+
+
+    def _shape(self, name):
+        '''The shape of a column without the row axis.'''
+        shape = list(self._arrays[name].shape)
+        del shape[self._axis[name]]
+        return tuple(shape)
+
+
+    def _grow(self, capacity):
+        self.resize(capacity)
+        # all ids were in use, the new ones go on top of the stack smallest first
+        self._free_ids[:capacity - self.count] = numpy.arange(capacity - 1, self.count - 1, -1)
+
+
+    def resize(self, capacity):
+        '''Changes the capacity, keeping the rows in use which fit.
+        Only for set_state - the table grows by itself when rows are added.'''
+        for name, array in self._arrays.items():
+            axis = self._axis[name]
+            shape = list(array.shape)
+            shape[axis] = capacity
+            resized = numpy.zeros(shape, dtype=array.dtype)
+            index = self._rows(name, slice(0, min(self.count, capacity)))
+            resized[index] = array[index]
+            self._arrays[name] = resized
+        for name in ('_slot_of', '_id_of', '_generation', '_free_ids'):
+            array = getattr(self, name)
+            resized = numpy.zeros((capacity,), dtype=array.dtype)
+            keep = min(capacity, self.capacity)
+            resized[:keep] = array[:keep]
+            setattr(self, name, resized)
+        self.capacity = capacity
+
+
+    def state(self):
+        '''
+        Returns all of the table except the object columns, as a list of arrays:
+        the non-object columns and the handle bookkeeping, each capacity rows long.
+        Tables with the same layout give the same list of arrays.
+        The arrays are the table's own - copy them to keep them. See set_state.
+        '''
+        arrays = [self._arrays[name] for name in self._state_names]
+        arrays.extend((self._slot_of, self._id_of, self._generation, self._free_ids))
+        return arrays
+
+
+    def state_shapes(self, capacity):
+        '''Returns the shapes of the arrays state() gives for a table with the given capacity.'''
+        try:
+            return self._state_shapes[capacity]
+        except KeyError:
+            pass
+        shapes = []
+        for name in self._state_names:
+            shape = list(self._shape(name))
+            shape.insert(self._axis[name], capacity)
+            shapes.append(tuple(shape))
+        shapes.extend([(capacity,)] * 4)
+        self._state_shapes[capacity] = shapes
+        return shapes
+
+
+    def set_state(self, count, arrays):
+        '''
+        Makes the table the same as the one whose state() the arrays are (copies of),
+        when it had count rows. The table must have the same layout and capacity (see resize).
+        Object columns keep what they had in the first count rows - set them afterwards.
+        '''
+        for mine, theirs in zip(self.state(), arrays):
+            mine[...] = theirs
+        for name, array in self._arrays.iteritems():
+            if array.dtype == object:
+                array[self._rows(name, slice(count, None))] = None
+        self.count = count
+
+
+    def _rows(self, name, rows):
+        '''Index expression selecting rows of a column.'''
+        return (slice(None),) * self._axis[name] + (rows,)
+
+
+    def append(self):
+        '''Adds a row of default values at the end and returns its handle.
+        The new row's slot is count - 1.'''
+        if self.count == self.capacity:
+            self._grow(self.capacity * 2)
+        slot = self.count
+        for name, array in self._arrays.iteritems():
+            array[self._rows(name, slot)] = self._default[name]
+        rowid = self._free_ids[self.capacity - self.count - 1]
+        self._slot_of[rowid] = slot
+        self._id_of[slot] = rowid
+        self.count += 1
+        return self.handle(slot)
+
+
+    def pop(self):
+        '''Removes the last row.'''
+        self.count -= 1
+        slot = self.count
+        rowid = self._id_of[slot]
+        self._generation[rowid] += 1
+        self._free_ids[self.capacity - self.count - 1] = rowid
+        for name, array in self._arrays.iteritems():
+            if array.dtype == object:
+                array[self._rows(name, slot)] = None
+
+
+    def remove(self, slot):
+        '''Removes a row by moving the last one in its place.'''
+        self.swap(slot, self.count - 1)
+        self.pop()
+
+
+    def swap(self, slot1, slot2):
+        '''Exchanges the places of two rows. Their handles remain valid.'''
+        if slot1 == slot2:
+            return
+        for name, array in self._arrays.iteritems():
+            array[self._rows(name, [slot1, slot2])] = array[self._rows(name, [slot2, slot1])]
+        id1, id2 = self._id_of[slot1], self._id_of[slot2]
+        self._id_of[slot1], self._id_of[slot2] = id2, id1
+        self._slot_of[id1], self._slot_of[id2] = slot2, slot1
+
+
+    def permute(self, slots, sources):
+        '''Moves the row at sources[k] to slots[k], like many swaps at once.
+        slots and sources must hold the same slots. Handles remain valid.'''
+        for name, array in self._arrays.iteritems():
+            if self._axis[name]:
+                array[:, slots] = array.take(sources, axis=1)
+            else:
+                array[slots] = array.take(sources, axis=0)
+        ids = self._id_of[sources]
+        self._id_of[slots] = ids
+        self._slot_of[ids] = slots
+
+
+    def handle(self, slot):
+        '''Returns the handle of the row now at slot.'''
+        rowid = self._id_of[slot]
+        return int(self._generation[rowid] << 32 | rowid)
+
+
+    def slot(self, handle):
+        '''Returns where the row with the given handle is now.
+        Raises KeyError if the row has been removed.'''
+        rowid = handle & 0xFFFFFFFF
+        if rowid >= self.capacity or self._generation[rowid] != handle >> 32:
+            raise KeyError(handle)
+        slot = self._slot_of[rowid]
+        if slot >= self.count or self._id_of[slot] != rowid:
+            raise KeyError(handle)
+        return int(slot)
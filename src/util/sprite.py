@@ -2,7 +2,6 @@
 from __future__ import absolute_import, division, generators, print_function, with_statement
 
 
-import cPickle as pickle
 import os
 import sys
 import numpy
@@ -12,17 +11,32 @@ import pyglet.gl
 import components
 import ctypes
 from .atlas import Atlas
+from . import framemeta
+from .lrucache import LRUCache
+from .bakedatlas import BAKED_NAME, BakedAtlases, flip_point, flip_xyuv, is_fresh, quad_xyuv
 from itertools import repeat, izip
 from pyglet import gl
 
 
 __all__ = [
     'Sprite',
+    'SpriteTable',
+    'sprite_table',
     'load_texture',
     'load_sprite',
     'load_frame',
     'load_frame_sequence',
+    'load_baked_frames',
+    'decode_image',
+    'read_points',
+    'add_sprite',
+    'add_frame',
     'flip_frame',
+    'acquire_frame',
+    'release_frame',
+    'free_sprite',
+    'evict_frames',
+    'cache_stats',
     'texture_from_image',
     ]
 
@@ -30,22 +44,133 @@ __all__ = [
 # the list of active atlases
 atlases = list()
 
+# all atlases with a texture, baked ones included
+resident_atlases = set()
+
+# bytes of texture memory atlases should fit in, frames nobody holds
+# are evicted to keep to it (see evict_frames)
+texture_budget = 64 * 1024 * 1024
+
 # cache of sprites
-sprite_cache = dict()
+sprite_cache = LRUCache()
+
+# cache of frames, referenced by who loaded them until they release them
+frame_cache = LRUCache()
+
+
+class SpriteTable(object):
+    '''
+    The corners and texture ids of all sprites, so that those of many sprites
+    can be gathered at once by sprite id:
+    table.xyuv - (number of sprites, 4, 4) array, see Sprite.xyuv
+    table.texids - (number of sprites,) array of texture ids
+    '''
+
+    def __init__(self, capacity=64):
+        self.count = 0
+        self._xyuv = numpy.zeros((capacity, 4, 4), dtype=numpy.float32)
+        self._texids = numpy.zeros(capacity, dtype=numpy.uint32)
+        self.sprites = []
+        # ids of removed sprites, to be reused
+        self.free_ids = []
+
+
+    @property
+    def xyuv(self):
+        return self._xyuv[:self.count]
+
+
+    @property
+    def texids(self):
+        return self._texids[:self.count]
+
+
+    def add(self, sprite, xyuv, texid):
+        '''Adds a sprite, returns its id, which may be that of a removed sprite.'''
+        if self.free_ids:
+            sprite_id = self.free_ids.pop()
+            self.sprites[sprite_id] = sprite
+        else:
+            if self.count == len(self._texids):
+                capacity = 2 * self.count
+                self._xyuv = numpy.resize(self._xyuv, (capacity, 4, 4))
+                self._texids = numpy.resize(self._texids, capacity)
+            sprite_id = self.count
+            self.sprites.append(sprite)
+            self.count += 1
+        self._xyuv[sprite_id] = xyuv
+        self._texids[sprite_id] = getattr(texid, 'value', texid)
+        return sprite_id
+
+
+    def remove(self, sprite_id):
+        '''Removes a sprite. Its id shows nothing until another sprite gets it.'''
+        self._xyuv[sprite_id] = 0
+        self._texids[sprite_id] = 0
+        self.sprites[sprite_id] = None
+        self.free_ids.append(sprite_id)
 
-# cache of frames
-frame_cache = dict()
+
+    def __len__(self):
+        return self.count - len(self.free_ids)
+
+
+    def quads(self, sprite_ids, offsets):
+        '''
+        Returns the corners of the given sprites moved by offsets and rounded
+        to whole pixels, as an (N, 4, 4) array, and their texture ids.
+        sprite_ids - (N,) array of sprite ids
+        offsets - (N, 2) array, where each sprite's (0, 0) goes
+        '''
+        # the corners are whole pixels, so rounding the offsets is rounding the corners
+        # and adding (x, y, 0, 0) to whole rows is much faster than adding to the x, y columns
+        moved = numpy.zeros((len(sprite_ids), 1, 4), dtype=numpy.float32)
+        moved[:, 0, 0:2] = numpy.round(offsets)
+        xyuv = numpy.take(self._xyuv, sprite_ids, axis=0)
+        xyuv += moved
+        return xyuv, numpy.take(self._texids, sprite_ids)
+
+
+    def __getitem__(self, sprite_id):
+        '''Returns the sprite with the given id.'''
+        return self.sprites[sprite_id]
+
+
+# all sprites ever made
+sprite_table = SpriteTable()
 
 
 class SpriteAtlas(Atlas):
     '''
     A class extending the Atlas class with a texture id.
+    The texture is deleted when the last sprite in the atlas is freed.
     '''
 
-    def __init__(self, w, h):
-        '''See documentation for Atlas class'''
+    def __init__(self, w, h, pixels=None):
+        '''See documentation for Atlas class.
+        pixels - (h, w, 4) RGBA array to fill the texture with, the atlas is blank if None'''
         super(SpriteAtlas, self).__init__(w, h)
-        self.texid = empty_texture((w, h))
+        if pixels is None:
+            self.texid = empty_texture((w, h))
+        else:
+            self.texid = texture_from_data(gl.GL_RGBA8, (w, h), gl.GL_RGBA, gl.GL_UNSIGNED_BYTE,
+                                           pixels.ctypes.data)
+        # number of sprites in the atlas
+        self.sprites = 0
+        resident_atlases.add(self)
+
+
+    @property
+    def nbytes(self):
+        return self.w * self.h * 4
+
+
+    def delete(self):
+        '''Deletes the texture, the atlas can't be used after that.'''
+        delete_texture(self.texid)
+        resident_atlases.discard(self)
+        if self in atlases:
+            atlases.remove(self)
 
 
 class Sprite(object):
@@ -58,21 +183,38 @@ class Sprite(object):
         x, y - image corner
         u, v - tex coords for that corner.
     sprite.texid - texture id of this sprite's texture
+    sprite.id - index of this sprite in sprite_table
 
     sprite.atlas - image atlas for this sprite
+    sprite.refs - number of frames showing this sprite or sprites sharing its image,
+        it's freed (see free_sprite) when the last of them is
     '''
 
-    def __init__(self, atlas, xyuv):
+    def __init__(self, atlas, xyuv, region=None, base=None):
         '''Create a new sprite describing a portion inside an image atlas.
         atlas - the atlas to use.
         xyuv - a float numpy array of shape (4, 4) containing 4 points,
         each being 4 packed floats x, y, u, v where x, y are the coordinates of the sprite rectangle and should
         be [(0, 0), (0, w), (h, w), (h, 0)] (w, h - width, height of the sprite image in pixels)
-        and u, v are the texture coordinates for that corner'''
+        and u, v are the texture coordinates for that corner
+        region - (x, y, w, h) of the sprite's image in the atlas, to free with the sprite
+        base - a sprite whose image this one shows too, kept while this one is'''
 
-        self.xyuv = xyuv
         self.texid = atlas.texid
         self.atlas = atlas
+        self.region = region
+        self.base = base
+        self.name = None
+        self.refs = 0
+        self.id = sprite_table.add(self, xyuv, atlas.texid)
+        atlas.sprites += 1
+        if base is not None:
+            base.refs += 1
+
+
+    @property
+    def xyuv(self):
+        return sprite_table.xyuv[self.id]
 
 
 def load_texture(filename, dimensions=2):
@@ -91,40 +233,59 @@ def load_sprite(dir, name):
     try:
         return sprite_cache[name]
     except KeyError:
-        sprite_img = pygame.image.load(os.path.join(dir, name) + '.png')
-        n_w, n_h = sprite_img.get_size()
+        size, pixels = decode_image(os.path.join(dir, name) + '.png')
+        return add_sprite(name, size, pixels)
 
-        for a in atlases:
-            coords = a.add(n_w, n_h)
-            if coords:
-                break
-        else:
-            a = SpriteAtlas(max(512, n_w), max(512, n_h))
-            coords = a.add(n_w, n_h)
-            atlases.append(a)
 
-        if coords is None:
-            raise Exception(format('Could NOT fit ({0}, {1}) image in any atlas!?', n_w, n_h))
-        else:
-            pass
-            #print('fit a', (n_w, n_h), 'image into', a, 'at', coords)
-        texture_sub_image(a.texid, coords, sprite_img)
-
-        n_cx, n_cy = coords
-        f_uv = numpy.array((n_cx, n_cy, n_cx + n_w, n_cy + n_h), dtype=numpy.float32)
-        f_uv[0::2] /= a.w
-        f_uv[1::2] /= a.h
-        f_xy = numpy.array((0, 0, n_w, n_h), dtype=numpy.float32)
-        # indices of the coordinates of the corners of the quad in the
-        # above arrays
-        indices = ((0, 1), (0, 3), (2, 3), (2, 1))
-        f_data = numpy.empty((4, 4), dtype=numpy.float32)
-        f_data[:, 0:2] = numpy.take(f_xy, indices)
-        f_data[:, 2:4] = numpy.take(f_uv, indices)
-        sprite = Sprite(a, f_data)
-        sprite_cache[name] = sprite
-
-        return sprite
+def decode_image(filename):
+    '''Returns the size of an image file and its pixels as RGBA bytes, rows from the top.
+    Doesn't touch OpenGL, so it can be called from any thread.'''
+    image = pygame.image.load(filename)
+    return image.get_size(), pygame.image.tostring(image, 'RGBA')
+
+
+def read_points(dir, name):
+    '''Returns the sprite point and hitboxes of a frame, see util.framemeta.points.'''
+    return framemeta.points(framemeta.frames(dir)[name])
+
+
+def add_sprite(name, size, pixels):
+    '''
+    Puts an image in an atlas and returns a Sprite of it, which load_sprite will return for name.
+    size - (w, h) of the image
+    pixels - its RGBA bytes, rows from the top
+    '''
+    n_w, n_h = size
+    a, coords = _place(n_w, n_h)
+    atlas_w, atlas_h = max(512, n_w), max(512, n_h)
+    # rather than making another atlas over the budget, evict frames
+    # until the image fits in the space they leave or the new atlas fits
+    evictable = frame_cache.evictable()
+    while coords is None and evictable and resident_bytes() + 4 * atlas_w * atlas_h > texture_budget:
+        _evict_frame(evictable.pop(0))
+        a, coords = _place(n_w, n_h)
+    if coords is None:
+        a = SpriteAtlas(atlas_w, atlas_h)
+        coords = a.add(n_w, n_h)
+        atlases.append(a)
+
+    if coords is None:
+        raise Exception(format('Could NOT fit ({0}, {1}) image in any atlas!?', n_w, n_h))
+    texture_sub_data(a.texid, coords, size, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, pixels)
+
+    sprite = Sprite(a, quad_xyuv(coords, size, (a.w, a.h)), region=tuple(coords) + (n_w, n_h))
+    sprite.name = name
+    sprite_cache[name] = sprite
+    return sprite
+
+
+def _place(w, h):
+    '''Returns an atlas with room for a w by h image and its coordinates in it, or (None, None).'''
+    for a in atlases:
+        coords = a.add(w, h)
+        if coords is not None:
+            return a, coords
+    return None, None
 
 
 def load_frame(dir, name):
@@ -134,18 +295,101 @@ def load_frame(dir, name):
     'sp': sprite point
     'hbp': passive hitbox
     'hba': active hitbox
+    The frame is kept loaded until it's released with release_frame, as many times
+    as it's been loaded.
     '''
     try:
-        return frame_cache[name]
+        frame = frame_cache[name]
     except KeyError:
-        sprite = load_sprite(dir, name)
-        datafile = file(os.path.join(dir, name) + '.points')
-        data = pickle.load(datafile)
-        datafile.close()
-        data['sprite'] = sprite
-        data['name'] = name
-        frame_cache[name] = data
-        return data
+        frame = add_frame(name, load_sprite(dir, name), read_points(dir, name))
+    frame_cache.acquire(name)
+    return frame
+
+
+def add_frame(name, sprite, points):
+    '''Makes the frame which load_frame will return for name from its sprite and
+    its points, see read_points. Nothing holds it yet, so it can be evicted.'''
+    frame = dict(points)
+    frame['sprite'] = sprite
+    frame['name'] = name
+    sprite.refs += 1
+    frame_cache[name] = frame
+    return frame
+
+
+def acquire_frame(frame):
+    '''Holds a frame once more, as if loaded again. Returns it.'''
+    frame_cache.acquire(frame['name'])
+    return frame
+
+
+def release_frame(frame):
+    '''Lets go of a frame returned by load_frame or flip_frame. Once nothing holds it
+    it may be evicted, so nothing should show it any more.'''
+    frame_cache.release(frame['name'])
+
+
+def free_sprite(sprite):
+    '''Frees a sprite nothing shows: its id, its place in its atlas, and the atlas,
+    if it was the last sprite in it.'''
+    sprite_table.remove(sprite.id)
+    if sprite.name is not None and sprite_cache.get(sprite.name) is sprite:
+        sprite_cache.pop(sprite.name)
+    atlas = sprite.atlas
+    if sprite.region is not None:
+        atlas.free(*sprite.region)
+    atlas.sprites -= 1
+    if atlas.sprites == 0:
+        atlas.delete()
+    if sprite.base is not None:
+        _release_sprite(sprite.base)
+
+
+def _release_sprite(sprite):
+    sprite.refs -= 1
+    if sprite.refs == 0:
+        free_sprite(sprite)
+
+
+def _evict_frame(name):
+    _release_sprite(frame_cache.evict(name)['sprite'])
+
+
+def evict_frames(nbytes=0):
+    '''
+    Evicts the least recently used frames nothing holds until the atlases, and nbytes
+    more, fit in texture_budget, or there are none left. Returns how many were evicted.
+    '''
+    evicted = 0
+    for name in frame_cache.evictable():
+        if resident_bytes() + nbytes <= texture_budget:
+            break
+        _evict_frame(name)
+        evicted += 1
+    return evicted
+
+
+def resident_bytes():
+    '''Returns the texture memory taken by atlases.'''
+    return sum(a.nbytes for a in resident_atlases)
+
+
+def cache_stats():
+    '''
+    Returns a dict of
+    'resident_bytes' - texture memory taken by atlases
+    'atlases', 'sprites', 'frames' - how many there are
+    'hits', 'misses', 'hit_rate' - of looking up frames
+    'evicted' - how many frames have been evicted
+    '''
+    return {'resident_bytes': resident_bytes(),
+            'atlases': len(resident_atlases),
+            'sprites': len(sprite_table),
+            'frames': len(frame_cache),
+            'hits': frame_cache.hits,
+            'misses': frame_cache.misses,
+            'hit_rate': frame_cache.hit_rate,
+            'evicted': frame_cache.evicted}
 
 
 def load_frame_sequence(dir, basename, number, start=1):
@@ -157,23 +401,46 @@ def load_frame_sequence(dir, basename, number, start=1):
 
 
 def flip_frame(frame):
+    '''Returns the frame mirrored left to right, held like load_frame's.'''
     flipped_name = frame['name'] + '/flipped'
     try:
-        return frame_cache[flipped_name]
+        newframe = frame_cache[flipped_name]
     except KeyError:
         hbp, hba = frame['hbp'], frame['hba']
-        hbp = components.hitbox(hbp.point * (-1, 1) + hbp.size * (-1, 0), hbp.size)
-        hba = components.hitbox(hba.point * (-1, 1) + hba.size * (-1, 0), hba.size)
+        hbp = components.hitbox(flip_point(hbp.point, hbp.size), hbp.size)
+        hba = components.hitbox(flip_point(hba.point, hba.size), hba.size)
         sprite = frame['sprite']
-        f_data = numpy.copy(sprite.xyuv)
-        f_data[:, 2:4] = sprite.xyuv[::-1, 2:4]
-        newframe={'sprite': Sprite(sprite.atlas, f_data),
-                  'sp': frame['sp'] * (-1, 1) + (-sprite.xyuv[2, 0], 0),
-                  'hbp': hbp,
-                  'hba': hba,
-                  'name': flipped_name}
-        frame_cache[flipped_name] = newframe
-        return newframe
+        newframe = add_frame(flipped_name, Sprite(sprite.atlas, flip_xyuv(sprite.xyuv), base=sprite),
+                             {'sp': flip_point(frame['sp'], (sprite.xyuv[2, 0], 0)),
+                              'hbp': hbp,
+                              'hba': hba})
+    frame_cache.acquire(flipped_name)
+    return newframe
+
+
+def load_baked_frames(dir):
+    '''
+    Loads all frames in dir from the file made by bake_atlases.py, so that
+    load_frame, load_sprite and flip_frame find them already loaded.
+    Returns False, loading nothing, if there's no such file or it's older than the frames.
+    '''
+    path = os.path.join(dir, BAKED_NAME)
+    if not is_fresh(path, dir):
+        return False
+    with BakedAtlases(path) as baked:
+        # not in atlases - they're full, nothing else is put in them
+        baked_atlases = [SpriteAtlas(int(record['w']), int(record['h']), baked.pixels(n))
+                         for n, record in enumerate(baked.atlases)]
+        for record in baked.frames:
+            name = record['name']
+            sprite = Sprite(baked_atlases[record['atlas']], numpy.array(record['xyuv']))
+            add_frame(name, sprite, {'sp': numpy.array(record['sp']),
+                                     'hbp': components.hitbox(*record['hbp']),
+                                     'hba': components.hitbox(*record['hba'])})
+            if not name.endswith('/flipped'):
+                sprite.name = name
+                sprite_cache[name] = sprite
+    return True
 
 
 def empty_texture(size, internalformat=gl.GL_RGBA8):
@@ -266,6 +533,11 @@ def texture_from_data(internalformat, size, data_format, data_type, data):
     return texid
 
 
+def delete_texture(texid):
+    '''Deletes a texture made by texture_from_data.'''
+    gl.glDeleteTextures(1, ctypes.byref(texid))
+
+
 def texture_sub_data(texid, place, size, data_format, data_type, data):
     '''Upload data to part of a texture
     texid - texture id
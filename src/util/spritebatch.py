@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import ctypes
+import numpy
+import pyglet.gl
+from .glbuffer import GLBuffer
+
+
+__all__ = ['SpriteBatch']
+
+
+# the two triangles of a quad with corners in the order of Sprite.xyuv
+_QUAD = numpy.array([0, 1, 2, 0, 2, 3], dtype=numpy.uint32)
+
+
+class SpriteBatch(object):
+    '''
+    Draws many sprites at once: their corners are uploaded in one buffer
+    and the sprites of each texture (i.e. atlas) are drawn with one
+    indexed GL_TRIANGLES call.
+
+    The sprites are drawn grouped by texture, in the order given within a texture,
+    so sprites from different atlases which overlap may swap places.
+    '''
+
+    def __init__(self, gl=pyglet.gl, attribute=0):
+        '''
+        gl - the OpenGL module to call, e.g. a stub for tests
+        attribute - the vertex attribute the corners (x, y, u, v) go to
+        '''
+        self.gl = gl
+        self.attribute = attribute
+        self.vertices = GLBuffer(dtype=numpy.float32, usage=gl.GL_STREAM_DRAW, gl=gl)
+        ids = (ctypes.c_uint * 1)()
+        gl.glGenBuffers(1, ids)
+        self.indexbuf = ids[0]
+        # how many quads there are indices for
+        self.capacity = 0
+        # draw calls made by the last draw
+        self.draw_calls = 0
+
+
+    def _reserve(self, nquads):
+        '''Makes the index buffer big enough for nquads quads.'''
+        if nquads <= self.capacity:
+            return
+        gl = self.gl
+        capacity = max(nquads, self.capacity * 2, 64)
+        indices = (numpy.arange(capacity, dtype=numpy.uint32)[:, None] * 4 + _QUAD).reshape(-1)
+        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, self.indexbuf)
+        gl.glBufferData(gl.GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices.ctypes.data, gl.GL_STATIC_DRAW)
+        self.capacity = capacity
+
+
+    def draw(self, xyuv, texids):
+        '''
+        Draws the sprites with the program in use.
+        xyuv - (N, 4, 4) array, the corners of each sprite as in Sprite.xyuv, where they go on screen
+        texids - (N,) array, the texture of each sprite
+        '''
+        gl = self.gl
+        texids = numpy.asarray(texids)
+        n = len(texids)
+        self.draw_calls = 0
+        if n == 0:
+            return
+        order = numpy.argsort(texids, kind='mergesort')
+        texids = texids[order]
+        vertices = numpy.ascontiguousarray(numpy.asarray(xyuv)[order], dtype=numpy.float32)
+        starts = numpy.flatnonzero(numpy.concatenate(([True], texids[1:] != texids[:-1])))
+        ends = numpy.append(starts[1:], n)
+
+        self._reserve(n)
+        # a new store each frame, so the driver needn't wait for the last frame's draws
+        self.vertices.stream(vertices)
+        with self.vertices.bound:
+            gl.glVertexAttribPointer(self.attribute, 4, gl.GL_FLOAT, gl.GL_FALSE, 0, 0)
+        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, self.indexbuf)
+        index_size = _QUAD.size * _QUAD.itemsize
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            gl.glBindTexture(gl.GL_TEXTURE_2D, int(texids[start]))
+            gl.glDrawElements(gl.GL_TRIANGLES, (end - start) * _QUAD.size, gl.GL_UNSIGNED_INT,
+                              start * index_size)
+        self.draw_calls = len(starts)
+        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, 0)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+import ctypes
+import ctypes.util
+import os
+import sys
+import time
+
+
+__all__ = ['monotonic',
+           'FixedStep']
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long),
+                ('tv_nsec', ctypes.c_long)]
+
+
+def _find_monotonic():
+    '''
+    Returns a function giving the time in seconds from a clock which never goes back.
+    time.clock is CPU time on Linux, and time.time jumps when the system clock is set,
+    so use clock_gettime(CLOCK_MONOTONIC) where there is one.
+    '''
+    if sys.platform == 'win32':
+        # time.clock is the high resolution wall clock on Windows
+        return time.clock
+    CLOCK_MONOTONIC = 1
+    for name in ('rt', 'c'):
+        try:
+            clock_gettime = ctypes.CDLL(ctypes.util.find_library(name), use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+        t = _timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+            continue
+
+        def monotonic():
+            if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno))
+            return t.tv_sec + t.tv_nsec * 1e-9
+        return monotonic
+    return time.time
+
+
+monotonic = _find_monotonic()
+
+
+class FixedStep(object):
+    '''
+    Keeps the simulation running at a fixed step whatever the frame rate is.
+    Call advance() once per frame - it says how many steps to run to catch up
+    with the wall clock. alpha then says how far between the last two steps
+    the frame is, for interpolating what's drawn.
+
+    If the simulation can't keep up, at most max_steps are run per frame
+    and the time left over is dropped, so that slow frames don't cause
+    more and more steps to be needed (the spiral of death).
+    '''
+
+    def __init__(self, step, max_steps=5, clock=monotonic):
+        '''
+        step - simulated time per step in seconds
+        max_steps - most steps to run in one frame
+        clock - function returning the current time in seconds
+        '''
+        self.step = step
+        self.max_steps = max_steps
+        self.clock = clock
+        self.accumulator = 0.0
+        self.last_time = clock()
+        # steps run on the last frame
+        self.steps = 0
+        # time dropped in total because of max_steps
+        self.dropped = 0.0
+
+
+    def advance(self):
+        '''Returns how many steps to run on this frame.'''
+        now = self.clock()
+        self.accumulator += now - self.last_time
+        self.last_time = now
+        steps = int(self.accumulator // self.step)
+        if steps > self.max_steps:
+            self.dropped += self.accumulator - self.max_steps * self.step
+            self.accumulator = self.max_steps * self.step
+            steps = self.max_steps
+        self.accumulator -= steps * self.step
+        self.steps = steps
+        return steps
+
+
+    def reset(self):
+        '''Forgets the time passed since the last advance, e.g. after a pause.'''
+        self.accumulator = 0.0
+        self.last_time = self.clock()
+
+
+    @property
+    def alpha(self):
+        '''How far between the last two steps is now, from 0 to 1.'''
+        return self.accumulator / self.step
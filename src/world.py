@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, generators, print_function, with_statement
+
+'''
+The game simulation without a display.
+A World has the entities, the walls and the event dispatchers
+and step() advances it by one tick, so it can be run
+without a window for bots, tests and benchmarks.
+Drawing is done by a separate consumer, see render.Renderer.
+'''
+
+import numpy
+import pygame.event
+import broadphase
+import collisions
+import components
+import constants
+import events
+import physics
+
+
+__all__ = ['World']
+
+
+# where each entity was before the last step, for drawing in between steps
+components.entity.add_column('last_location', components.column((2,), float))
+# which of the packed worlds an entity is in, see World.packed
+components.entity.add_column('world_id', components.column((), numpy.int32, 0))
+# the order entities were added to the world in, -1 for ones which weren't
+components.entity.add_column('added', components.column((), numpy.int64, -1))
+
+
+class World(object):
+    # where dead players come back
+    RESPAWN_LOCATION = (500, -10)
+    # things falling below that are dead
+    DEATH_DEPTH = 10000
+
+    # the world whose entity store is in use, see activate
+    _active = None
+
+    def __init__(self, walls, position_dtype=float, wall_groups=None):
+        '''
+        walls - list of hitboxes, e.g. from level.load
+        position_dtype - type of the entity positions, see components.entity.create_store
+        wall_groups - for packed worlds, the world_id of each wall, see packed
+
+        Makes a new entity store and activates it.
+        '''
+        self.clock = events.dispatcher('Clock')
+        self.keyboard = events.dispatcher('Keyboard')
+        self.tick_event = pygame.event.Event(constants.TICK)
+        self._deactivate_current()
+        components.entity.create_store(position_dtype)
+        self.sweep = broadphase.SweepAndPrune()
+        components.entity._index_observers = [self.sweep]
+        World._active = self
+
+        self.walls = walls
+        self.walls_tl = numpy.array([w.point for w in walls], dtype=float).reshape(-1, 2)
+        self.walls_br = self.walls_tl + numpy.array([w.size for w in walls], dtype=float).reshape(-1, 2)
+        if wall_groups is None:
+            self.wall_groups = None
+            self.walltree = broadphase.AABBTree(self.walls_tl, self.walls_br)
+        else:
+            self.wall_groups = numpy.array(wall_groups, dtype=numpy.int32)
+            self.walltree = broadphase.AABBTree(*broadphase.separate_groups(
+                self.walls_tl, self.walls_br, self.wall_groups))
+
+        # the entities, in the order they were added
+        self.entities = []
+        # the ones of them with a controller
+        self.controlled = []
+        # how many entities have been added
+        self.added = 0
+        self.ticks = 0
+        # collisions.ResolveStats of the last tick
+        self.stats = None
+
+        # the sleeping entities don't move, so their tree is rebuilt only when they change
+        self._sleepers_epoch = None
+        self._sleepers = None
+        self._sleepers_tree = None
+
+
+    @classmethod
+    def packed(cls, levels, position_dtype=float):
+        '''
+        Makes a world holding several independent worlds in the same arrays,
+        so they are all stepped together by the same numpy calls.
+        levels - a list of walls (as for World) for each world
+        Add entities with add(thing, world_id) - things only collide with
+        things and walls of the same world_id.
+        Each world must fit in broadphase.GROUP_STRIDE along x.
+        '''
+        walls = []
+        wall_groups = []
+        for world_id, level_walls in enumerate(levels):
+            walls.extend(level_walls)
+            wall_groups.extend([world_id] * len(level_walls))
+        return cls(walls, position_dtype, wall_groups)
+
+
+    @staticmethod
+    def _deactivate_current():
+        active = World._active
+        if active is not None:
+            active._state = components.entity.current_store()
+            components.entity.use_store((None, 0, 0, []))
+            World._active = None
+
+
+    def activate(self):
+        '''
+        Makes this world's entity store the one components.entity uses.
+        Each world has its own store, but there is only one in use at a time,
+        so with several worlds in one process, activate one before making
+        entities for it. The world's own methods activate it.
+        '''
+        if World._active is self:
+            return
+        self._deactivate_current()
+        components.entity.use_store(self._state)
+        World._active = self
+
+
+    def close(self):
+        '''Disposes of all entities and stops tracking the entity store.'''
+        self.activate()
+        for thing in self.entities:
+            thing.dispose()
+        self.entities = []
+        self.controlled = []
+        components.entity._index_observers.remove(self.sweep)
+
+
+    def add(self, thing, world_id=0):
+        '''Adds an entity made with this world's clock and keyboard. Returns it.
+        The entity must have been made while this world was active.
+        world_id - which of the packed worlds it goes to, see packed'''
+        thing.last_location = thing.location
+        thing.world_id = world_id
+        thing.added = self.added
+        self.added += 1
+        self.entities.append(thing)
+        if thing.controller is not None:
+            self.controlled.append(thing)
+        return thing
+
+
+    def step(self, inputs=()):
+        '''
+        Advances the world by one tick.
+        inputs - keyboard events for this tick, dispatched before it
+        Returns a list of the entities which died on this tick (see on_death).
+        '''
+        self.activate()
+        for event in inputs:
+            self.keyboard.dispatch(event)
+
+        entity = components.entity
+        entity.last_location[:] = entity.location
+        entity.motion_a[:] = (0, constants.G)
+        self.clock.dispatch(self.tick_event)
+        # wake first, so that things woken on this tick get the batched modifiers too
+        self._wake_touched()
+        physics.apply_batched(entity._nawake)
+
+        # Only the awake things move
+        nawake = entity._nawake
+        location = entity.location[:nawake]
+        start_location = numpy.array(location)
+        motion_v = entity.motion_v[:nawake]
+        motion_v[:] += entity.motion_a[:nawake]
+
+        groups = None if self.wall_groups is None else entity.world_id
+        collisions.resolve_passive_active_collisions(entity.hitpoints, entity.active_tl, entity.active_br,
+                                                     entity.passive_tl, entity.passive_br, groups)
+        islands = numpy.zeros((nawake,), dtype=numpy.intp)
+        grounded, self.stats = collisions.resolve_movement(
+            motion_v, entity.passive_tl[:nawake], entity.passive_br[:nawake],
+            self.walls_tl, self.walls_br, entity.translate_all, self.walltree, self.sweep,
+            None if groups is None else groups[:nawake], self.wall_groups, islands)
+        entity.set_tag(constants.GROUNDED, slice(0, nawake), grounded)
+
+        moved = numpy.abs(location - start_location) > constants.SLEEP_DISTANCE
+        moved = moved[:, 0] | moved[:, 1]
+        entity.settle(moved, islands=islands)
+
+        dead = numpy.logical_or(entity.hitpoints <= 0, entity.location[:, 1] > self.DEATH_DEPTH)
+        dead = list(entity.instances()[dead])
+        for thing in dead:
+            self.on_death(thing)
+
+        self.ticks += 1
+        return dead
+
+
+    def interpolated_location(self, alpha):
+        '''Returns the locations of all entities, alpha of the way
+        from where they were before the last step to where they are now.'''
+        self.activate()
+        last = components.entity.last_location
+        return last + (components.entity.location - last) * alpha
+
+
+    def on_death(self, thing):
+        '''Players respawn, everything else goes away.'''
+        if thing.name == 'Player':
+            thing.wake()
+            thing.hitpoints = 100
+            thing.location[:] = self.RESPAWN_LOCATION
+            thing.motion_v[:] = 0
+            thing.last_location = thing.location
+            if thing.physics is not None:
+                thing.physics.last_position[:] = thing.location
+        else:
+            self.entities.remove(thing)
+            if thing.controller is not None:
+                self.controlled.remove(thing)
+            thing.dispose()
+
+
+    def _wake_touched(self):
+        '''Wakes sleeping things which were pushed during the tick
+        or which the awake ones are about to run into.'''
+        entity = components.entity
+        instances = entity.instances()
+        nawake = entity._nawake
+        sleeper_v = entity.motion_v[nawake:]
+        sleeper_a = entity.motion_a[nawake:]
+        pushed = (sleeper_v[:, 0] != 0) | (sleeper_v[:, 1] != 0)
+        pushed |= (sleeper_a[:, 0] != 0) | (sleeper_a[:, 1] != constants.G)
+        entity.wake_all(pushed.nonzero()[0] + nawake)
+
+        if self._sleepers_epoch != entity._sleep_epoch:
+            sleeping = slice(entity._nawake, None)
+            self._sleepers = instances[sleeping].copy()
+            self._sleepers_tree = broadphase.AABBTree(*self._separate(sleeping))
+            self._sleepers_epoch = entity._sleep_epoch
+        # Waking things lets them touch more sleepers, e.g. down a stack
+        touching = slice(0, entity._nawake)
+        asleep = numpy.ones((len(self._sleepers),), dtype=bool)
+        while touching.start < touching.stop and len(self._sleepers):
+            # where they'll be after this tick's acceleration
+            motion_v = entity.motion_v[touching] + entity.motion_a[touching]
+            swept_tl, swept_br = self._separate(touching)
+            swept_tl += numpy.minimum(motion_v, 0)
+            swept_br += numpy.maximum(motion_v, 0)
+            touched = self._sleepers_tree.query(swept_tl, swept_br)[:, 1]
+            # those woken already are only touched again, e.g. by the ones above them
+            touched = touched[asleep.take(touched)]
+            if len(touched) == 0:
+                break
+            asleep[touched] = False
+            start = entity._nawake
+            entity.wake_all([thing.arrayid for thing in self._sleepers[touched]], keep_idle=True)
+            touching = slice(start, entity._nawake)
+
+
+    def _separate(self, which):
+        '''Returns copies of the passive boxes of some entities,
+        moved apart by world if the worlds are packed.'''
+        entity = components.entity
+        tl = entity.passive_tl[which]
+        br = entity.passive_br[which]
+        if self.wall_groups is None:
+            return numpy.array(tl, dtype=float), numpy.array(br, dtype=float)
+        return broadphase.separate_groups(tl, br, entity.world_id[which])